@@ -0,0 +1,173 @@
+"""Compares the cost of aggregating one tick of process stats in the aggregator, which stores its
+summaries in flat lists, with the original dict-based implementation extended with the same
+variance and time-weighted summaries, and checks that their results are identical.
+
+Example:
+    $ python scripts/benchmarks/aggregator.py --counts 100 1000 10000
+"""
+
+import argparse
+import math
+import random
+import time
+from collections import defaultdict
+from typing import Any
+
+from loguru import logger
+
+from rmon.models import ComputeNodeResourceStatConfig, ResourceType
+from rmon.resource_stat_aggregator import ResourceStatAggregator
+
+
+_PROCESS_STATS = ("cpu_percent", "rss", "cpu_seconds", "read MB/s", "write MB/s")
+_INTERVAL = 1.0
+
+
+class _DictKeyedStatSummaries:
+    """Original implementation of the per-key summaries"""
+
+    def __init__(self) -> None:
+        self._summaries: dict[str, dict[str, dict[str, Any]]] = {
+            "average": defaultdict(dict),
+            "maximum": defaultdict(dict),
+            "minimum": defaultdict(dict),
+            "sum": defaultdict(dict),
+            "count": defaultdict(dict),
+            "mean": defaultdict(dict),
+            "m2": defaultdict(dict),
+            "weighted_sum": defaultdict(dict),
+            "total_weight": defaultdict(dict),
+        }
+        self._last_time: dict[str, float] = {}
+        self._sample_count: dict[str, int] = {}
+
+    def update(self, cur_stats: dict[str, dict[str, float]], timestamp: float) -> None:
+        for key, stat_dict in cur_stats.items():
+            if key in self._summaries["maximum"]:
+                weight = timestamp - self._last_time[key]
+                _compute_stats(stat_dict, self._summaries, key, weight)
+                self._sample_count[key] += 1
+            else:
+                for stat_name, val in stat_dict.items():
+                    self._summaries["maximum"][key][stat_name] = val
+                    self._summaries["minimum"][key][stat_name] = val
+                    self._summaries["sum"][key][stat_name] = val
+                    self._summaries["count"][key][stat_name] = 1
+                    self._summaries["mean"][key][stat_name] = val
+                    self._summaries["m2"][key][stat_name] = 0.0
+                    self._summaries["weighted_sum"][key][stat_name] = val * _INTERVAL
+                    self._summaries["total_weight"][key][stat_name] = _INTERVAL
+                self._sample_count[key] = 1
+            self._last_time[key] = timestamp
+
+    def finalize(self) -> dict[str, tuple[int, dict, dict, dict, dict, dict, dict]]:
+        results = {}
+        for key, samples in self._sample_count.items():
+            summaries = {k: v[key] for k, v in self._summaries.items()}
+            variance = {k: v / summaries["count"][k] for k, v in summaries["m2"].items()}
+            results[key] = (
+                samples,
+                {k: v / samples for k, v in summaries["sum"].items()},
+                summaries["minimum"],
+                summaries["maximum"],
+                variance,
+                {k: math.sqrt(v) for k, v in variance.items()},
+                {
+                    k: v / summaries["total_weight"][k]
+                    for k, v in summaries["weighted_sum"].items()
+                },
+            )
+        return results
+
+
+def _compute_stats(
+    cur_stats: dict[str, float], base_stats: dict, stat_key: str, weight: float
+) -> None:
+    for stat_name, val in cur_stats.items():
+        if val > base_stats["maximum"][stat_key][stat_name]:
+            base_stats["maximum"][stat_key][stat_name] = val
+        elif val < base_stats["minimum"][stat_key][stat_name]:
+            base_stats["minimum"][stat_key][stat_name] = val
+        base_stats["sum"][stat_key][stat_name] += val
+        count = base_stats["count"][stat_key][stat_name] + 1
+        base_stats["count"][stat_key][stat_name] = count
+        mean = base_stats["mean"][stat_key][stat_name]
+        new_mean = mean + (val - mean) / count
+        base_stats["mean"][stat_key][stat_name] = new_mean
+        base_stats["m2"][stat_key][stat_name] += (val - mean) * (val - new_mean)
+        base_stats["weighted_sum"][stat_key][stat_name] += val * weight
+        base_stats["total_weight"][stat_key][stat_name] += weight
+
+
+def _make_ticks(count: int, num_ticks: int) -> list[dict[str, dict[str, float]]]:
+    rng = random.Random(0)
+    return [
+        {
+            f"process {i}": {
+                "cpu_percent": rng.uniform(0, 100),
+                "rss": rng.randint(0, 10**10),
+                "cpu_seconds": float(tick + i),
+                "read MB/s": rng.random(),
+                "write MB/s": rng.random(),
+            }
+            for i in range(count)
+        }
+        for tick in range(num_ticks)
+    ]
+
+
+def _get_timestamp(tick: int) -> float:
+    # Every tenth tick is late.
+    return tick * _INTERVAL + (0.5 if tick % 10 == 9 else 0.0)
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--counts", nargs="+", type=int, default=[100, 1000, 10000])
+    parser.add_argument("--ticks", type=int, default=50)
+    args = parser.parse_args()
+    logger.remove()
+
+    config = ComputeNodeResourceStatConfig(
+        cpu=False, memory=False, process=True, interval=_INTERVAL
+    )
+    print("keys    values/tick  dict ms/tick  flat ms/tick  speedup")
+    for count in args.counts:
+        ticks = _make_ticks(count, args.ticks)
+        reference = _DictKeyedStatSummaries()
+        start = time.perf_counter()
+        for tick, stats in enumerate(ticks):
+            reference.update(stats, _get_timestamp(tick))
+        dict_duration = (time.perf_counter() - start) / args.ticks
+
+        agg = ResourceStatAggregator(config, {})
+        start = time.perf_counter()
+        for tick, stats in enumerate(ticks):
+            timestamps = {ResourceType.PROCESS: _get_timestamp(tick)}
+            agg.update_stats({ResourceType.PROCESS: stats}, timestamps=timestamps)
+        flat_duration = (time.perf_counter() - start) / args.ticks
+
+        expected = reference.finalize()
+        for result in agg.finalize_process_stats(list(expected)).results:
+            actual = (
+                result.num_samples,
+                result.average,
+                result.minimum,
+                result.maximum,
+                result.variance,
+                result.standard_deviation,
+                result.time_weighted_average,
+            )
+            if actual != expected[result.process_key]:
+                msg = f"Results differ for {result.process_key}"
+                raise RuntimeError(msg)
+
+        print(
+            f"{count:<7} {count * len(_PROCESS_STATS):>11}  {dict_duration * 1000:12.3f}  "
+            f"{flat_duration * 1000:12.3f}  {dict_duration / flat_duration:6.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
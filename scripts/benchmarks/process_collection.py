@@ -0,0 +1,69 @@
+"""Measures the cost of collecting process stats for one tick as the number of processes grows.
+
+Example:
+    $ python scripts/benchmarks/process_collection.py --counts 10 100 500
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from loguru import logger
+
+from rmon.models import ComputeNodeResourceStatConfig
+from rmon.resource_stat_collector import ResourceStatCollector
+
+
+def _measure(
+    collector: ResourceStatCollector,
+    config: ComputeNodeResourceStatConfig,
+    pids: dict[str, int],
+    num_ticks: int,
+) -> float:
+    """Return the average duration in seconds of one collection tick."""
+    # The first tick initializes the process cache.
+    collector.get_processes_stats(pids, config)
+    start = time.perf_counter()
+    for _ in range(num_ticks):
+        collector.get_processes_stats(pids, config)
+    return (time.perf_counter() - start) / num_ticks
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--counts", nargs="+", type=int, default=[10, 50, 100, 250])
+    parser.add_argument("--ticks", type=int, default=10)
+    args = parser.parse_args()
+    logger.remove()
+
+    print("backend  mode        processes  ms/tick")
+    for count in args.counts:
+        children = [subprocess.Popen(["sleep", "600"]) for _ in range(count)]
+        try:
+            for backend in ("psutil", "procfs"):
+                if backend == "procfs" and not sys.platform.startswith("linux"):
+                    continue
+                per_child = {f"sleep {x.pid}": x.pid for x in children}
+                cases = (
+                    ("per-pid", per_child, False),
+                    ("tree", {"parent": os.getpid()}, True),
+                )
+                for mode, pids, include_children in cases:
+                    config = ComputeNodeResourceStatConfig(
+                        process_backend=backend,
+                        include_child_processes=include_children,
+                        recurse_child_processes=include_children,
+                    )
+                    duration = _measure(ResourceStatCollector(), config, pids, args.ticks)
+                    print(f"{backend:<8} {mode:<11} {count:>9}  {duration * 1000:7.3f}")
+        finally:
+            for child in children:
+                child.kill()
+                child.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Compares the time to read the process table of a stats database with one query, as the plots
+do, with the original reader, which ran one query per column per process key.
+
+Example:
+    $ python scripts/benchmarks/reader.py --counts 10 100 --ticks 3600
+"""
+
+import argparse
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+from loguru import logger
+
+from rmon.models import ComputeNodeResourceStatConfig, ResourceType
+from rmon.resource_stat_collector import ResourceStatCollector
+from rmon.resource_stat_store import ResourceStatStore
+from rmon.utils.sql import read_columns_by_key
+
+
+_COLUMNS = ["timestamp", "cpu_percent", "rss"]
+
+
+def _read_original(db_file: Path) -> dict[str, dict[str, list[Any]]]:
+    """Original reader of the process tables"""
+    data: dict[str, dict[str, list[Any]]] = {}
+    with sqlite3.connect(db_file) as con:
+        cur = con.cursor()
+        for (key_id,) in cur.execute("SELECT DISTINCT key_id FROM process").fetchall():
+            data[key_id] = {}
+            for column in _COLUMNS:
+                query = f"SELECT {column} FROM process WHERE key_id='{key_id}'"
+                data[key_id][column] = [x[0] for x in cur.execute(query).fetchall()]
+    con.close()
+    return data
+
+
+def _make_database(db_file: Path, stats: dict[ResourceType, Any], count: int, num_ticks: int):
+    rng = random.Random(0)
+    config = ComputeNodeResourceStatConfig(cpu=False, memory=False, process=True)
+    store = ResourceStatStore(config, db_file, stats)
+    for tick in range(num_ticks):
+        process_stats = {
+            f"process {i}": {"cpu_percent": rng.uniform(0, 100), "rss": rng.randint(0, 10**9)}
+            for i in range(count)
+        }
+        store.record_stats(
+            {ResourceType.PROCESS: process_stats}, timestamps={ResourceType.PROCESS: tick}
+        )
+    store.close()
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--counts", nargs="+", type=int, default=[10, 100])
+    parser.add_argument("--ticks", type=int, default=3600)
+    args = parser.parse_args()
+    logger.remove()
+
+    collector = ResourceStatCollector()
+    stats = collector.get_stats(ComputeNodeResourceStatConfig.all_enabled(), pids={})
+    collector.shutdown()
+    print("processes  rows     original s  single-pass s  speedup")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for count in args.counts:
+            db_file = Path(tmp_dir) / f"stats_{count}.sqlite"
+            _make_database(db_file, stats, count, args.ticks)
+
+            start = time.perf_counter()
+            expected = _read_original(db_file)
+            original_duration = time.perf_counter() - start
+
+            start = time.perf_counter()
+            tables = read_columns_by_key(db_file, "process", columns=_COLUMNS)
+            duration = time.perf_counter() - start
+
+            for (key, table), expected_table in zip(tables.items(), expected.values()):
+                if {k: list(v) for k, v in table.items()} != expected_table:
+                    msg = f"Results differ for {key}"
+                    raise RuntimeError(msg)
+            print(
+                f"{count:<10} {count * args.ticks:<8} {original_duration:10.3f}  "
+                f"{duration:13.3f}  {original_duration / duration:6.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Compares the rows per second that ResourceStatStore writes through its persistent connection
+with the original write path, which opened a connection and committed for every flush of every
+resource type. Pass --directory to measure on a specific filesystem, such as a network home
+directory.
+
+Example:
+    $ python scripts/benchmarks/store.py --counts 10 100 1000 --directory ~/rmon-benchmark
+"""
+
+import argparse
+import random
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from loguru import logger
+
+from rmon.common import DEFAULT_BUFFERED_WRITE_COUNT
+from rmon.models import ComputeNodeResourceStatConfig, ResourceType
+from rmon.resource_stat_collector import ResourceStatCollector
+from rmon.resource_stat_store import ResourceStatStore
+from rmon.utils.sql import insert_rows, make_table, read_table
+
+
+_PROCESS_STATS = ResourceStatCollector.PROCESS_STATS
+
+
+class _OriginalStore:
+    """Original write path of the system and process tables"""
+
+    def __init__(self, db_file: Path, stats: dict[ResourceType, Any], buffered_write_count: int):
+        self._db_file = db_file
+        self._buffered_write_count = buffered_write_count
+        self._bufs: dict[ResourceType, list[tuple]] = {}
+        for resource_type in (ResourceType.CPU, ResourceType.MEMORY):
+            make_table(db_file, resource_type.value, {"timestamp": "", **stats[resource_type]})
+            self._bufs[resource_type] = []
+        row = {"timestamp": "", "id": "", **dict.fromkeys(_PROCESS_STATS, 0.0)}
+        make_table(db_file, "process", row, types={k: type(v) for k, v in row.items()})
+        self._bufs[ResourceType.PROCESS] = []
+
+    def record_stats(self, stats: dict[ResourceType, Any]) -> None:
+        timestamp = str(datetime.now())
+        for resource_type in (ResourceType.CPU, ResourceType.MEMORY):
+            self._add_stats(resource_type, (timestamp, *stats[resource_type].values()))
+        for name, _stats in stats[ResourceType.PROCESS].items():
+            values = (_stats.get(x) for x in _PROCESS_STATS)
+            self._add_stats(ResourceType.PROCESS, (timestamp, name, *values))
+
+    def flush(self) -> None:
+        for resource_type in self._bufs:
+            self._flush_resource_type(resource_type)
+
+    def _add_stats(self, resource_type: ResourceType, values: tuple) -> None:
+        self._bufs[resource_type].append(values)
+        if len(self._bufs[resource_type]) >= self._buffered_write_count:
+            self._flush_resource_type(resource_type)
+
+    def _flush_resource_type(self, resource_type: ResourceType) -> None:
+        if self._bufs[resource_type]:
+            insert_rows(self._db_file, resource_type.value, self._bufs[resource_type])
+            self._bufs[resource_type].clear()
+
+
+def _make_ticks(
+    stats: dict[ResourceType, Any], count: int, num_ticks: int
+) -> list[dict[ResourceType, Any]]:
+    rng = random.Random(0)
+    return [
+        {
+            ResourceType.CPU: {k: rng.random() for k in stats[ResourceType.CPU]},
+            ResourceType.MEMORY: {k: rng.random() for k in stats[ResourceType.MEMORY]},
+            ResourceType.PROCESS: {
+                f"process {i}": {x: rng.random() for x in _PROCESS_STATS} for i in range(count)
+            },
+        }
+        for _ in range(num_ticks)
+    ]
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--counts", nargs="+", type=int, default=[10, 100, 1000])
+    parser.add_argument("--ticks", type=int, default=200)
+    parser.add_argument("--buffered-write-count", type=int, default=DEFAULT_BUFFERED_WRITE_COUNT)
+    parser.add_argument("--directory", type=Path, default=None)
+    args = parser.parse_args()
+    logger.remove()
+
+    collector = ResourceStatCollector()
+    stats = collector.get_stats(ComputeNodeResourceStatConfig.all_enabled(), pids={})
+    collector.shutdown()
+    config = ComputeNodeResourceStatConfig(cpu=True, memory=True, process=True)
+    print("processes  rows/tick  original rows/s  store rows/s  speedup")
+    with tempfile.TemporaryDirectory(dir=args.directory) as tmp_dir:
+        for count in args.counts:
+            ticks = _make_ticks(stats, count, args.ticks)
+            num_rows = args.ticks * (count + 2)
+
+            original = _OriginalStore(
+                Path(tmp_dir) / f"original_{count}.sqlite", stats, args.buffered_write_count
+            )
+            start = time.perf_counter()
+            for tick in ticks:
+                original.record_stats(tick)
+            original.flush()
+            original_duration = time.perf_counter() - start
+
+            db_file = Path(tmp_dir) / f"store_{count}.sqlite"
+            store = ResourceStatStore(
+                config, db_file, stats, buffered_write_count=args.buffered_write_count
+            )
+            start = time.perf_counter()
+            for tick in ticks:
+                store.record_stats(tick)
+            store.close()
+            store_duration = time.perf_counter() - start
+
+            if len(read_table(db_file, "process")[0]) != args.ticks * count:
+                msg = f"The store did not write all process rows for {count=}"
+                raise RuntimeError(msg)
+            print(
+                f"{count:<10} {count + 2:>9}  {num_rows / original_duration:15.0f}  "
+                f"{num_rows / store_duration:12.0f}  {original_duration / store_duration:6.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
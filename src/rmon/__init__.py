@@ -6,11 +6,16 @@ from rmon.models import (
     CompleteProcessesCommand,
     ComputeNodeResourceStatConfig,
     ComputeNodeResourceStatResults,
+    ProcessGroupRule,
+    ProcessMatchRule,
     ProcessStatResults,
+    ResourceStatSnapshot,
     ResourceType,
     ShutDownCommand,
+    SnapshotCommand,
     UpdatePidsCommand,
 )
+from rmon.sketches import DDSketch
 from rmon.timing.timer_stats import Timer, TimerStatsCollector, track_timing
 from rmon.timing.timer_utils import timed_info, timed_threshold
 from rmon.resource_monitor import run_monitor_async, run_monitor_sync
@@ -23,9 +28,14 @@ __all__ = (
     "CompleteProcessesCommand",
     "ComputeNodeResourceStatConfig",
     "ComputeNodeResourceStatResults",
+    "DDSketch",
+    "ProcessGroupRule",
+    "ProcessMatchRule",
     "ProcessStatResults",
+    "ResourceStatSnapshot",
     "ResourceType",
     "ShutDownCommand",
+    "SnapshotCommand",
     "Timer",
     "TimerStatsCollector",
     "UpdatePidsCommand",
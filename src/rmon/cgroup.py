@@ -0,0 +1,159 @@
+"""Collects resource accounting stats from cgroup v2 directories."""
+
+import os
+import re
+import time
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+from loguru import logger
+
+
+DEFAULT_CGROUPFS_ROOT = "/sys/fs/cgroup"
+ONE_MB = 1024 * 1024
+
+_SLURM_JOB_REGEX = re.compile(r"^job_\d+$")
+
+
+class CgroupStatCollector:
+    """Collects stats from cgroup v2 controller files. The cost per interval is constant with
+    respect to the number of processes in each cgroup, and the counters include processes that
+    started and exited between intervals.
+    """
+
+    STATS = (
+        "cpu_percent",
+        "user_percent",
+        "system_percent",
+        "throttled_percent",
+        "memory_current",
+        "memory_peak",
+        "read MB/s",
+        "write MB/s",
+        "read IOPS",
+        "write IOPS",
+        "pids_current",
+    )
+
+    def __init__(self, root: str | Path = DEFAULT_CGROUPFS_ROOT) -> None:
+        self._root = Path(root)
+        # cgroup key -> (monotonic time, cumulative counters) as of the last collection
+        self._last_counters: dict[str, tuple[float, dict[str, int]]] = {}
+
+    @property
+    def root(self) -> Path:
+        """Return the cgroupfs root directory."""
+        return self._root
+
+    def discover_job_cgroup(self, procfs_root: str | Path = "/proc") -> Optional[str]:
+        """Return the cgroup of the current Slurm job, relative to the root. If this process is
+        not running in a Slurm job, return its own cgroup. Returns None if the process is not in
+        a cgroup v2 hierarchy.
+        """
+        try:
+            with open(Path(procfs_root) / "self" / "cgroup", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return None
+
+        path = None
+        for line in lines:
+            if line.startswith("0::"):
+                path = line[3:]
+                break
+        if path is None:
+            return None
+
+        job_id = os.environ.get("SLURM_JOB_ID")
+        parts = path.split("/")
+        for i, part in enumerate(parts):
+            if part == f"job_{job_id}" or (job_id is None and _SLURM_JOB_REGEX.match(part)):
+                return "/".join(parts[: i + 1])
+        return path
+
+    def get_stats(self, cgroups: Iterable[str]) -> dict[str, dict[str, Any]]:
+        """Return stats for each cgroup, keyed by its path relative to the root. Cgroups seen for
+        the first time only record a baseline and are reported starting with the next call.
+        """
+        stats: dict[str, dict[str, Any]] = {}
+        cur_keys = set()
+        for cgroup in cgroups:
+            key = "/" + cgroup.strip("/")
+            path = self._root / key.lstrip("/")
+            if not path.is_dir():
+                logger.warning("cgroup={} does not exist", path)
+                continue
+            now = time.monotonic()
+            counters = self._read_counters(path)
+            cur_keys.add(key)
+            previous = self._last_counters.get(key)
+            self._last_counters[key] = (now, counters)
+            if previous is not None:
+                stats[key] = self._make_stats(path, counters, previous[1], now - previous[0])
+
+        for key in set(self._last_counters).difference(cur_keys):
+            self._last_counters.pop(key)
+        return stats
+
+    def _make_stats(
+        self, path: Path, counters: dict[str, int], previous: dict[str, int], elapsed: float
+    ) -> dict[str, Any]:
+        def rate(name: str) -> float:
+            return (counters[name] - previous[name]) / elapsed if elapsed > 0 else 0.0
+
+        memory_current = _read_int(path / "memory.current")
+        memory_peak = _read_int(path / "memory.peak")
+        return {
+            # CPU times are reported in microseconds.
+            "cpu_percent": rate("usage_usec") / 10_000,
+            "user_percent": rate("user_usec") / 10_000,
+            "system_percent": rate("system_usec") / 10_000,
+            "throttled_percent": rate("throttled_usec") / 10_000,
+            "memory_current": memory_current,
+            # memory.peak is not available before Linux 5.19.
+            "memory_peak": memory_peak or memory_current,
+            "read MB/s": rate("rbytes") / ONE_MB,
+            "write MB/s": rate("wbytes") / ONE_MB,
+            "read IOPS": rate("rios"),
+            "write IOPS": rate("wios"),
+            "pids_current": _read_int(path / "pids.current"),
+        }
+
+    @staticmethod
+    def _read_counters(path: Path) -> dict[str, int]:
+        counters = dict.fromkeys(("usage_usec", "user_usec", "system_usec", "throttled_usec"), 0)
+        counters.update(dict.fromkeys(("rbytes", "wbytes", "rios", "wios"), 0))
+        for name, val in _read_key_values(path / "cpu.stat"):
+            if name in counters:
+                counters[name] = int(val)
+        # io.stat has one line per device: "8:0 rbytes=1 wbytes=2 rios=3 wios=4 ..."
+        for line in _read_lines(path / "io.stat"):
+            for field in line.split()[1:]:
+                name, _, val = field.partition("=")
+                if name in counters:
+                    counters[name] += int(val)
+        return counters
+
+
+def _read_lines(path: Path) -> list[str]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return f.read().splitlines()
+    except (FileNotFoundError, PermissionError):
+        return []
+
+
+def _read_key_values(path: Path) -> list[tuple[str, str]]:
+    pairs = []
+    for line in _read_lines(path):
+        fields = line.split()
+        if len(fields) == 2:
+            pairs.append((fields[0], fields[1]))
+    return pairs
+
+
+def _read_int(path: Path) -> int:
+    lines = _read_lines(path)
+    if not lines or lines[0] == "max":
+        return 0
+    return int(lines[0])
@@ -14,15 +14,19 @@ import psutil
 from daemon import DaemonContext
 from loguru import logger
 
-from rmon.common import DEFAULT_BUFFERED_WRITE_COUNT
+from rmon.common import DEFAULT_BUFFERED_WRITE_COUNT, MIN_INTERVAL
+from rmon.process_discovery import make_process_key
 from rmon.resource_monitor import run_monitor_async, run_monitor_sync
 from rmon.models import (
     ComputeNodeResourceStatConfig,
     CompleteProcessesCommand,
     ComputeNodeResourceStatResults,
+    ProcessGroupRule,
+    ProcessMatchRule,
     ComputeNodeProcessResourceStatResults,
     SelectStatsCommand,
     ShutDownCommand,
+    SnapshotCommand,
     UpdatePidsCommand,
     ResourceType,
 )
@@ -65,6 +69,93 @@ from rmon.models import (
     show_default=True,
     help="Enable network monitoring",
 )
+@click.option(
+    "--pressure/--no-pressure",
+    default=False,
+    is_flag=True,
+    show_default=True,
+    help="Enable monitoring of pressure stall information and virtual memory activity (Linux).",
+)
+@click.option(
+    "--percpu/--no-percpu",
+    default=False,
+    is_flag=True,
+    show_default=True,
+    help="Enable monitoring of each CPU.",
+)
+@click.option(
+    "--perdisk/--no-perdisk",
+    default=False,
+    is_flag=True,
+    show_default=True,
+    help="Enable monitoring of each disk.",
+)
+@click.option(
+    "--pernic/--no-pernic",
+    default=False,
+    is_flag=True,
+    show_default=True,
+    help="Enable monitoring of each network interface.",
+)
+@click.option(
+    "--device-include",
+    multiple=True,
+    type=str,
+    help="Only monitor CPUs, disks, and network interfaces with names matching this "
+    "shell-style pattern, such as 'nvme*', with --percpu, --perdisk, and --pernic. Can be "
+    "specified multiple times.",
+)
+@click.option(
+    "--device-exclude",
+    multiple=True,
+    type=str,
+    help="Do not monitor CPUs, disks, and network interfaces with names matching this "
+    "shell-style pattern. Can be specified multiple times. Defaults to loop*, ram*, and lo.",
+)
+@click.option(
+    "--cgroup/--no-cgroup",
+    default=False,
+    is_flag=True,
+    show_default=True,
+    help="Enable cgroup v2 monitoring. Monitors the current Slurm job's cgroup unless "
+    "--cgroup-path is set.",
+)
+@click.option(
+    "--cgroup-path",
+    "cgroup_paths",
+    multiple=True,
+    type=str,
+    help="cgroup v2 directory to monitor, relative to /sys/fs/cgroup. Can be specified "
+    "multiple times.",
+)
+@click.option(
+    "--process-group",
+    "process_groups",
+    multiple=True,
+    type=str,
+    callback=lambda *x: _parse_process_groups(x[2]),
+    help="Sum the stats of all processes in a group, in the format NAME:KEY=VALUE, where KEY "
+    "is name (regex of the process name), cmdline (regex of the command line), user, or cgroup. "
+    "Specify the same NAME multiple times to require all criteria. Each process is counted in "
+    "the first group that it matches. Example: workers:cmdline='python worker\\.py'",
+)
+@click.option(
+    "--match-cmdline",
+    type=str,
+    help="Discover and monitor processes whose command lines match this regular expression, "
+    "including processes that start after collection begins. Processes that exit are "
+    "finalized automatically. Linux only.",
+)
+@click.option(
+    "--match-user",
+    type=str,
+    help="Discover and monitor processes owned by this user. Linux only.",
+)
+@click.option(
+    "--match-ppid",
+    type=int,
+    help="Discover and monitor child processes of this process ID. Linux only.",
+)
 @click.option(
     "--children/--no-children",
     default=False,
@@ -79,6 +170,64 @@ from rmon.models import (
     show_default=True,
     help="Search for all child processes recursively.",
 )
+@click.option(
+    "--process-grace-period",
+    type=click.FloatRange(min=0),
+    help="Finalize monitored processes that have not been sampled for this many seconds, such "
+    "as ones that exited, and write their results to the process_results table of the "
+    "database. Bounds memory use when monitoring many short-lived processes.",
+)
+@click.option(
+    "--process-results-file",
+    type=click.Path(dir_okay=False),
+    help="Also append the results of processes finalized by --process-grace-period to this "
+    "file as JSON lines.",
+)
+@click.option(
+    "--process-backend",
+    default="psutil",
+    type=click.Choice(["psutil", "procfs"]),
+    show_default=True,
+    help="Library used to collect per-process stats. procfs reads /proc directly and is only "
+    "supported on Linux.",
+)
+@click.option(
+    "--process-tier",
+    "process_tiers",
+    multiple=True,
+    type=click.Choice(["io", "threads", "memory_full"]),
+    help="Collect extended per-process metrics. io: storage read/write rates. threads: thread "
+    "and file descriptor counts and context switch rates. memory_full: USS and PSS, which is "
+    "expensive. Can be specified multiple times.",
+)
+@click.option(
+    "--percentile",
+    "percentiles",
+    multiple=True,
+    type=click.FloatRange(min=0, max=100),
+    help="Report this percentile of each stat, such as 95. Can be specified multiple times.",
+)
+@click.option(
+    "--peak-window",
+    "peak_windows",
+    multiple=True,
+    type=click.FloatRange(min=0, min_open=True),
+    help="Report the highest average of each stat over any sliding window of this many seconds, "
+    "such as 300 for the highest 5-minute average. Can be specified multiple times.",
+)
+@click.option(
+    "--snapshot-interval",
+    type=click.FloatRange(min=0, min_open=True),
+    help="Append a snapshot of the current summaries to the results file at this interval in "
+    "seconds, so that progress can be followed during a long collection.",
+)
+@click.option(
+    "--concurrent/--no-concurrent",
+    default=False,
+    is_flag=True,
+    show_default=True,
+    help="Collect the resource types in parallel within each interval.",
+)
 @click.option(
     "-n",
     "--name",
@@ -107,9 +256,10 @@ from rmon.models import (
     "-i",
     "--interval",
     default=3,
-    type=int,
+    type=click.FloatRange(min=MIN_INTERVAL),
     show_default=True,
-    help="Interval in seconds on which to collect resource stats.",
+    help="Interval in seconds on which to collect resource stats. Accepts fractional values "
+    "down to 0.05.",
 )
 @click.option(
     "-o",
@@ -133,6 +283,31 @@ from rmon.models import (
     type=int,
     help="Number of intervals to cache in memory before persisting to database.",
 )
+@click.option(
+    "--max-buffer-age",
+    default=60.0,
+    show_default=True,
+    type=click.FloatRange(min=0, min_open=True),
+    help="Persist cached rows to the database when the oldest one is this many seconds old, "
+    "which bounds the data lost if the monitor is killed.",
+)
+@click.option(
+    "--background-writes/--no-background-writes",
+    default=False,
+    is_flag=True,
+    show_default=True,
+    help="Write to the database in a background thread so that slow writes, such as on a "
+    "network filesystem, don't delay collection.",
+)
+@click.option(
+    "--sqlite-pragma",
+    "sqlite_pragmas",
+    multiple=True,
+    callback=lambda *x: _parse_sqlite_pragmas(x[2]),
+    help="Set a pragma on the connection to the database, such as synchronous=OFF, in the "
+    "format NAME=VALUE. Can be specified multiple times. Defaults to journal_mode=WAL and "
+    "synchronous=NORMAL.",
+)
 @click.option(
     "--daemon/--no-daemon",
     is_flag=True,
@@ -146,16 +321,39 @@ def collect(
     disk: bool,
     memory: bool,
     network: bool,
+    pressure: bool,
+    percpu: bool,
+    perdisk: bool,
+    pernic: bool,
+    device_include: tuple[str],
+    device_exclude: tuple[str],
+    cgroup: bool,
+    cgroup_paths: tuple[str],
+    process_groups: list[ProcessGroupRule],
+    match_cmdline: str | None,
+    match_user: str | None,
+    match_ppid: int | None,
     children: bool,
     recurse_children: bool,
+    process_grace_period: float | None,
+    process_results_file: str | None,
+    process_backend: str,
+    process_tiers: tuple[str],
+    percentiles: tuple[float],
+    peak_windows: tuple[float],
+    snapshot_interval: float | None,
+    concurrent: bool,
     name: str,
     plots: bool,
     duration: int,
     interactive: bool,
-    interval: int,
+    interval: float,
     output: Path,
     overwrite: bool,
     buffered_write_count: int,
+    max_buffer_age: float,
+    background_writes: bool,
+    sqlite_pragmas: dict[str, str],
     daemon: bool,
 ) -> None:
     """Collect resource utilization stats. Stop collection by setting duration, pressing Ctrl-c,
@@ -186,24 +384,49 @@ def collect(
     if interactive and duration is not None:
         logger.warning("Ignoring duration in interactive mode")
 
+    results_file = output / f"{name}_results.json"
+
+    process_match = _make_process_match(match_cmdline, match_user, match_ppid)
     config = ComputeNodeResourceStatConfig(
         cpu=cpu,
         disk=disk,
         memory=memory,
         network=network,
-        process=bool(process_ids),
+        pressure=pressure,
+        percpu=percpu,
+        perdisk=perdisk,
+        pernic=pernic,
+        device_include=list(device_include),
+        process=bool(process_ids) or process_match is not None,
+        process_match=process_match,
+        cgroup=cgroup or bool(cgroup_paths),
+        cgroup_paths=list(cgroup_paths),
+        process_groups=process_groups,
         include_child_processes=children,
         recurse_child_processes=recurse_children,
+        process_finalize_grace_period=process_grace_period,
+        process_results_file=process_results_file,
+        process_backend=process_backend,
+        process_tiers=list(process_tiers),
+        percentiles=list(percentiles),
+        peak_average_windows=list(peak_windows),
+        snapshot_interval=snapshot_interval,
+        snapshot_file=str(results_file),
+        concurrent_collection=concurrent,
         interval=interval,
         make_plots=plots,
+        background_writes=background_writes,
+        max_buffer_age=max_buffer_age,
         monitor_type="periodic",
     )
+    if sqlite_pragmas:
+        config.sqlite_pragmas = {**config.sqlite_pragmas, **sqlite_pragmas}
+    if device_exclude:
+        config.device_exclude = list(device_exclude)
 
     pids = _get_process_names(process_ids)
-    if db_file.exists():
-        db_file.unlink()
+    _remove_db_file(db_file)
     collector_log_file = output / f"{name}_collector.log"
-    results_file = output / f"{name}_results.json"
     if interactive:
         system_results, process_results = _run_interactive_mode(
             config, pids, db_file, collector_log_file, results_file, name, buffered_write_count
@@ -274,6 +497,14 @@ def collect(
     show_default=True,
     help="Enable network monitoring for the system",
 )
+@click.option(
+    "--pressure/--no-pressure",
+    default=False,
+    is_flag=True,
+    show_default=True,
+    help="Enable monitoring of pressure stall information and virtual memory activity for the "
+    "system (Linux).",
+)
 @click.option(
     "--children/--no-children",
     default=False,
@@ -288,6 +519,51 @@ def collect(
     show_default=True,
     help="Search for all child processes recursively.",
 )
+@click.option(
+    "--process-backend",
+    default="psutil",
+    type=click.Choice(["psutil", "procfs"]),
+    show_default=True,
+    help="Library used to collect per-process stats. procfs reads /proc directly and is only "
+    "supported on Linux.",
+)
+@click.option(
+    "--process-tier",
+    "process_tiers",
+    multiple=True,
+    type=click.Choice(["io", "threads", "memory_full"]),
+    help="Collect extended per-process metrics. io: storage read/write rates. threads: thread "
+    "and file descriptor counts and context switch rates. memory_full: USS and PSS, which is "
+    "expensive. Can be specified multiple times.",
+)
+@click.option(
+    "--percentile",
+    "percentiles",
+    multiple=True,
+    type=click.FloatRange(min=0, max=100),
+    help="Report this percentile of each stat, such as 95. Can be specified multiple times.",
+)
+@click.option(
+    "--peak-window",
+    "peak_windows",
+    multiple=True,
+    type=click.FloatRange(min=0, min_open=True),
+    help="Report the highest average of each stat over any sliding window of this many seconds, "
+    "such as 300 for the highest 5-minute average. Can be specified multiple times.",
+)
+@click.option(
+    "--snapshot-interval",
+    type=click.FloatRange(min=0, min_open=True),
+    help="Append a snapshot of the current summaries to the results file at this interval in "
+    "seconds, so that progress can be followed during a long collection.",
+)
+@click.option(
+    "--concurrent/--no-concurrent",
+    default=False,
+    is_flag=True,
+    show_default=True,
+    help="Collect the resource types in parallel within each interval.",
+)
 @click.option(
     "-n",
     "--name",
@@ -300,9 +576,10 @@ def collect(
     "-i",
     "--interval",
     default=3,
-    type=int,
+    type=click.FloatRange(min=MIN_INTERVAL),
     show_default=True,
-    help="Interval in seconds on which to collect resource stats.",
+    help="Interval in seconds on which to collect resource stats. Accepts fractional values "
+    "down to 0.05.",
 )
 @click.option(
     "-o",
@@ -333,21 +610,46 @@ def collect(
     type=int,
     help="Number of intervals to cache in memory before persisting to database.",
 )
+@click.option(
+    "--max-buffer-age",
+    default=60.0,
+    show_default=True,
+    type=click.FloatRange(min=0, min_open=True),
+    help="Persist cached rows to the database when the oldest one is this many seconds old, "
+    "which bounds the data lost if the monitor is killed.",
+)
+@click.option(
+    "--background-writes/--no-background-writes",
+    default=False,
+    is_flag=True,
+    show_default=True,
+    help="Write to the database in a background thread so that slow writes, such as on a "
+    "network filesystem, don't delay collection.",
+)
 @click.argument("process_args", nargs=-1, type=click.UNPROCESSED)
 def monitor_process(
     cpu: bool,
     disk: bool,
     memory: bool,
     network: bool,
+    pressure: bool,
     children: bool,
     recurse_children: bool,
+    process_backend: str,
+    process_tiers: tuple[str],
+    percentiles: tuple[float],
+    peak_windows: tuple[float],
+    snapshot_interval: float | None,
+    concurrent: bool,
     name: str,
-    interval: int,
+    interval: float,
     output: Path,
     overwrite: bool,
     plots: bool,
     process_args: list[str],
     buffered_write_count: int,
+    max_buffer_age: float,
+    background_writes: bool,
 ) -> None:
     """Start a process and monitor its resource utilization stats.
 
@@ -368,11 +670,21 @@ def monitor_process(
             disk=disk,
             memory=memory,
             network=network,
+            pressure=pressure,
             process=True,
             include_child_processes=children,
             recurse_child_processes=recurse_children,
+            process_backend=process_backend,
+            process_tiers=list(process_tiers),
+            percentiles=list(percentiles),
+            peak_average_windows=list(peak_windows),
+            snapshot_interval=snapshot_interval,
+            snapshot_file=str(results_file),
+            concurrent_collection=concurrent,
             interval=interval,
             make_plots=plots,
+            background_writes=background_writes,
+            max_buffer_age=max_buffer_age,
             monitor_type="periodic",
         )
 
@@ -391,10 +703,55 @@ def monitor_process(
     _cleanup(results_file, db_file, system_results, process_results, config, plots, output, name)
 
 
+_PROCESS_GROUP_KEYS = {
+    "name": "name_regex",
+    "cmdline": "cmdline_regex",
+    "user": "username",
+    "cgroup": "cgroup",
+}
+
+
+def _parse_process_groups(values: Iterable[str]) -> list[ProcessGroupRule]:
+    criteria: dict[str, dict[str, str]] = {}
+    for value in values:
+        name, _, criterion = value.partition(":")
+        key, _, pattern = criterion.partition("=")
+        if not name or key not in _PROCESS_GROUP_KEYS or not pattern:
+            msg = (
+                f"Invalid process group: {value}. Expected NAME:KEY=VALUE where KEY is one of "
+                f"{list(_PROCESS_GROUP_KEYS)}"
+            )
+            raise click.BadParameter(msg)
+        criteria.setdefault(name, {})[_PROCESS_GROUP_KEYS[key]] = pattern
+    return [ProcessGroupRule(name=name, **kwargs) for name, kwargs in criteria.items()]
+
+
+def _parse_sqlite_pragmas(values: Iterable[str]) -> dict[str, str]:
+    pragmas: dict[str, str] = {}
+    for value in values:
+        name, _, setting = value.partition("=")
+        if not name or not setting:
+            msg = f"Invalid SQLite pragma: {value}. Expected NAME=VALUE"
+            raise click.BadParameter(msg)
+        pragmas[name] = setting
+    return pragmas
+
+
+def _make_process_match(
+    cmdline_regex: str | None, username: str | None, ppid: int | None
+) -> ProcessMatchRule | None:
+    if cmdline_regex is None and username is None and ppid is None:
+        return None
+    if sys.platform != "linux":
+        logger.error("--match-cmdline, --match-user, and --match-ppid require Linux.")
+        sys.exit(1)
+    return ProcessMatchRule(cmdline_regex=cmdline_regex, username=username, ppid=ppid)
+
+
 def _check_db_file(db_file: Path, overwrite: bool) -> None:
     if db_file.exists():
         if overwrite:
-            db_file.unlink()
+            _remove_db_file(db_file)
         else:
             print(
                 f"{db_file} already exists. Choose a different name or set --overwrite.",
@@ -403,6 +760,12 @@ def _check_db_file(db_file: Path, overwrite: bool) -> None:
             sys.exit(1)
 
 
+def _remove_db_file(db_file: Path) -> None:
+    """Remove a database and the journal files that a killed run may have left next to it."""
+    for path in (db_file, Path(f"{db_file}-wal"), Path(f"{db_file}-shm")):
+        path.unlink(missing_ok=True)
+
+
 def _cleanup(
     results_file: Path,
     db_file: Path,
@@ -422,9 +785,9 @@ def _cleanup(
     logger.info("Use 'jq' to view consolidated data: 'jq -s . {}'", results_file)
 
     examples = []
-    for rtype in ("cpu", "disk", "memory", "network", "process"):
-        if getattr(config, rtype):
-            examples.append(f'    sqlite3 -table {db_file} "select * from {rtype}"')
+    for rtype in ResourceType:
+        if getattr(config, rtype.value):
+            examples.append(f'    sqlite3 -table {db_file} "select * from {rtype.value}_view"')
     logger.info(
         "View full results in table form with these example commands: \n{}", "\n".join(examples)
     )
@@ -453,6 +816,7 @@ Enter one of the following letters to change operation:
 
     p: Change the process IDs to monitor.
     r: Change the system-level resource types to monitor.
+    v: View a snapshot of the current summaries.
     s: Shut down.
 
 >>> """
@@ -467,6 +831,9 @@ Enter one of the following letters to change operation:
                 )
             case "r":
                 config = _get_user_resource_types(config, pids, parent_monitor_conn)
+            case "v":
+                parent_monitor_conn.send(SnapshotCommand(pids=pids))
+                print(parent_monitor_conn.recv().model_dump_json(indent=2))
             case "s":
                 break
             case _:
@@ -487,7 +854,7 @@ def _get_user_resource_types(
 ) -> ComputeNodeResourceStatConfig:
     resource_types = config.list_enabled_system_resource_types()
     types_str = " ".join((x.value for x in resource_types))
-    example = "cpu disk memory network"
+    example = "cpu disk memory network pressure"
     print(
         f"Current resource types being monitored: {types_str}. Available: {example}",
         file=sys.stderr,
@@ -577,17 +944,5 @@ def _get_process_names(pids: Iterable[int]) -> dict[str, int]:
 
 def _get_process_name(pid: int) -> str:
     """Return a mapping of name to pid. The name should be suitable for plots."""
-    # Including the entire command line is often way too long.
-    # name() is often better than the first arg (python instead of full path to python)
-    # This tries to get the best of all worlds and ensure uniqueness.
     process = psutil.Process(pid)
-    cmdline = process.cmdline()
-    if len(cmdline) > 1:
-        name = process.name() + " " + " ".join(cmdline[1:])
-    else:
-        name = process.name()
-
-    if len(name) > 20:
-        name = name[:20] + "..."
-
-    return name + f" ({process.pid})"
+    return make_process_key(process.name(), process.cmdline(), process.pid)
@@ -2,3 +2,5 @@
 
 
 DEFAULT_BUFFERED_WRITE_COUNT = 50
+
+MIN_INTERVAL = 0.05
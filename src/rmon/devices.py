@@ -0,0 +1,143 @@
+"""Collects per-CPU, per-disk, and per-network-interface stats."""
+
+import fnmatch
+import time
+from typing import Any, Callable, Iterable
+
+import psutil
+
+
+ONE_MB = 1024 * 1024
+
+
+class DeviceStatCollector:
+    """Collects stats for individual devices. Each method returns stats keyed by device name.
+    Rates are computed from the counters recorded by the previous call to the same method, and so
+    devices seen for the first time only record a baseline and are reported starting with the
+    next call.
+    """
+
+    PERCPU_STATS = ("cpu_percent", "user", "system", "idle", "iowait")
+    PERDISK_STATS = ("read MB/s", "write MB/s", "read IOPS", "write IOPS", "busy_percent")
+    PERNIC_STATS = (
+        "recv MB/s",
+        "sent MB/s",
+        "packets_recv/s",
+        "packets_sent/s",
+        "errors",
+        "drops",
+    )
+
+    def __init__(self) -> None:
+        # method name -> (monotonic time, device name -> counters) as of the last collection
+        self._last_counters: dict[str, tuple[float, dict[str, Any]]] = {}
+
+    def get_percpu_stats(
+        self, include: Iterable[str] = (), exclude: Iterable[str] = ()
+    ) -> dict[str, dict[str, float]]:
+        """Return utilization percentages for each CPU, keyed by 'cpu<N>'."""
+        counters = {f"cpu{i}": x for i, x in enumerate(psutil.cpu_times(percpu=True))}
+        previous, _ = self._swap_counters("percpu", counters)
+        stats = {}
+        for name in filter_devices(counters, include, exclude):
+            if name not in previous:
+                continue
+            cur, prev = counters[name], previous[name]
+            total = _get_total_cpu_time(cur) - _get_total_cpu_time(prev)
+            if total <= 0:
+                continue
+            # Dividing by 1% of the total converts each time delta to a percentage.
+            percent = _make_delta_func(cur, prev, total / 100)
+            idle = percent("idle")
+            iowait = percent("iowait")
+            stats[name] = {
+                "cpu_percent": max(100.0 - idle - iowait, 0.0),
+                "user": percent("user"),
+                "system": percent("system"),
+                "idle": idle,
+                "iowait": iowait,
+            }
+        return stats
+
+    def get_perdisk_stats(
+        self, include: Iterable[str] = (), exclude: Iterable[str] = ()
+    ) -> dict[str, dict[str, float]]:
+        """Return throughput and utilization for each disk, keyed by device name."""
+        counters = psutil.disk_io_counters(perdisk=True) or {}
+        previous, elapsed = self._swap_counters("perdisk", counters)
+        stats = {}
+        for name in filter_devices(counters, include, exclude):
+            if name not in previous:
+                continue
+            delta = _make_delta_func(counters[name], previous[name], elapsed)
+            stats[name] = {
+                "read MB/s": delta("read_bytes") / ONE_MB,
+                "write MB/s": delta("write_bytes") / ONE_MB,
+                "read IOPS": delta("read_count"),
+                "write IOPS": delta("write_count"),
+                # busy_time is in milliseconds and is only available on Linux and FreeBSD.
+                "busy_percent": min(delta("busy_time") / 10, 100.0),
+            }
+        return stats
+
+    def get_pernic_stats(
+        self, include: Iterable[str] = (), exclude: Iterable[str] = ()
+    ) -> dict[str, dict[str, float]]:
+        """Return throughput for each network interface, keyed by interface name. errors and
+        drops are the numbers of packets in the interval.
+        """
+        counters = psutil.net_io_counters(pernic=True) or {}
+        previous, elapsed = self._swap_counters("pernic", counters)
+        stats = {}
+        for name in filter_devices(counters, include, exclude):
+            if name not in previous:
+                continue
+            delta = _make_delta_func(counters[name], previous[name], elapsed)
+            cur, prev = counters[name], previous[name]
+            stats[name] = {
+                "recv MB/s": delta("bytes_recv") / ONE_MB,
+                "sent MB/s": delta("bytes_sent") / ONE_MB,
+                "packets_recv/s": delta("packets_recv"),
+                "packets_sent/s": delta("packets_sent"),
+                "errors": (cur.errin + cur.errout) - (prev.errin + prev.errout),
+                "drops": (cur.dropin + cur.dropout) - (prev.dropin + prev.dropout),
+            }
+        return stats
+
+    def _swap_counters(self, name: str, counters: dict[str, Any]) -> tuple[dict[str, Any], float]:
+        now = time.monotonic()
+        last_time, previous = self._last_counters.get(name, (now, {}))
+        self._last_counters[name] = (now, counters)
+        return previous, now - last_time
+
+
+def filter_devices(
+    names: Iterable[str], include: Iterable[str] = (), exclude: Iterable[str] = ()
+) -> list[str]:
+    """Return the device names that match any include pattern and no exclude pattern.
+    Patterns are shell-style wildcards, such as 'nvme*'. All names match an empty include list.
+    """
+    include = list(include)
+    exclude = list(exclude)
+    return [
+        x
+        for x in names
+        if (not include or any(fnmatch.fnmatchcase(x, y) for y in include))
+        and not any(fnmatch.fnmatchcase(x, y) for y in exclude)
+    ]
+
+
+def _get_total_cpu_time(times: Any) -> float:
+    """Return the total of the CPU times. Linux includes the guest times in user and nice, and
+    so they are excluded, as in psutil.cpu_percent.
+    """
+    return sum(times) - getattr(times, "guest", 0) - getattr(times, "guest_nice", 0)
+
+
+def _make_delta_func(cur: Any, prev: Any, elapsed: float) -> Callable[[str], float]:
+    def delta(field: str) -> float:
+        if elapsed <= 0:
+            return 0.0
+        return (getattr(cur, field, 0) - getattr(prev, field, 0)) / elapsed
+
+    return delta
@@ -1,9 +1,14 @@
 """Defines data models used in resource monitoring code."""
 
 import enum
+from typing import Any, Optional
 
 from pydantic import BaseModel, ConfigDict, Field  # pylint: disable=no-name-in-module
 
+from .common import MIN_INTERVAL
+from .process_cache import DEFAULT_PROCESS_CACHE_SIZE
+from .utils.sql import DEFAULT_PRAGMAS
+
 
 class ResourceType(str, enum.Enum):
     """Types of resources to monitor"""
@@ -12,7 +17,13 @@ class ResourceType(str, enum.Enum):
     DISK = "disk"
     MEMORY = "memory"
     NETWORK = "network"
+    PRESSURE = "pressure"
+    PERCPU = "percpu"
+    PERDISK = "perdisk"
+    PERNIC = "pernic"
     PROCESS = "process"
+    PROCESS_GROUP = "process_group"
+    CGROUP = "cgroup"
 
 
 class ResourceMonitorBaseModel(BaseModel):
@@ -27,6 +38,46 @@ class ResourceMonitorBaseModel(BaseModel):
     )
 
 
+class ProcessGroupRule(ResourceMonitorBaseModel):
+    """Defines a group of processes whose stats are summed. A process belongs to the group if it
+    matches all criteria that are set.
+    """
+
+    name: str = Field(description="Name of the group")
+    name_regex: Optional[str] = Field(
+        description="Regular expression to search for in the process name", default=None
+    )
+    cmdline_regex: Optional[str] = Field(
+        description="Regular expression to search for in the process command line, with "
+        "arguments separated by spaces",
+        default=None,
+    )
+    username: Optional[str] = Field(
+        description="Name of the user that owns the process", default=None
+    )
+    cgroup: Optional[str] = Field(
+        description="cgroup v2 path of the process or one of its ancestors, such as "
+        "'/system.slice/slurmstepd.scope/job_1234'",
+        default=None,
+    )
+
+
+class ProcessMatchRule(ResourceMonitorBaseModel):
+    """Defines processes to discover and monitor automatically. A process matches if it matches
+    all criteria that are set.
+    """
+
+    cmdline_regex: Optional[str] = Field(
+        description="Regular expression to search for in the process command line, with "
+        "arguments separated by spaces",
+        default=None,
+    )
+    username: Optional[str] = Field(
+        description="Name of the user that owns the process", default=None
+    )
+    ppid: Optional[int] = Field(description="ID of the parent process", default=None)
+
+
 class ComputeNodeResourceStatConfig(ResourceMonitorBaseModel):
     """Defines the stats to monitor."""
 
@@ -46,10 +97,131 @@ class ComputeNodeResourceStatConfig(ResourceMonitorBaseModel):
         description="Monitor network utilization",
         default=False,
     )
+    pressure: bool = Field(
+        description="Monitor pressure stall information (Linux /proc/pressure) and virtual "
+        "memory activity (/proc/vmstat)",
+        default=False,
+    )
+    percpu: bool = Field(
+        description="Monitor utilization of each CPU",
+        default=False,
+    )
+    perdisk: bool = Field(
+        description="Monitor utilization of each disk",
+        default=False,
+    )
+    pernic: bool = Field(
+        description="Monitor utilization of each network interface",
+        default=False,
+    )
+    device_include: list[str] = Field(
+        description="Shell-style patterns of CPU, disk, and network interface names to monitor "
+        "with percpu, perdisk, and pernic, such as 'nvme*'. If empty, monitor all devices.",
+        default=[],
+    )
+    device_exclude: list[str] = Field(
+        description="Shell-style patterns of CPU, disk, and network interface names to exclude "
+        "from percpu, perdisk, and pernic.",
+        default=["loop*", "ram*", "lo"],
+    )
     process: bool = Field(
         description="Monitor per-job process utilization",
         default=True,
     )
+    cgroup: bool = Field(
+        description="Monitor cgroup v2 accounting, such as for Slurm jobs and steps",
+        default=False,
+    )
+    cgroup_paths: list[str] = Field(
+        description="cgroup v2 directories to monitor, relative to cgroupfs_root. If empty and "
+        "cgroup is enabled, monitor the cgroup of the current Slurm job, or the cgroup of this "
+        "process if it is not running in a Slurm job.",
+        default=[],
+    )
+    cgroupfs_root: str = Field(
+        description="Root directory of the cgroup v2 hierarchy.",
+        default="/sys/fs/cgroup",
+    )
+    process_groups: list[ProcessGroupRule] = Field(
+        description="Rules that group processes by name, command line, user, or cgroup. Each "
+        "process is counted in the first group that it matches. The stats of each group are "
+        "summed over its processes in every interval.",
+        default=[],
+    )
+    process_match: Optional[ProcessMatchRule] = Field(
+        description="If set, discover new processes that match this rule on every interval and "
+        "monitor them in addition to the explicit process IDs. Processes that exit are finalized "
+        "automatically, and their results are written to the process result sinks of the monitor, "
+        "if any. Requires a Linux procfs.",
+        default=None,
+    )
+    process_finalize_grace_period: Optional[float] = Field(
+        description="If set, finalize processes that have not been sampled for this many "
+        "seconds, such as ones that exited, and release their summaries. The results are "
+        "written to the process result sinks of the monitor, if any, and otherwise up to "
+        "max_kept_process_results of them are kept until the processes are completed or the "
+        "monitor shuts down.",
+        default=None,
+        ge=0,
+    )
+    max_kept_process_results: int = Field(
+        description="Maximum number of results of automatically finalized processes to keep in "
+        "memory when there is no process result sink. The oldest results are dropped beyond "
+        "that.",
+        default=10_000,
+        ge=0,
+    )
+    process_results_file: Optional[str] = Field(
+        description="If set, append the results of processes that are finalized because of "
+        "process_finalize_grace_period to this file as JSON lines.",
+        default=None,
+    )
+    sqlite_pragmas: dict[str, str | int] = Field(
+        description="Pragmas to set on the connection to the stats database. WAL journaling "
+        "requires shared memory, and so set journal_mode to DELETE if the database must be read "
+        "from other nodes during collection.",
+        default=DEFAULT_PRAGMAS,
+    )
+    max_buffer_age: Optional[float] = Field(
+        description="Flush the rows buffered for the stats database when the oldest one is "
+        "this many seconds old. This bounds the data that is lost if the monitor is killed. "
+        "If None, only the row count and size limits apply.",
+        default=60.0,
+        gt=0,
+    )
+    max_buffer_bytes: Optional[int] = Field(
+        description="Flush the rows buffered for the stats database when their estimated size "
+        "reaches this many bytes. If None, there is no size limit.",
+        default=16 * 1024 * 1024,
+        ge=1,
+    )
+    background_writes: bool = Field(
+        description="Write to the stats database in a background thread so that slow writes "
+        "don't delay collection.",
+        default=False,
+    )
+    write_queue_size: int = Field(
+        description="Maximum number of flushed batches of rows that wait for the background "
+        "writer",
+        default=16,
+        ge=1,
+    )
+    write_queue_timeout: float = Field(
+        description="Seconds that a flush waits for space in the background write queue before "
+        "it drops its rows",
+        default=1.0,
+        ge=0,
+    )
+    snapshot_interval: Optional[float] = Field(
+        description="If set, append a snapshot of the current summaries to snapshot_file at "
+        "this interval in seconds.",
+        default=None,
+        gt=0,
+    )
+    snapshot_file: Optional[str] = Field(
+        description="File to which snapshots are appended as JSON lines",
+        default=None,
+    )
     include_child_processes: bool = Field(
         description="Include stats from direct child processes in utilization for each job.",
         default=True,
@@ -58,6 +230,39 @@ class ComputeNodeResourceStatConfig(ResourceMonitorBaseModel):
         description="Recurse child processes to find all descendants.",
         default=False,
     )
+    process_tiers: list[str] = Field(
+        description="Extended per-process metrics to collect, in increasing order of cost. "
+        "'io': storage read and write rates. 'threads': number of threads and open file "
+        "descriptors and context switch rates. 'memory_full': unique and proportional set "
+        "sizes (USS and PSS), which do not double-count memory shared by forked workers but "
+        "require the kernel to walk all memory mappings of each process.",
+        default=[],
+    )
+    process_cache_size: int = Field(
+        description="Maximum number of psutil.Process objects to cache across intervals. The "
+        "least recently used processes are evicted beyond this limit.",
+        default=DEFAULT_PROCESS_CACHE_SIZE,
+        ge=1,
+    )
+    process_backend: str = Field(
+        description="'psutil' or 'procfs'. Library used to collect per-process stats. 'procfs' "
+        "reads the Linux procfs directly and is cheaper with large numbers of processes.",
+        default="psutil",
+    )
+    procfs_root: str = Field(
+        description="Root directory of the procfs mount used by the 'procfs' process backend.",
+        default="/proc",
+    )
+    concurrent_collection: bool = Field(
+        description="Collect the enabled resource types in parallel on a thread pool.",
+        default=False,
+    )
+    collection_timeout: Optional[float] = Field(
+        description="Maximum time in seconds to wait for concurrent collection in one interval. "
+        "Resource types that do not finish in time are omitted from that interval and their "
+        "results are reported in the next one. Defaults to the interval.",
+        default=None,
+    )
     monitor_type: str = Field(
         description="'aggregation' or 'periodic'. Keep aggregated stats in memory or record "
         "time-series data on an interval.",
@@ -67,17 +272,42 @@ class ComputeNodeResourceStatConfig(ResourceMonitorBaseModel):
         description="Make time-series plots if monitor_type is periodic.", default=True
     )
     interval: float = Field(
-        description="Interval in seconds on which to collect stats", default=10
+        description="Interval in seconds on which to collect stats", default=10, ge=MIN_INTERVAL
+    )
+    percentiles: list[float] = Field(
+        description="Percentiles between 0 and 100 to report for each system and process stat, "
+        "such as [50, 95, 99]. Each stat is tracked in a bounded-memory quantile sketch, which is "
+        "included in the results so that results from multiple runs or nodes can be merged.",
+        default=[],
+    )
+    sketch_relative_accuracy: float = Field(
+        description="Relative accuracy of the percentiles. 0.01 means that each percentile is "
+        "within 1% of the true value.",
+        default=0.01,
+        gt=0,
+        lt=1,
     )
+    peak_average_windows: list[float] = Field(
+        description="Lengths in seconds of sliding windows. For each window, report the highest "
+        "average of each system and process stat over any window of that length, such as the "
+        "highest 5-minute average CPU utilization.",
+        default=[],
+    )
+
+    @property
+    def process_group(self) -> bool:
+        """Return True if process groups are defined."""
+        return bool(self.process_groups)
 
     @classmethod
     def all_enabled(cls) -> "ComputeNodeResourceStatConfig":
-        """Return an instance with all stats enabled."""
+        """Return an instance with all stats enabled, including pressure stats."""
         return cls(
             cpu=True,
             disk=True,
             memory=True,
             network=True,
+            pressure=True,
             process=True,
         )
 
@@ -89,16 +319,24 @@ class ComputeNodeResourceStatConfig(ResourceMonitorBaseModel):
             disk=False,
             memory=False,
             network=False,
+            pressure=False,
+            percpu=False,
+            perdisk=False,
+            pernic=False,
             process=False,
+            cgroup=False,
         )
 
     def is_enabled(self) -> bool:
         """Return True if any stat is enabled."""
-        return self.cpu or self.disk or self.memory or self.network or self.process
+        return any(
+            getattr(self, x.value)
+            for x in self.list_system_resource_types() + self.list_device_resource_types()
+        ) or (self.process or self.process_group or self.cgroup)
 
     def disable_system_stats(self) -> None:
         """Disable all system-level stats."""
-        for resource_type in self.list_system_resource_types():
+        for resource_type in self.list_system_resource_types() + self.list_device_resource_types():
             setattr(self, resource_type.value, False)
 
     def list_enabled_system_resource_types(self) -> list[ResourceType]:
@@ -113,8 +351,14 @@ class ComputeNodeResourceStatConfig(ResourceMonitorBaseModel):
             ResourceType.DISK,
             ResourceType.MEMORY,
             ResourceType.NETWORK,
+            ResourceType.PRESSURE,
         ]
 
+    @staticmethod
+    def list_device_resource_types() -> list[ResourceType]:
+        """Return the resource types that are tracked per CPU, disk, or network interface."""
+        return [ResourceType.PERCPU, ResourceType.PERDISK, ResourceType.PERNIC]
+
 
 class ResourceStatResults(ResourceMonitorBaseModel):
     """Results for one resource type"""
@@ -124,12 +368,51 @@ class ResourceStatResults(ResourceMonitorBaseModel):
     minimum: dict
     maximum: dict
     num_samples: int
+    percentiles: dict[str, dict[str, float]] = Field(
+        description="Estimated percentiles of each stat, keyed by percentile, such as 'p95'",
+        default={},
+    )
+    sketches: dict[str, dict[str, Any]] = Field(
+        description="Serialized quantile sketch of each stat. Use rmon.DDSketch.from_dict to "
+        "load and merge them.",
+        default={},
+    )
+    peak_averages: dict[str, dict[str, float]] = Field(
+        description="Highest sliding-window average of each stat, keyed by window length, such "
+        "as '300s'",
+        default={},
+    )
+    variance: dict[str, float] = Field(
+        description="Population variance of each stat, computed online with Welford's algorithm",
+        default={},
+    )
+    standard_deviation: dict[str, float] = Field(
+        description="Population standard deviation of each stat",
+        default={},
+    )
+    time_weighted_average: dict[str, float] = Field(
+        description="Average of each stat with each sample weighted by the time elapsed since "
+        "the previous sample. Unlike average, this is not biased by irregular intervals.",
+        default={},
+    )
 
 
 class ProcessStatResults(ResourceStatResults):
     """Results for one process stat"""
 
     process_key: str
+    total_cpu_seconds: Optional[float] = Field(
+        description="Total CPU time consumed by the process, its monitored children, and "
+        "descendants that exited and were reaped by a process in the tree. Unlike the sampled "
+        "cpu_percent, this includes processes that started and exited between samples.",
+        default=None,
+    )
+
+
+class KeyedStatResults(ResourceStatResults):
+    """Results for one key of a resource type that is tracked per key, such as one cgroup"""
+
+    key: str
 
 
 class ComputeNodeResourceStatResults(ResourceMonitorBaseModel):
@@ -137,6 +420,11 @@ class ComputeNodeResourceStatResults(ResourceMonitorBaseModel):
 
     hostname: str = Field(description="Hostname of compute node")
     results: list[ResourceStatResults]
+    keyed_results: list[KeyedStatResults] = Field(
+        description="Results for resource types that are tracked per key, such as cgroups and "
+        "devices",
+        default=[],
+    )
 
 
 class ComputeNodeProcessResourceStatResults(ResourceMonitorBaseModel):
@@ -146,6 +434,16 @@ class ComputeNodeProcessResourceStatResults(ResourceMonitorBaseModel):
     results: list[ProcessStatResults]
 
 
+class ResourceStatSnapshot(ResourceMonitorBaseModel):
+    """Current summaries of a running monitor, which continues to update them"""
+
+    timestamp: float = Field(
+        description="Time at which the snapshot was taken, in seconds since the epoch"
+    )
+    system_results: ComputeNodeResourceStatResults
+    process_results: ComputeNodeProcessResourceStatResults
+
+
 # The commands below are used for communication between the parent and child processes engaged
 # in resource monitoring through the run_monitor_async function.
 
@@ -170,6 +468,12 @@ class SelectStatsCommand(CommandBaseModel):
     config: ComputeNodeResourceStatConfig
 
 
+class SnapshotCommand(CommandBaseModel):
+    """Command to get the current system and process summaries without resetting them. The
+    parent must call recv() immediately afterwards to read a ResourceStatSnapshot.
+    """
+
+
 class ShutDownCommand(CommandBaseModel):
     """Command to shut down the monitoring process. The parent must call recv() immediately
     afterwards to read system and process results.
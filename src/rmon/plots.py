@@ -1,13 +1,25 @@
 """Makes plots."""
 
+import re
+from datetime import datetime
 from pathlib import Path
+from typing import Any, Sequence
 
 import plotly.graph_objects as go  # type: ignore
 from loguru import logger
 from plotly.subplots import make_subplots  # type: ignore
 
 from rmon.models import ResourceType
-from rmon.utils.sql import read_table_as_dict, read_process_tables
+from rmon.utils.sql import list_tables, read_columns, read_columns_by_key
+
+
+# Columns plotted as heatmaps of time by device. One trace per stat instead of one per device
+# keeps the files small and readable on nodes with hundreds of CPUs.
+_DEVICE_HEATMAP_COLUMNS = {
+    ResourceType.PERCPU: ["cpu_percent"],
+    ResourceType.PERDISK: ["busy_percent", "read_MB_s", "write_MB_s"],
+    ResourceType.PERNIC: ["recv_MB_s", "sent_MB_s"],
+}
 
 
 def plot_to_file(db_file: str | Path, name: str | None = None) -> None:
@@ -16,10 +28,18 @@ def plot_to_file(db_file: str | Path, name: str | None = None) -> None:
         db_file = Path(db_file)
     base_name = db_file.stem
     name = name or base_name
+    tables = set(list_tables(db_file))
     for resource_type in ResourceType:
         table_name = resource_type.value.lower()
-        if resource_type == ResourceType.PROCESS:
+        if table_name not in tables:
+            # The database was written by an older version.
+            continue
+        if resource_type in (ResourceType.PROCESS, ResourceType.PROCESS_GROUP):
             fig = _make_process_figure(db_file, table_name)
+        elif resource_type == ResourceType.CGROUP:
+            fig = _make_cgroup_figure(db_file, table_name)
+        elif resource_type in _DEVICE_HEATMAP_COLUMNS:
+            fig = _make_device_figure(db_file, table_name, _DEVICE_HEATMAP_COLUMNS[resource_type])
         else:
             fig = _make_system_stat_figure(db_file, table_name)
 
@@ -35,16 +55,18 @@ def plot_to_file(db_file: str | Path, name: str | None = None) -> None:
 
 def _make_process_figure(db_file: Path, table_name: str) -> go.Figure:
     fig = make_subplots(specs=[[{"secondary_y": True}]])
-    for key, table in read_process_tables(db_file, table_name).items():
+    tables = read_columns_by_key(db_file, table_name, ["timestamp", "cpu_percent", "rss"])
+    for key, table in tables.items():
+        timestamps = _to_datetimes(table["timestamp"])
         fig.add_trace(
             go.Scatter(
-                x=table["timestamp"],
-                y=table["cpu_percent"],
+                x=timestamps,
+                y=_to_list(table["cpu_percent"]),
                 name=f"{key} cpu_percent",
             )
         )
         fig.add_trace(
-            go.Scatter(x=table["timestamp"], y=table["rss"], name=f"{key} rss"),
+            go.Scatter(x=timestamps, y=_to_list(table["rss"]), name=f"{key} rss"),
             secondary_y=True,
         )
     fig.update_yaxes(title_text="CPU Percent", secondary_y=False)
@@ -52,12 +74,84 @@ def _make_process_figure(db_file: Path, table_name: str) -> go.Figure:
     return fig
 
 
+def _make_cgroup_figure(db_file: Path, table_name: str) -> go.Figure | None:
+    tables = read_columns_by_key(
+        db_file, table_name, ["timestamp", "cpu_percent", "memory_current"]
+    )
+    if not tables:
+        return None
+
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    for key, table in tables.items():
+        timestamps = _to_datetimes(table["timestamp"])
+        fig.add_trace(
+            go.Scatter(x=timestamps, y=_to_list(table["cpu_percent"]), name=f"{key} cpu_percent")
+        )
+        fig.add_trace(
+            go.Scatter(
+                x=timestamps,
+                y=_to_list(table["memory_current"]),
+                name=f"{key} memory_current",
+            ),
+            secondary_y=True,
+        )
+    fig.update_yaxes(title_text="CPU Percent", secondary_y=False)
+    fig.update_yaxes(title_text="Memory (bytes)", secondary_y=True)
+    return fig
+
+
 def _make_system_stat_figure(db_file: Path, table_name: str) -> go.Figure | None:
-    table = read_table_as_dict(db_file, table_name, timestamp_column="timestamp")
-    if not next(iter(table.values())):
+    table = read_columns(db_file, table_name)
+    if not len(table["timestamp"]):
         return None
 
+    timestamps = _to_datetimes(table["timestamp"])
     fig = go.Figure()
     for column in set(table) - {"timestamp"}:
-        fig.add_trace(go.Scatter(x=table["timestamp"], y=table[column], name=column))
+        fig.add_trace(go.Scatter(x=timestamps, y=_to_list(table[column]), name=column))
+    return fig
+
+
+def _make_device_figure(db_file: Path, table_name: str, columns: list[str]) -> go.Figure | None:
+    table = read_columns(db_file, table_name, columns=["timestamp", "id", *columns])
+    if not table["id"]:
+        return None
+
+    table = {k: _to_list(v) for k, v in table.items()}
+    timestamps = sorted(set(table["timestamp"]))
+    devices = sorted(set(table["id"]), key=_natural_sort_key)
+    time_index = {x: i for i, x in enumerate(timestamps)}
+    device_index = {x: i for i, x in enumerate(devices)}
+    fig = make_subplots(
+        rows=len(columns), cols=1, shared_xaxes=True, subplot_titles=columns, vertical_spacing=0.08
+    )
+    for i, column in enumerate(columns):
+        values: list[list[Any]] = [[None] * len(timestamps) for _ in devices]
+        for timestamp, device, val in zip(table["timestamp"], table["id"], table[column]):
+            values[device_index[device]][time_index[timestamp]] = val
+        fig.add_trace(
+            go.Heatmap(
+                x=_to_datetimes(timestamps),
+                y=devices,
+                z=values,
+                name=column,
+                colorbar={"len": 1 / len(columns), "y": 1 - (i + 0.5) / len(columns)},
+            ),
+            row=i + 1,
+            col=1,
+        )
     return fig
+
+
+def _to_datetimes(timestamps: Sequence[float]) -> list[datetime]:
+    return [datetime.fromtimestamp(x) for x in timestamps]
+
+
+def _to_list(values: Any) -> list[Any]:
+    # Plotly doesn't accept arrays from the array module.
+    return values if isinstance(values, list) else values.tolist()
+
+
+def _natural_sort_key(name: str) -> list[Any]:
+    """Sort cpu2 before cpu10."""
+    return [int(x) if x.isdigit() else x for x in re.split(r"(\d+)", name)]
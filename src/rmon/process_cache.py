@@ -0,0 +1,96 @@
+"""Caches psutil.Process objects across intervals."""
+
+from collections import OrderedDict
+
+import psutil
+
+
+DEFAULT_PROCESS_CACHE_SIZE = 10_000
+
+
+class ProcessCache:
+    """Least-recently-used cache of psutil.Process objects keyed by process ID. Each lookup
+    verifies that the cached object still refers to the same process by comparing its start time
+    with that of the process that currently has the ID. Entries for processes whose IDs were
+    reused are evicted.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_PROCESS_CACHE_SIZE) -> None:
+        self._processes: OrderedDict[int, psutil.Process] = OrderedDict()
+        self._max_size = max_size
+        self._num_hits = 0
+        self._num_misses = 0
+        self._num_stale_evictions = 0
+        self._num_capacity_evictions = 0
+
+    def __contains__(self, pid: int) -> bool:
+        return pid in self._processes
+
+    def __len__(self) -> int:
+        return len(self._processes)
+
+    @property
+    def max_size(self) -> int:
+        """Return the maximum number of cached processes."""
+        return self._max_size
+
+    @max_size.setter
+    def max_size(self, max_size: int) -> None:
+        """Set the maximum number of cached processes."""
+        self._max_size = max_size
+        self._evict_to_capacity()
+
+    def get(self, pid: int) -> tuple[psutil.Process, bool]:
+        """Return the process with the ID and whether it was added to the cache by this call.
+
+        Raises
+        ------
+        psutil.NoSuchProcess
+            Raised if the process does not exist.
+        psutil.AccessDenied
+            Raised if the process cannot be accessed.
+        """
+        process = self._processes.get(pid)
+        if process is not None:
+            # is_running compares the start time of the cached process with that of the
+            # process that currently has the ID.
+            if process.is_running():
+                self._processes.move_to_end(pid)
+                self._num_hits += 1
+                return process, False
+            self._processes.pop(pid)
+            self._num_stale_evictions += 1
+
+        self._num_misses += 1
+        process = psutil.Process(pid)
+        self._processes[pid] = process
+        self._evict_to_capacity()
+        return process, True
+
+    def pids(self) -> list[int]:
+        """Return the IDs of the cached processes."""
+        return list(self._processes)
+
+    def pop(self, pid: int) -> None:
+        """Remove the process from the cache, if present."""
+        self._processes.pop(pid, None)
+
+    def clear(self) -> None:
+        """Remove all processes from the cache. The counters are not reset."""
+        self._processes.clear()
+
+    def get_stats(self) -> dict[str, int]:
+        """Return the cache counters."""
+        return {
+            "size": len(self._processes),
+            "max_size": self._max_size,
+            "hits": self._num_hits,
+            "misses": self._num_misses,
+            "stale_evictions": self._num_stale_evictions,
+            "capacity_evictions": self._num_capacity_evictions,
+        }
+
+    def _evict_to_capacity(self) -> None:
+        while len(self._processes) > self._max_size:
+            self._processes.popitem(last=False)
+            self._num_capacity_evictions += 1
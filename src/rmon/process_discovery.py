@@ -0,0 +1,107 @@
+"""Discovers processes to monitor."""
+
+import os
+import pwd
+import re
+from pathlib import Path
+from typing import Optional
+
+from loguru import logger
+
+from .models import ProcessMatchRule
+from .procfs import DEFAULT_PROCFS_ROOT, ProcfsReader, ProcStat
+
+
+class ProcessDiscoverer:
+    """Tracks the processes that match a rule. Each call to update lists the process IDs and
+    only reads the attributes of processes that were not present in the previous call. Tracked
+    processes are identified by process ID and start time, and so a tracked process ID that is
+    reused by a new process is detected.
+    """
+
+    def __init__(self, rule: ProcessMatchRule, procfs_root: str | Path = DEFAULT_PROCFS_ROOT):
+        self._rule = rule
+        self._reader = ProcfsReader(procfs_root)
+        self._cmdline_regex = (
+            None if rule.cmdline_regex is None else re.compile(rule.cmdline_regex)
+        )
+        self._uid = None if rule.username is None else pwd.getpwnam(rule.username).pw_uid
+        # Don't monitor the monitor, whose command line may contain the pattern.
+        self._excluded_pids = {os.getpid(), os.getppid()}
+        # (pid, starttime) -> process key for matching processes
+        self._tracked: dict[tuple[int, int], str] = {}
+        # IDs of processes that were checked and did not match
+        self._rejected: set[int] = set()
+
+    @property
+    def rule(self) -> ProcessMatchRule:
+        """Return the match rule."""
+        return self._rule
+
+    def get_pids(self) -> dict[str, int]:
+        """Return the matching processes that are running, keyed by process key."""
+        return {key: pid for (pid, _), key in self._tracked.items()}
+
+    def update(self) -> tuple[dict[str, int], list[str]]:
+        """Find matching processes that started and tracked processes that exited since the last
+        call.
+
+        Returns
+        -------
+        tuple
+            New processes ({process_key: pid}), keys of processes that exited
+        """
+        pids = set(self._reader.list_pids())
+        self._rejected.intersection_update(pids)
+        # Only new and tracked processes are read. The start times of tracked processes detect
+        # reused process IDs.
+        stats = self._reader.read_process_stats(
+            pids.difference(self._rejected, self._excluded_pids)
+        )
+        processes = {(pid, x.starttime) for pid, x in stats.items()}
+        exited = [self._tracked.pop(x) for x in set(self._tracked).difference(processes)]
+
+        new_pids: dict[str, int] = {}
+        for process in processes.difference(self._tracked):
+            pid = process[0]
+            key = self._match(stats[pid])
+            if key is None:
+                self._rejected.add(pid)
+            else:
+                self._tracked[process] = key
+                new_pids[key] = pid
+
+        if new_pids or exited:
+            logger.info("Discovered processes={} exited processes={}", list(new_pids), exited)
+        return new_pids, exited
+
+    def _match(self, stat: ProcStat) -> Optional[str]:
+        """Return the process key if the process matches the rule."""
+        pid = stat.pid
+        if self._rule.ppid is not None and stat.ppid != self._rule.ppid:
+            return None
+        if self._uid is not None and self._reader.read_uid(pid) != self._uid:
+            return None
+        cmdline = self._reader.read_cmdline(pid)
+        if cmdline is None:
+            return None
+        if self._cmdline_regex is not None and not self._cmdline_regex.search(" ".join(cmdline)):
+            return None
+        name = self._reader.read_name(pid)
+        if name is None:
+            return None
+        return make_process_key(name, cmdline, pid)
+
+
+def make_process_key(name: str, cmdline: list[str], pid: int) -> str:
+    """Return a unique key for a process that is suitable for plots."""
+    # Including the entire command line is often way too long.
+    # name is often better than the first arg (python instead of full path to python)
+    # This tries to get the best of all worlds and ensure uniqueness.
+    if len(cmdline) > 1:
+        name = name + " " + " ".join(cmdline[1:])
+
+    if len(name) > 20:
+        name = name[:20] + "..."
+
+    return name + f" ({pid})"
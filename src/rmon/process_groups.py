@@ -0,0 +1,119 @@
+"""Collects stats for groups of processes."""
+
+import re
+import time
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+import psutil
+from loguru import logger
+
+from .models import ProcessGroupRule
+from .procfs import DEFAULT_PROCFS_ROOT
+
+
+class ProcessGroupStatCollector:
+    """Sums the stats of all processes that match each group rule in one pass over the process
+    table. Each process is counted in the first group that it matches.
+    """
+
+    STATS = ("cpu_percent", "rss", "cpu_seconds", "num_processes")
+
+    def __init__(self, procfs_root: str | Path = DEFAULT_PROCFS_ROOT) -> None:
+        self._procfs_root = Path(procfs_root)
+        # pid -> (create time, monotonic time, user + system CPU seconds) as of the last
+        # collection
+        self._last_cpu_times: dict[int, tuple[float, float, float]] = {}
+
+    def get_stats(self, rules: Iterable[ProcessGroupRule]) -> dict[str, dict[str, Any]]:
+        """Return stats for each group, keyed by group name. Groups without any matching
+        processes are reported with zero values.
+        """
+        matchers = [_RuleMatcher(x) for x in rules]
+        attrs = ["name", "username", "create_time", "cpu_times", "memory_info"]
+        if any(x.rule.cmdline_regex is not None for x in matchers):
+            attrs.append("cmdline")
+        need_cgroup = any(x.rule.cgroup is not None for x in matchers)
+
+        stats: dict[str, dict[str, Any]] = {
+            x.rule.name: dict.fromkeys(self.STATS, 0) for x in matchers
+        }
+        cpu_times: dict[int, tuple[float, float, float]] = {}
+        now = time.monotonic()
+        for process in psutil.process_iter(attrs):
+            info = process.info
+            if info["cpu_times"] is None or info["memory_info"] is None:
+                # Access was denied or the process exited during the scan.
+                continue
+            cgroup = self._read_cgroup(process.pid) if need_cgroup else None
+            matcher = next((x for x in matchers if x.matches(info, cgroup)), None)
+            if matcher is None:
+                continue
+
+            times = info["cpu_times"]
+            cpu_seconds = times.user + times.system
+            cpu_times[process.pid] = (info["create_time"], now, cpu_seconds)
+            group = stats[matcher.rule.name]
+            group["cpu_percent"] += self._get_cpu_percent(
+                process.pid, info["create_time"], now, cpu_seconds
+            )
+            group["rss"] += info["memory_info"].rss
+            group["cpu_seconds"] += cpu_seconds + times.children_user + times.children_system
+            group["num_processes"] += 1
+
+        self._last_cpu_times = cpu_times
+        return stats
+
+    def _get_cpu_percent(
+        self, pid: int, create_time: float, now: float, cpu_seconds: float
+    ) -> float:
+        previous = self._last_cpu_times.get(pid)
+        if previous is not None and previous[0] == create_time and now > previous[1]:
+            return (cpu_seconds - previous[2]) / (now - previous[1]) * 100
+        # This process has not been seen before. Report its average utilization since it
+        # started instead of waiting for a second sample.
+        lifetime = time.time() - create_time
+        return cpu_seconds / lifetime * 100 if lifetime > 0 else 0.0
+
+    def _read_cgroup(self, pid: int) -> Optional[str]:
+        try:
+            with open(self._procfs_root / str(pid) / "cgroup", encoding="utf-8") as f:
+                for line in f:
+                    if line.startswith("0::"):
+                        return line[3:].strip()
+        except OSError:
+            logger.trace("Could not read the cgroup of PID={}", pid)
+        return None
+
+
+class _RuleMatcher:
+    """Matches processes against one group rule."""
+
+    def __init__(self, rule: ProcessGroupRule) -> None:
+        self.rule = rule
+        self._name_regex = None if rule.name_regex is None else re.compile(rule.name_regex)
+        self._cmdline_regex = (
+            None if rule.cmdline_regex is None else re.compile(rule.cmdline_regex)
+        )
+        # Match the cgroup and its descendants.
+        self._cgroup_prefix = None if rule.cgroup is None else "/" + rule.cgroup.strip("/")
+
+    def matches(self, info: dict[str, Any], cgroup: Optional[str]) -> bool:
+        """Return True if the process matches all criteria of the rule."""
+        if self._name_regex is not None and not self._name_regex.search(info["name"] or ""):
+            return False
+        if self._cmdline_regex is not None and not self._cmdline_regex.search(
+            " ".join(info["cmdline"] or [])
+        ):
+            return False
+        if self.rule.username is not None and info["username"] != self.rule.username:
+            return False
+        if self._cgroup_prefix is not None and (
+            cgroup is None
+            or (
+                cgroup != self._cgroup_prefix
+                and not cgroup.startswith(self._cgroup_prefix.rstrip("/") + "/")
+            )
+        ):
+            return False
+        return True
@@ -0,0 +1,63 @@
+"""Destinations for the results of processes that are finalized during collection."""
+
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable
+
+from loguru import logger
+
+from .models import ProcessStatResults
+
+if TYPE_CHECKING:
+    from .resource_stat_store import ResourceStatStore
+
+
+PROCESS_RESULTS_TABLE = "process_results"
+
+
+class ProcessResultSink(ABC):
+    """Base class for destinations of finalized process results"""
+
+    @abstractmethod
+    def write(self, results: list[ProcessStatResults]) -> None:
+        """Write the results of finalized processes."""
+
+    def close(self) -> None:
+        """Release any resources held by the sink."""
+
+
+class JsonLinesProcessResultSink(ProcessResultSink):
+    """Appends each result as one JSON object per line to a file."""
+
+    def __init__(self, filename: Path) -> None:
+        self._filename = filename
+
+    def write(self, results: list[ProcessStatResults]) -> None:
+        with open(self._filename, "a", encoding="utf-8") as f:
+            for result in results:
+                f.write(result.model_dump_json())
+                f.write("\n")
+        logger.debug("Wrote {} process results to {}", len(results), self._filename)
+
+
+class SqliteProcessResultSink(ProcessResultSink):
+    """Inserts each result as one row in the process_results table of the stats database. The
+    full result is stored as JSON in the results column. The rows are written through the
+    connection of the store with its next flush.
+    """
+
+    def __init__(self, store: "ResourceStatStore") -> None:
+        self._store = store
+
+    def write(self, results: list[ProcessStatResults]) -> None:
+        self._store.record_process_results(results)
+
+
+class CallbackProcessResultSink(ProcessResultSink):
+    """Passes the results to a function."""
+
+    def __init__(self, func: Callable[[list[ProcessStatResults]], None]) -> None:
+        self._func = func
+
+    def write(self, results: list[ProcessStatResults]) -> None:
+        self._func(results)
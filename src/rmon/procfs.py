@@ -0,0 +1,248 @@
+"""Reads system and process statistics directly from a Linux procfs mount."""
+
+import os
+from pathlib import Path
+from typing import Iterable, NamedTuple, Optional
+
+
+DEFAULT_PROCFS_ROOT = "/proc"
+
+
+class ProcStat(NamedTuple):
+    """Fields parsed from /proc/<pid>/stat. CPU times are in clock ticks."""
+
+    pid: int
+    ppid: int
+    utime: int
+    stime: int
+    cutime: int
+    cstime: int
+    starttime: int
+
+
+class ProcfsReader:
+    """Reads system and per-process stats from a procfs mount in bulk.
+
+    The root directory is configurable so that the reader can be pointed at fixture trees.
+    """
+
+    def __init__(self, root: str | Path = DEFAULT_PROCFS_ROOT) -> None:
+        self._root = Path(root)
+        self._clock_ticks = os.sysconf("SC_CLK_TCK")
+        self._page_size = os.sysconf("SC_PAGE_SIZE")
+        self._num_cpus = self._count_cpus()
+
+    @property
+    def clock_ticks(self) -> int:
+        """Return the number of clock ticks per second."""
+        return self._clock_ticks
+
+    @property
+    def num_cpus(self) -> int:
+        """Return the number of CPUs listed in /proc/stat."""
+        return self._num_cpus
+
+    @property
+    def root(self) -> Path:
+        """Return the procfs root directory."""
+        return self._root
+
+    def _count_cpus(self) -> int:
+        count = 0
+        with open(self._root / "stat", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("cpu") and line[3].isdigit():
+                    count += 1
+        return max(count, 1)
+
+    def read_cpu_ticks(self) -> int:
+        """Return the total number of clock ticks spent by all CPUs, from /proc/stat."""
+        with open(self._root / "stat", encoding="utf-8") as f:
+            fields = f.readline().split()
+        # user nice system idle iowait irq softirq steal. guest and guest_nice are already
+        # included in user and nice.
+        return sum(int(x) for x in fields[1:9])
+
+    def read_uptime(self) -> float:
+        """Return the system uptime in seconds, from /proc/uptime."""
+        with open(self._root / "uptime", encoding="utf-8") as f:
+            return float(f.read().split()[0])
+
+    def list_pids(self) -> list[int]:
+        """Return the IDs of all processes in the procfs."""
+        return [int(x) for x in os.listdir(self._root) if x.isdigit()]
+
+    def read_process_stat(self, pid: int) -> Optional[ProcStat]:
+        """Return the stat fields for one process. Returns None if the process does not exist."""
+        try:
+            with open(self._root / str(pid) / "stat", encoding="utf-8") as f:
+                text = f.read()
+        except (FileNotFoundError, ProcessLookupError):
+            return None
+
+        # The command name is in parentheses and may contain spaces and parentheses.
+        fields = text[text.rfind(")") + 2 :].split()
+        # fields[0] is field 3 in proc(5).
+        return ProcStat(
+            pid=pid,
+            ppid=int(fields[1]),
+            utime=int(fields[11]),
+            stime=int(fields[12]),
+            cutime=int(fields[13]),
+            cstime=int(fields[14]),
+            starttime=int(fields[19]),
+        )
+
+    def read_process_stats(self, pids: Optional[Iterable[int]] = None) -> dict[int, ProcStat]:
+        """Return the stat fields for multiple processes, keyed by pid. Processes that do not
+        exist are excluded.
+
+        Parameters
+        ----------
+        pids
+            Process IDs to read. If None, read all processes.
+        """
+        stats: dict[int, ProcStat] = {}
+        for pid in self.list_pids() if pids is None else pids:
+            stat = self.read_process_stat(pid)
+            if stat is not None:
+                stats[pid] = stat
+        return stats
+
+    def read_cmdline(self, pid: int) -> Optional[list[str]]:
+        """Return the command line arguments of one process. Returns None if the process does
+        not exist. Returns an empty list for kernel threads and zombies.
+        """
+        try:
+            with open(self._root / str(pid) / "cmdline", "rb") as f:
+                data = f.read()
+        except (FileNotFoundError, ProcessLookupError):
+            return None
+        return [x.decode(errors="replace") for x in data.split(b"\0") if x]
+
+    def read_name(self, pid: int) -> Optional[str]:
+        """Return the command name of one process. Returns None if the process does not exist."""
+        try:
+            with open(self._root / str(pid) / "comm", encoding="utf-8", errors="replace") as f:
+                return f.read().strip()
+        except (FileNotFoundError, ProcessLookupError):
+            return None
+
+    def read_uid(self, pid: int) -> Optional[int]:
+        """Return the ID of the user that owns one process. Returns None if the process does not
+        exist.
+        """
+        try:
+            return os.stat(self._root / str(pid)).st_uid
+        except FileNotFoundError:
+            return None
+
+    def read_rss(self, pid: int) -> Optional[int]:
+        """Return the resident set size in bytes for one process, from /proc/<pid>/statm.
+        Returns None if the process does not exist.
+        """
+        try:
+            with open(self._root / str(pid) / "statm", encoding="utf-8") as f:
+                return int(f.read().split()[1]) * self._page_size
+        except (FileNotFoundError, ProcessLookupError):
+            return None
+
+    def read_io(self, pid: int) -> Optional[tuple[int, int]]:
+        """Return the bytes read from and written to storage by one process, from
+        /proc/<pid>/io. Returns None if the process does not exist or the file is not readable.
+        """
+        values = dict(self._read_key_values(pid, "io", ":"))
+        if not values:
+            return None
+        return int(values["read_bytes"]), int(values["write_bytes"])
+
+    def read_status(self, pid: int) -> dict[str, int]:
+        """Return the number of threads and the voluntary and involuntary context switches of
+        one process, from /proc/<pid>/status. Returns an empty dict if the process does not exist.
+        """
+        names = ("Threads", "voluntary_ctxt_switches", "nonvoluntary_ctxt_switches")
+        return {
+            name: int(val.split()[0])
+            for name, val in self._read_key_values(pid, "status", ":")
+            if name in names
+        }
+
+    def count_fds(self, pid: int) -> int:
+        """Return the number of open file descriptors of one process. Returns 0 if the process
+        does not exist or the directory is not readable.
+        """
+        try:
+            return len(os.listdir(self._root / str(pid) / "fd"))
+        except OSError:
+            return 0
+
+    def read_smaps_rollup(self, pid: int) -> Optional[tuple[int, int]]:
+        """Return the unique and proportional set sizes in bytes of one process, from
+        /proc/<pid>/smaps_rollup. This is expensive because the kernel walks all memory mappings
+        of the process. Returns None if the process does not exist or the file is not readable.
+        """
+        names = ("Pss", "Private_Clean", "Private_Dirty", "Private_Hugetlb")
+        # The first line is the address range of the mappings, and the rest are sizes in kB.
+        values = {
+            name: int(val.split()[0]) * 1024
+            for name, val in self._read_key_values(pid, "smaps_rollup", ":")
+            if name in names
+        }
+        if not values:
+            return None
+        uss = sum(values.get(x, 0) for x in names[1:])
+        return uss, values.get("Pss", 0)
+
+    def _read_key_values(self, pid: int, filename: str, separator: str) -> list[tuple[str, str]]:
+        try:
+            with open(self._root / str(pid) / filename, encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except (OSError, ProcessLookupError):
+            return []
+        pairs = []
+        for line in lines:
+            name, sep, val = line.partition(separator)
+            if sep:
+                pairs.append((name, val.strip()))
+        return pairs
+
+
+PRESSURE_RESOURCES = ("cpu", "memory", "io")
+VMSTAT_COUNTERS = ("pgfault", "pgmajfault", "pgpgin", "pgpgout", "pswpin", "pswpout", "oom_kill")
+
+
+def read_pressure_totals(root: str | Path = DEFAULT_PROCFS_ROOT) -> dict[str, int]:
+    """Return the cumulative stall times in microseconds from /proc/pressure, keyed by
+    '<resource>_<some|full>'. Stall times are zero if the kernel does not support pressure stall
+    information.
+    """
+    totals: dict[str, int] = {}
+    for resource in PRESSURE_RESOURCES:
+        totals[f"{resource}_some"] = 0
+        totals[f"{resource}_full"] = 0
+        try:
+            with open(Path(root) / "pressure" / resource, encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            # The kernel does not support PSI or it is disabled.
+            continue
+        # Example: some avg10=0.00 avg60=0.00 avg300=0.00 total=0
+        for line in lines:
+            fields = line.split()
+            if fields and fields[0] in ("some", "full"):
+                totals[f"{resource}_{fields[0]}"] = int(fields[-1].partition("=")[2])
+    return totals
+
+
+def read_vmstat(root: str | Path = DEFAULT_PROCFS_ROOT) -> dict[str, int]:
+    """Return the counters in VMSTAT_COUNTERS from /proc/vmstat. Missing counters are zero."""
+    counters = dict.fromkeys(VMSTAT_COUNTERS, 0)
+    try:
+        with open(Path(root) / "vmstat", encoding="utf-8") as f:
+            for line in f:
+                name, _, val = line.partition(" ")
+                if name in counters:
+                    counters[name] = int(val)
+    except FileNotFoundError:
+        pass
+    return counters
@@ -7,7 +7,7 @@ import socket
 import sys
 import time
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Callable, Optional
 
 from loguru import logger
 from .common import DEFAULT_BUFFERED_WRITE_COUNT
@@ -18,13 +18,26 @@ from .models import (
     CommandBaseModel,
     ComputeNodeResourceStatResults,
     ComputeNodeProcessResourceStatResults,
+    ProcessStatResults,
     SelectStatsCommand,
     ShutDownCommand,
+    SnapshotCommand,
     UpdatePidsCommand,
 )
+from .process_discovery import ProcessDiscoverer
+from .process_result_sinks import (
+    CallbackProcessResultSink,
+    JsonLinesProcessResultSink,
+    ProcessResultSink,
+    SqliteProcessResultSink,
+)
 from .resource_stat_collector import ResourceStatCollector
 from .resource_stat_aggregator import ResourceStatAggregator
 from .resource_stat_store import ResourceStatStore
+from .scheduler import FixedRateScheduler
+
+
+_g_collect_stats = True
 
 
 def run_monitor_async(
@@ -55,7 +68,6 @@ def run_monitor_async(
     logger.info("Monitor resource utilization with config={}", config)
     collector = ResourceStatCollector()
     stats = collector.get_stats(ComputeNodeResourceStatConfig.all_enabled(), pids={})
-    agg = ResourceStatAggregator(config, stats)
     if config.monitor_type == "periodic" and db_file is None:
         msg = "path must be set if monitor_type is periodic"
         raise ValueError(msg)
@@ -66,30 +78,47 @@ def run_monitor_async(
         if config.monitor_type == "periodic" and db_file is not None
         else None
     )
+    agg = ResourceStatAggregator(
+        config, stats, process_result_sinks=_make_process_result_sinks(config, store)
+    )
 
     results = None
-    cmd_poll_interval = 1
-    last_job_poll_time = 0.0
-    while True:
-        if conn.poll():
+    signal.signal(signal.SIGTERM, _sigterm_handler)
+    discovered = _DiscoveredProcesses(config)
+    snapshots = _PeriodicSnapshots(config)
+    scheduler = FixedRateScheduler(config.interval)
+    while _g_collect_stats:
+        # Sleep until either a command arrives or the next collection is due.
+        if multiprocessing.connection.wait([conn], timeout=scheduler.time_until_next_tick()):
             cmd, results = _process_command(conn, agg, store, config)
             if isinstance(cmd, ShutDownCommand):
                 break
             pids = cmd.pids
+            config = agg.config
+            scheduler.interval = config.interval
+            discovered.update_config(config, agg)
 
-        cur_time = time.time()
-        if cur_time - last_job_poll_time > config.interval:
+        if scheduler.is_tick_due():
+            scheduler.start_tick()
             logger.debug("Collect stats")
-            stats = collector.get_stats(config, pids=pids)
-            agg.update_stats(stats)
+            stats = collector.get_stats(config, pids=discovered.update(pids, agg))
+            capture_times = collector.get_capture_times()
+            agg.update_stats(stats, timestamps=capture_times)
             if store is not None:
-                store.record_stats(stats)
-            last_job_poll_time = cur_time
-
-        time.sleep(cmd_poll_interval)
+                store.record_stats(stats, timestamps=capture_times)
+            snapshots.update(config, agg)
+            scheduler.complete_tick()
 
-    conn.send(results)
+    if results is not None:
+        results[1].results[:0] = discovered.finalize(agg)
+        conn.send(results)
+    elif store is not None:
+        # The monitor received SIGTERM instead of a ShutDownCommand.
+        store.close()
+    _log_stats(scheduler, collector, store)
+    agg.close()
     collector.clear_cache()
+    collector.shutdown()
 
 
 def _process_command(
@@ -112,6 +141,8 @@ def _process_command(
         agg.config = config
         if store is not None:
             store.config = config
+    elif isinstance(cmd, SnapshotCommand):
+        conn.send(agg.get_snapshot())
     elif isinstance(cmd, UpdatePidsCommand):
         config = cmd.config
         agg.config = config
@@ -120,7 +151,7 @@ def _process_command(
     elif isinstance(cmd, ShutDownCommand):
         results = (agg.finalize_system_stats(), agg.finalize_process_stats(cmd.pids))
         if store is not None:
-            store.flush()
+            store.close()
             if config.make_plots:
                 store.plot_to_file()
     else:
@@ -130,9 +161,6 @@ def _process_command(
     return cmd, results
 
 
-_g_collect_stats = True
-
-
 def run_monitor_sync(
     config: ComputeNodeResourceStatConfig,
     pids: dict[str, int],
@@ -140,6 +168,7 @@ def run_monitor_sync(
     db_file: Path | None = None,
     name: str = socket.gethostname(),
     buffered_write_count: int = DEFAULT_BUFFERED_WRITE_COUNT,
+    process_results_callback: Optional[Callable[[list[ProcessStatResults]], None]] = None,
 ) -> tuple[ComputeNodeResourceStatResults, ComputeNodeProcessResourceStatResults]:
     """Run a ResourceStatAggregator in a loop.
 
@@ -153,11 +182,13 @@ def run_monitor_sync(
     duration : int | None
     buffered_write_count : int
         Number of intervals to cache in memory before persisting to database.
+    process_results_callback : Callable | None
+        Optional function that receives the results of processes that are finalized because
+        of config.process_finalize_grace_period.
     """
     logger.info("Monitor resource utilization with config={} duration={}", config, duration)
     collector = ResourceStatCollector()
     stats = collector.get_stats(ComputeNodeResourceStatConfig.all_enabled(), pids={})
-    agg = ResourceStatAggregator(config, stats)
     if config.monitor_type == "periodic" and db_file is None:
         msg = "db_file must be set if monitor_type is periodic"
         raise ValueError(msg)
@@ -168,30 +199,157 @@ def run_monitor_sync(
         if config.monitor_type == "periodic" and db_file is not None
         else None
     )
+    agg = ResourceStatAggregator(
+        config,
+        stats,
+        process_result_sinks=_make_process_result_sinks(
+            config, store, callback=process_results_callback
+        ),
+    )
 
     signal.signal(signal.SIGTERM, _sigterm_handler)
-    start_time = time.time()
+    discovered = _DiscoveredProcesses(config)
+    snapshots = _PeriodicSnapshots(config)
+    scheduler = FixedRateScheduler(config.interval)
+    start_time = time.monotonic()
     try:
-        while _g_collect_stats and (duration is None or time.time() - start_time < duration):
+        while _g_collect_stats and (duration is None or time.monotonic() - start_time < duration):
+            scheduler.start_tick()
             logger.debug("Collect stats")
-            stats = collector.get_stats(config, pids=pids)
-            agg.update_stats(stats)
+            stats = collector.get_stats(config, pids=discovered.update(pids, agg))
+            capture_times = collector.get_capture_times()
+            agg.update_stats(stats, timestamps=capture_times)
             if store is not None:
-                store.record_stats(stats)
-
-            time.sleep(config.interval)
+                store.record_stats(stats, timestamps=capture_times)
+            snapshots.update(config, agg)
+            scheduler.complete_tick()
+            scheduler.wait_for_next_tick()
     except KeyboardInterrupt:
         print("Detected Ctrl-c...exiting", file=sys.stderr)
 
     system_results = agg.finalize_system_stats()
     process_results = agg.finalize_process_stats(pids)
+    process_results.results[:0] = discovered.finalize(agg)
+    if store is not None:
+        store.close()
+    _log_stats(scheduler, collector, store)
     if store is not None:
-        store.flush()
         store.plot_to_file()
+    agg.close()
     collector.clear_cache()
+    collector.shutdown()
     return system_results, process_results
 
 
+def _log_stats(
+    scheduler: FixedRateScheduler,
+    collector: ResourceStatCollector,
+    store: Optional[ResourceStatStore],
+) -> None:
+    """Log the stats of the monitor's components at shutdown."""
+    logger.info("Scheduler stats: {}", scheduler.get_stats())
+    logger.info("Process cache stats: {}", collector.get_process_cache_stats())
+    tier_costs = collector.get_process_tier_costs()
+    if tier_costs:
+        logger.info("Process tier costs: {}", tier_costs)
+    if store is not None:
+        logger.info("Store write stats: {}", store.get_write_stats())
+
+
+def _make_process_result_sinks(
+    config: ComputeNodeResourceStatConfig,
+    store: Optional[ResourceStatStore],
+    callback: Optional[Callable[[list[ProcessStatResults]], None]] = None,
+) -> list[ProcessResultSink]:
+    """Return the destinations for the results of processes that are finalized during
+    collection.
+    """
+    sinks: list[ProcessResultSink] = []
+    if config.process_results_file is not None:
+        sinks.append(JsonLinesProcessResultSink(Path(config.process_results_file)))
+    if store is not None:
+        sinks.append(SqliteProcessResultSink(store))
+    if callback is not None:
+        sinks.append(CallbackProcessResultSink(callback))
+    return sinks
+
+
+class _PeriodicSnapshots:
+    """Appends snapshots of the current summaries to a file at the snapshot interval of the
+    config.
+    """
+
+    def __init__(self, config: ComputeNodeResourceStatConfig) -> None:
+        self._check_config(config)
+        self._last_time = time.monotonic()
+
+    @staticmethod
+    def _check_config(config: ComputeNodeResourceStatConfig) -> None:
+        if config.snapshot_interval is not None and config.snapshot_file is None:
+            msg = "snapshot_file must be set if snapshot_interval is set"
+            raise ValueError(msg)
+
+    def update(self, config: ComputeNodeResourceStatConfig, agg: ResourceStatAggregator) -> None:
+        """Append a snapshot if the interval has elapsed since the previous one."""
+        if config.snapshot_interval is None:
+            return
+        now = time.monotonic()
+        if now - self._last_time < config.snapshot_interval:
+            return
+        self._check_config(config)
+        assert config.snapshot_file is not None
+        self._last_time = now
+        with open(config.snapshot_file, "a", encoding="utf-8") as f:
+            f.write(agg.get_snapshot().model_dump_json())
+            f.write("\n")
+
+
+class _DiscoveredProcesses:
+    """Tracks the processes found by the process_match rule of the config. Processes that exit
+    are finalized to the process result sinks of the aggregator.
+    """
+
+    def __init__(self, config: ComputeNodeResourceStatConfig) -> None:
+        self._discoverer = self._make_discoverer(config)
+
+    @staticmethod
+    def _make_discoverer(config: ComputeNodeResourceStatConfig) -> Optional[ProcessDiscoverer]:
+        if config.process_match is None:
+            return None
+        return ProcessDiscoverer(config.process_match, procfs_root=config.procfs_root)
+
+    def update(self, pids: dict[str, int], agg: ResourceStatAggregator) -> dict[str, int]:
+        """Find new matching processes, finalize the ones that exited, and return all processes
+        to monitor in the current interval.
+        """
+        if self._discoverer is None:
+            return pids
+        _, exited = self._discoverer.update()
+        if exited:
+            agg.finalize_exited_processes(exited)
+        return {**pids, **self._discoverer.get_pids()}
+
+    def update_config(
+        self, config: ComputeNodeResourceStatConfig, agg: ResourceStatAggregator
+    ) -> None:
+        """Start a new discovery if the rule changed."""
+        rule = None if self._discoverer is None else self._discoverer.rule
+        if rule != config.process_match:
+            if self._discoverer is not None:
+                agg.finalize_exited_processes(self._discoverer.get_pids())
+            self._discoverer = self._make_discoverer(config)
+
+    def finalize(self, agg: ResourceStatAggregator) -> list[ProcessStatResults]:
+        """Finalize the running processes and return their results and the results of the
+        exited processes that were not written to a sink.
+        """
+        results = agg.pop_exited_process_results()
+        if self._discoverer is not None:
+            keys = list(self._discoverer.get_pids())
+            results += agg.finalize_process_stats(keys).results
+        return results
+
+
 def _sigterm_handler(signum, frame):  # pylint: disable=unused-argument
     global _g_collect_stats  # pylint: disable=global-statement
     print("Detected SIGTERM", file=sys.stderr)
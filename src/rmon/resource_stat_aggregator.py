@@ -1,89 +1,211 @@
 """Aggregates resource stats"""
 
+import math
+import operator
 import socket
 import sys
-from collections import defaultdict
-from typing import Any, Iterable
+import time
+from collections import deque
+from itertools import chain, islice, repeat
+from typing import Any, Iterable, NamedTuple
+
+from loguru import logger
 
 from .models import (
     ComputeNodeResourceStatResults,
     ComputeNodeProcessResourceStatResults,
+    KeyedStatResults,
     ProcessStatResults,
     ResourceStatResults,
+    ResourceStatSnapshot,
     ResourceType,
     ComputeNodeResourceStatConfig,
 )
+from .process_result_sinks import ProcessResultSink
+from .sketches import DDSketch
+
+try:
+    import numpy as np  # type: ignore
+except ImportError:
+    np = None
 
 
 class ResourceStatAggregator:
     """Aggregates resource utilization stats in memory."""
 
     def __init__(
-        self, config: ComputeNodeResourceStatConfig, stats: dict[ResourceType, dict[str, Any]]
+        self,
+        config: ComputeNodeResourceStatConfig,
+        stats: dict[ResourceType, dict[str, Any]],
+        process_result_sinks: Iterable[ProcessResultSink] = (),
     ) -> None:
+        """Constructs ResourceStatAggregator.
+
+        Parameters
+        ----------
+        config : ComputeNodeResourceStatConfig
+        stats : dict
+            Initial stats, as returned by ResourceStatCollector.get_stats
+        process_result_sinks : Iterable[ProcessResultSink]
+            Destinations for the results of processes that are finalized automatically because
+            of process_finalize_grace_period. If empty, those results are kept in memory until
+            they are requested through finalize_process_stats.
+        """
         self._config = config
-        self._count: dict[ResourceType, int] = {}
         self._last_stats = stats
-        self._summaries: dict[str, dict[ResourceType, dict[str, float]]] = {
-            "average": defaultdict(dict),
-            "maximum": defaultdict(dict),
-            "minimum": defaultdict(dict),
-            "sum": defaultdict(dict),
-        }
-        # TODO: max rolling average would be nice
-        for resource_type in ComputeNodeResourceStatConfig.list_system_resource_types():
-            self._count[resource_type] = 0
-
-        for resource_type, stat_dict in self._last_stats.items():
-            if resource_type != ResourceType.PROCESS:
-                for stat_name in stat_dict:
-                    self._summaries["average"][resource_type][stat_name] = 0.0
-                    self._summaries["maximum"][resource_type][stat_name] = 0.0
-                    self._summaries["minimum"][resource_type][stat_name] = sys.maxsize
-                    self._summaries["sum"][resource_type][stat_name] = 0.0
-
-        self._process_summaries: dict[str, dict[str, dict[str, float]]] = {
-            "average": defaultdict(dict),
-            "maximum": defaultdict(dict),
-            "minimum": defaultdict(dict),
-            "sum": defaultdict(dict),
+        self._system_summaries = _FlatStatSummaries(initial_weight=config.interval)
+        system_resource_types = ComputeNodeResourceStatConfig.list_system_resource_types()
+        self._system_resource_types = [x for x in self._last_stats if x in system_resource_types]
+        for resource_type in self._system_resource_types:
+            self._system_summaries.add_key(
+                resource_type, self._last_stats[resource_type], maximum=0.0, minimum=sys.maxsize
+            )
+
+        self._system_peak_averages = _PeakWindowAverages(
+            config.peak_average_windows, config.interval
+        )
+        self._process_peak_averages = _PeakWindowAverages(
+            config.peak_average_windows, config.interval
+        )
+        self._system_sketches = _StatSketches(config.percentiles, config.sketch_relative_accuracy)
+        self._process_sketches = _StatSketches(config.percentiles, config.sketch_relative_accuracy)
+        self._process_summaries = _KeyedStatSummaries(initial_weight=config.interval)
+        # Monotonic time at which each process key was last sampled
+        self._process_last_seen: dict[str, float] = {}
+        self._process_result_sinks = list(process_result_sinks)
+        # Results of processes that were finalized automatically and not written to a sink
+        self._auto_finalized_results: dict[str, ProcessStatResults] = {}
+        self._num_dropped_results = 0
+        # Summaries for resource types that are reported per cgroup or per device
+        self._keyed_summaries = {
+            x: _KeyedStatSummaries(initial_weight=config.interval)
+            for x in [ResourceType.PROCESS_GROUP, ResourceType.CGROUP]
+            + ComputeNodeResourceStatConfig.list_device_resource_types()
         }
-        self._process_sample_count: dict[str, int] = {}
 
     def finalize_process_stats(
         self, completed_process_keys: Iterable[str]
     ) -> ComputeNodeProcessResourceStatResults:
         """Finalize stat summaries for completed processes."""
         # Note that short-lived processes may not be present.
-        processes = set(completed_process_keys).intersection(self._process_sample_count)
+        keys = set(completed_process_keys)
+        results = [
+            self._auto_finalized_results.pop(x)
+            for x in keys.intersection(self._auto_finalized_results)
+        ]
+        results += self._make_process_results(keys)
+        return ComputeNodeProcessResourceStatResults(
+            hostname=socket.gethostname(),
+            results=results,
+        )
+
+    def get_snapshot(self) -> ResourceStatSnapshot:
+        """Return the current system and process summaries without resetting them. Processes
+        that were already finalized are not included.
+        """
+        hostname = socket.gethostname()
+        process_results = self._make_process_results(
+            self._process_summaries.keys(), finalize=False
+        )
+        return ResourceStatSnapshot(
+            timestamp=time.time(),
+            system_results=self._make_system_results(finalize=False),
+            process_results=ComputeNodeProcessResourceStatResults(
+                hostname=hostname, results=process_results
+            ),
+        )
+
+    def _make_process_results(
+        self, keys: Iterable[str], finalize: bool = True
+    ) -> list[ProcessStatResults]:
+        """Make the results of the processes. If finalize is True, remove their summaries."""
+        keys = list(keys)
+        if finalize:
+            for key in keys:
+                self._process_last_seen.pop(key, None)
+            summaries = self._process_summaries.finalize(keys)
+            sketches_func = self._process_sketches.pop
+            peak_averages_func = self._process_peak_averages.pop
+        else:
+            summaries = [(x, self._process_summaries.get_summary(x)) for x in keys]
+            sketches_func = self._process_sketches.get
+            peak_averages_func = self._process_peak_averages.get
         results = []
-        for key in processes:
-            stat_dict = self._process_summaries["sum"][key]
-            for stat_name, val in stat_dict.items():
-                self._process_summaries["average"][key][stat_name] = (
-                    val / self._process_sample_count[key]
+        for key, summary in summaries:
+            percentiles, sketches = sketches_func(key)
+            results.append(
+                ProcessStatResults(
+                    process_key=key,
+                    resource_type=ResourceType.PROCESS,
+                    **summary._asdict(),
+                    # cpu_seconds is cumulative, and so its maximum is the total.
+                    total_cpu_seconds=summary.maximum.get("cpu_seconds"),
+                    percentiles=percentiles,
+                    sketches=sketches,
+                    peak_averages=peak_averages_func(key),
                 )
+            )
+        return results
+
+    def _finalize_exited_processes(self, now: float) -> None:
+        """Finalize the processes that were not sampled at time now or within the grace period
+        before it.
+        """
+        grace_period = self._config.process_finalize_grace_period
+        if grace_period is None:
+            return
+        expired = [
+            k for k, v in self._process_last_seen.items() if v < now and now - v >= grace_period
+        ]
+        if not expired:
+            return
+        self.finalize_exited_processes(expired)
 
-        for key in processes:
-            samples = self._process_sample_count[key]
-            result = ProcessStatResults(
-                process_key=key,
-                num_samples=samples,
-                resource_type=ResourceType.PROCESS,
-                average=self._process_summaries["average"][key],
-                minimum=self._process_summaries["minimum"][key],
-                maximum=self._process_summaries["maximum"][key],
+    def finalize_exited_processes(self, process_keys: Iterable[str]) -> None:
+        """Finalize processes that exited during collection. Their results are written to the
+        process result sinks, if any, and otherwise up to config.max_kept_process_results of
+        them are kept until they are requested through finalize_process_stats or
+        pop_exited_process_results. The oldest ones are dropped beyond that.
+        """
+        results = self._make_process_results(process_keys)
+        if not results:
+            return
+        logger.info("Finalized exited processes={}", [x.process_key for x in results])
+        if self._process_result_sinks:
+            for sink in self._process_result_sinks:
+                sink.write(results)
+        else:
+            self._keep_process_results(results)
+
+    def _keep_process_results(self, results: list[ProcessStatResults]) -> None:
+        kept = self._auto_finalized_results
+        kept.update((x.process_key, x) for x in results)
+        num_dropped = len(kept) - self._config.max_kept_process_results
+        if num_dropped > 0:
+            for key in list(islice(kept, num_dropped)):
+                kept.pop(key)
+            self._num_dropped_results += num_dropped
+            logger.warning(
+                "Dropped the results of {} finalized processes ({} in total) because there is no "
+                "process result sink and max_kept_process_results={}. Set a process results file "
+                "to keep them.",
+                num_dropped,
+                self._num_dropped_results,
+                self._config.max_kept_process_results,
             )
-            results.append(result)
 
-            for stats in self._process_summaries.values():
-                stats.pop(key)
-            self._process_sample_count.pop(key)
+    def pop_exited_process_results(self) -> list[ProcessStatResults]:
+        """Return and remove the results of the exited processes that were not written to a
+        sink.
+        """
+        results = list(self._auto_finalized_results.values())
+        self._auto_finalized_results.clear()
+        return results
 
-        return ComputeNodeProcessResourceStatResults(
-            hostname=socket.gethostname(),
-            results=results,
-        )
+    def close(self) -> None:
+        """Close the process result sinks."""
+        for sink in self._process_result_sinks:
+            sink.close()
 
     def finalize_system_stats(self) -> ComputeNodeResourceStatResults:
         """Finalize the system-level stat summaries and return the results.
@@ -92,29 +214,47 @@ class ResourceStatAggregator:
         -------
         ComputeNodeResourceStatResults
         """
+        return self._make_system_results(finalize=True)
+
+    def _make_system_results(self, finalize: bool) -> ComputeNodeResourceStatResults:
+        """Make the system-level results. If finalize is True, remove the keyed summaries and
+        the sketches and sliding windows of the system stats.
+        """
         hostname = socket.gethostname()
+        if finalize:
+            sketches_func = self._system_sketches.pop
+            peak_averages_func = self._system_peak_averages.pop
+        else:
+            sketches_func = self._system_sketches.get
+            peak_averages_func = self._system_peak_averages.get
         results: list[ResourceStatResults] = []
-        resource_types: list[ResourceType] = []
-
-        for rtype, stat_dict in self._summaries["sum"].items():
-            if self._count[rtype] > 0:
-                for stat_name, val in stat_dict.items():
-                    self._summaries["average"][rtype][stat_name] = val / self._count[rtype]
-                resource_types.append(rtype)
-
-        self._summaries.pop("sum")
-        for resource_type in resource_types:
+        sampled_types = set(self._system_summaries.keys())
+        for resource_type in self._system_resource_types:
+            if resource_type not in sampled_types:
+                continue
+            percentiles, sketches = sketches_func(resource_type)
             results.append(
                 ResourceStatResults(
                     resource_type=resource_type,
-                    average=self._summaries["average"][resource_type],
-                    minimum=self._summaries["minimum"][resource_type],
-                    maximum=self._summaries["maximum"][resource_type],
-                    num_samples=self._count[resource_type],
+                    **self._system_summaries.get_summary(resource_type)._asdict(),
+                    percentiles=percentiles,
+                    sketches=sketches,
+                    peak_averages=peak_averages_func(resource_type),
                 ),
             )
 
-        return ComputeNodeResourceStatResults(hostname=hostname, results=results)
+        keyed_results = [
+            KeyedStatResults(key=key, resource_type=resource_type, **summary._asdict())
+            for resource_type, summaries in self._keyed_summaries.items()
+            for key, summary in (
+                summaries.finalize(list(summaries.keys()))
+                if finalize
+                else [(x, summaries.get_summary(x)) for x in summaries.keys()]
+            )
+        ]
+        return ComputeNodeResourceStatResults(
+            hostname=hostname, results=results, keyed_results=keyed_results
+        )
 
     @property
     def config(self) -> ComputeNodeResourceStatConfig:
@@ -126,38 +266,658 @@ class ResourceStatAggregator:
         """Set the selected stats config."""
         self._config = config
 
-    def update_stats(self, cur_stats: dict[ResourceType, Any]):
-        """Update resource stats information for the current interval."""
-        enabled_types = (
-            x for x in ComputeNodeResourceStatConfig.list_system_resource_types() if x in cur_stats
+    def update_stats(
+        self,
+        cur_stats: dict[ResourceType, Any],
+        timestamps: dict[ResourceType, float] | None = None,
+    ):
+        """Update resource stats information for the current interval.
+
+        Parameters
+        ----------
+        cur_stats : dict
+            Stats keyed by resource type, as returned by ResourceStatCollector.get_stats
+        timestamps : dict | None
+            Optional capture times (seconds since the epoch) keyed by resource type, as returned
+            by ResourceStatCollector.get_capture_times. They weight the time-weighted averages.
+            Resource types without a capture time use the current time.
+        """
+        now = time.time()
+        timestamps = timestamps or {}
+        system_stats = {
+            x: cur_stats[x]
+            for x in ComputeNodeResourceStatConfig.list_system_resource_types()
+            if x in cur_stats
+        }
+        self._system_summaries.update(
+            system_stats, {x: timestamps.get(x, now) for x in system_stats}
         )
-        for resource_type in enabled_types:
-            _compute_stats(cur_stats[resource_type], self._summaries, resource_type)
-            self._count[resource_type] += 1
-
-        if self._config.process:
-            for process_key, stat_dict in cur_stats[ResourceType.PROCESS].items():
-                if process_key in self._process_summaries["maximum"]:
-                    _compute_stats(stat_dict, self._process_summaries, process_key)
-                    self._process_sample_count[process_key] += 1
-                else:
-                    for stat_name, val in stat_dict.items():
-                        self._process_summaries["maximum"][process_key][stat_name] = val
-                        self._process_summaries["minimum"][process_key][stat_name] = val
-                        self._process_summaries["sum"][process_key][stat_name] = val
-                    self._process_sample_count[process_key] = 1
+        self._system_sketches.update_keys(system_stats)
+        self._system_peak_averages.update_keys(system_stats)
+
+        if self._config.process and ResourceType.PROCESS in cur_stats:
+            self._process_summaries.update(
+                cur_stats[ResourceType.PROCESS], timestamps.get(ResourceType.PROCESS, now)
+            )
+            self._process_sketches.update_keys(cur_stats[ResourceType.PROCESS])
+            self._process_peak_averages.update_keys(cur_stats[ResourceType.PROCESS])
+            if self._config.process_finalize_grace_period is not None:
+                seen_time = time.monotonic()
+                self._process_last_seen.update(
+                    dict.fromkeys(cur_stats[ResourceType.PROCESS], seen_time)
+                )
+                self._finalize_exited_processes(seen_time)
+        for resource_type, summaries in self._keyed_summaries.items():
+            if getattr(self._config, resource_type.value) and resource_type in cur_stats:
+                summaries.update(cur_stats[resource_type], timestamps.get(resource_type, now))
 
         self._last_stats = cur_stats
 
 
-def _compute_stats(
-    cur_stats: dict[str, float],
-    base_stats: dict[str, dict[Any, dict[str, float]]],
-    stat_key: ResourceType | str,
-) -> None:
-    for stat_name, val in cur_stats.items():
-        if val > base_stats["maximum"][stat_key][stat_name]:
-            base_stats["maximum"][stat_key][stat_name] = val
-        elif val < base_stats["minimum"][stat_key][stat_name]:
-            base_stats["minimum"][stat_key][stat_name] = val
-        base_stats["sum"][stat_key][stat_name] += val
+class _Summary(NamedTuple):
+    """Summary of the stats of one key. The field names match those of ResourceStatResults."""
+
+    num_samples: int
+    average: dict[str, float]
+    minimum: dict[str, float]
+    maximum: dict[str, float]
+    variance: dict[str, float]
+    standard_deviation: dict[str, float]
+    time_weighted_average: dict[str, float]
+
+
+# Positions of the columns of an update: a range if they are contiguous, which lets the list
+# columns use slices, or an index array for the NumPy columns
+_Positions = Any
+
+
+class _FlatStatSummaries:
+    """Summaries of the stats of each key, stored in flat columns with a stable stat -> column
+    index per key. Each stat has constant state: its maximum, minimum, sum, number of values,
+    running mean and sum of squared deviations (Welford's algorithm), and the sums of its values
+    weighted by elapsed time and of those weights.
+
+    Each value is weighted by the time elapsed since the previous sample of its key. The first
+    sample of a key is weighted by initial_weight, typically the collection interval.
+
+    The columns of a key stay in place when other keys are added or removed. New keys, and keys
+    with new stats, are appended to the end, and the columns are compacted once more than half of
+    them belong to removed keys. Every update gathers the columns of its values, updates them all
+    at once, and scatters them back. The positions are cached while the keys and stat names of
+    the updates don't change, which is the common case.
+
+    If use_numpy is True and NumPy is installed, the columns are NumPy arrays with vectorized
+    updates, and otherwise Python lists with one comprehension per summary. NumPy stores the
+    values as 64-bit floats and converts the extremes of integer stats back to int, and so
+    integers above 2**53 lose precision. The list columns keep the values as they are.
+
+    As in the original dict-based implementation, a minimum is only lowered by a value that does
+    not set a new maximum. This only matters while a minimum is greater than its maximum, such as
+    with the initial system summaries, which use list columns.
+    """
+
+    def __init__(self, initial_weight: float = 0.0, use_numpy: bool = False) -> None:
+        self._initial_weight = initial_weight
+        self._columns: _ListColumns | _NumpyColumns = (
+            _NumpyColumns() if use_numpy and np is not None else _ListColumns()
+        )
+        # key -> (offset of its first column, stat names)
+        self._layout: dict[Any, tuple[int, tuple[str, ...]]] = {}
+        # Number of columns of removed keys
+        self._num_unused_columns = 0
+        self._num_samples: dict[Any, int] = {}
+        # Time of the last sample of each key
+        self._last_time: dict[Any, float] = {}
+        # Keys, stat names, and column positions of the previous update
+        self._cached_keys: tuple[Any, ...] = ()
+        self._cached_stats: tuple[tuple[str, ...], ...] = ()
+        self._cached_lengths: tuple[int, ...] = ()
+        self._cached_positions: _Positions = None
+        # Number of updates of the cached keys not yet added to _num_samples
+        self._num_cached_updates = 0
+
+    def keys(self) -> Iterable[Any]:
+        """Return the keys that have been sampled at least once."""
+        self._add_cached_updates()
+        return [k for k, v in self._num_samples.items() if v > 0]
+
+    def add_key(self, key: Any, stat_names: Iterable[str], maximum: Any, minimum: Any) -> None:
+        """Add a key with initial values for each stat and a sum of zero."""
+        stat_names = tuple(stat_names)
+        num_stats = len(stat_names)
+        offset = self._columns.append([maximum] * num_stats, [minimum] * num_stats)
+        self._layout[key] = (offset, stat_names)
+        self._num_samples[key] = 0
+
+    def update(
+        self, cur_stats: dict[Any, dict[str, float]], timestamps: float | dict[Any, float]
+    ) -> None:
+        """Update the summaries with the stats for each key in the current interval. The first
+        values of a new key or stat initialize its summaries.
+
+        Parameters
+        ----------
+        cur_stats : dict
+            Stats keyed by key
+        timestamps : float | dict
+            Time of the samples, for all keys or per key
+        """
+        keys = tuple(cur_stats)
+        stats = tuple(map(tuple, cur_stats.values()))
+        vals = list(chain.from_iterable(map(dict.values, cur_stats.values())))
+        if (
+            self._cached_positions is None
+            or keys != self._cached_keys
+            or stats != self._cached_stats
+        ):
+            self._add_cached_updates()
+            self._cached_positions = self._columns.make_positions(self._find_positions(cur_stats))
+            self._cached_keys = keys
+            self._cached_stats = stats
+            self._cached_lengths = tuple(map(len, stats))
+
+        times = (
+            [timestamps[x] for x in keys]
+            if isinstance(timestamps, dict)
+            else [timestamps] * len(keys)
+        )
+        elapsed = [
+            # A clock that moved backwards gives a weight of zero rather than a negative one.
+            self._initial_weight if last is None else (t - last if t > last else 0.0)
+            for t, last in zip(times, map(self._last_time.get, keys))
+        ]
+        self._last_time.update(zip(keys, times))
+        self._columns.update(self._cached_positions, vals, elapsed, self._cached_lengths)
+        self._num_cached_updates += 1
+
+    def get_summary(self, key: Any) -> _Summary:
+        """Return the summary of the key."""
+        self._add_cached_updates()
+        samples = self._num_samples[key]
+        offset, names = self._layout[key]
+        end = offset + len(names)
+        columns = self._columns
+        variance = [
+            m2 / count if count else 0.0
+            for m2, count in zip(columns.get("m2", offset, end), columns.get("count", offset, end))
+        ]
+        average = {k: v / samples for k, v in zip(names, columns.get("sum", offset, end))}
+        time_weighted_average = {
+            k: weighted_sum / total_weight if total_weight > 0 else average[k]
+            for k, weighted_sum, total_weight in zip(
+                names,
+                columns.get("weighted_sum", offset, end),
+                columns.get("total_weight", offset, end),
+            )
+        }
+        return _Summary(
+            num_samples=samples,
+            average=average,
+            minimum=dict(zip(names, columns.get("minimum", offset, end))),
+            maximum=dict(zip(names, columns.get("maximum", offset, end))),
+            variance=dict(zip(names, variance)),
+            standard_deviation={k: math.sqrt(v) for k, v in zip(names, variance)},
+            time_weighted_average=time_weighted_average,
+        )
+
+    def remove(self, keys: Iterable[Any]) -> None:
+        """Remove the keys and their summaries."""
+        removed = set(keys).intersection(self._layout)
+        if not removed:
+            return
+        self._add_cached_updates()
+        self._reset_cache()
+        for key in removed:
+            self._num_unused_columns += len(self._layout.pop(key)[1])
+            self._num_samples.pop(key)
+            self._last_time.pop(key, None)
+        if self._num_unused_columns > len(self._columns) // 2:
+            self._compact()
+
+    def _add_cached_updates(self) -> None:
+        if self._num_cached_updates:
+            for key in self._cached_keys:
+                self._num_samples[key] += self._num_cached_updates
+            self._num_cached_updates = 0
+
+    def _reset_cache(self) -> None:
+        self._cached_keys = ()
+        self._cached_stats = ()
+        self._cached_lengths = ()
+        self._cached_positions = None
+
+    def _find_positions(self, cur_stats: dict[Any, dict[str, float]]) -> list[int]:
+        """Return the column positions of the values of cur_stats. Add columns for new keys and
+        stats, which are initialized with the values.
+        """
+        positions: list[int] = []
+        for key, stat_dict in cur_stats.items():
+            names = tuple(stat_dict)
+            if key not in self._layout:
+                vals = list(stat_dict.values())
+                self._layout[key] = (self._columns.append(vals, vals), names)
+                self._num_samples[key] = 0
+            offset, key_names = self._layout[key]
+            if names != key_names:
+                index = {x: i for i, x in enumerate(key_names)}
+                new_names = [x for x in names if x not in index]
+                if new_names:
+                    offset = self._move_key(key, new_names, stat_dict)
+                    key_names = self._layout[key][1]
+                    index = {x: i for i, x in enumerate(key_names)}
+                positions += [offset + index[x] for x in names]
+            else:
+                positions += range(offset, offset + len(names))
+        return positions
+
+    def _move_key(self, key: Any, new_names: list[str], stat_dict: dict[str, float]) -> int:
+        """Move the columns of a key to the end and add columns for its new stats."""
+        offset, names = self._layout[key]
+        columns = self._columns.take(range(offset, offset + len(names)))
+        new_offset = self._columns.extend(columns)  # type: ignore[arg-type]
+        vals = [stat_dict[x] for x in new_names]
+        self._columns.append(vals, vals)
+        self._layout[key] = (new_offset, names + tuple(new_names))
+        self._num_unused_columns += len(names)
+        return new_offset
+
+    def _compact(self) -> None:
+        """Remove the columns of removed keys."""
+        positions: list[int] = []
+        layout: dict[Any, tuple[int, tuple[str, ...]]] = {}
+        for key, (offset, names) in self._layout.items():
+            layout[key] = (len(positions), names)
+            positions += range(offset, offset + len(names))
+        self._columns = self._columns.take(positions)
+        self._layout = layout
+        self._num_unused_columns = 0
+
+
+class _ListColumns:
+    """Columns of the summaries in Python lists"""
+
+    def __init__(self) -> None:
+        self.maximum: list[Any] = []
+        self.minimum: list[Any] = []
+        self.sum: list[Any] = []
+        self.count: list[int] = []
+        self.mean: list[float] = []
+        self.m2: list[float] = []
+        self.weighted_sum: list[float] = []
+        self.total_weight: list[float] = []
+
+    def __len__(self) -> int:
+        return len(self.maximum)
+
+    def append(self, maximum: list[Any], minimum: list[Any]) -> int:
+        """Append columns with initial extremes and return the offset of the first one."""
+        offset = len(self.maximum)
+        num_columns = len(maximum)
+        self.maximum += maximum
+        self.minimum += minimum
+        self.count += [0] * num_columns
+        for column in (self.sum, self.mean, self.m2, self.weighted_sum, self.total_weight):
+            column += [0.0] * num_columns
+        return offset
+
+    def extend(self, other: "_ListColumns") -> int:
+        """Append the columns of other and return the offset of the first one."""
+        offset = len(self.maximum)
+        for name in _COLUMN_NAMES:
+            getattr(self, name).extend(getattr(other, name))
+        return offset
+
+    def take(self, positions: Iterable[int]) -> "_ListColumns":
+        """Return a copy of the columns at positions."""
+        positions = list(positions)
+        columns = _ListColumns()
+        for name in _COLUMN_NAMES:
+            setattr(columns, name, list(map(getattr(self, name).__getitem__, positions)))
+        return columns
+
+    def get(self, name: str, start: int, end: int) -> list[Any]:
+        """Return the values of a summary for a range of columns."""
+        return getattr(self, name)[start:end]
+
+    @staticmethod
+    def make_positions(positions: list[int]) -> _Positions:
+        """Return the positions in the form used by update."""
+        if positions and positions == list(range(positions[0], positions[0] + len(positions))):
+            return range(positions[0], positions[0] + len(positions))
+        return positions
+
+    def update(
+        self,
+        positions: _Positions,
+        vals: list[Any],
+        elapsed: list[float],
+        lengths: Iterable[int],
+    ) -> None:
+        """Update the columns at positions with one value each. elapsed is the weight of each
+        key, whose values are the next lengths values.
+        """
+        weights = list(chain.from_iterable(map(repeat, elapsed, lengths)))
+        maximum = _gather(self.maximum, positions)
+        minimum = _gather(self.minimum, positions)
+        _scatter(self.maximum, positions, [v if v > mx else mx for v, mx in zip(vals, maximum)])
+        _scatter(
+            self.minimum,
+            positions,
+            [v if v < mn and not v > mx else mn for v, mn, mx in zip(vals, minimum, maximum)],
+        )
+        _scatter(self.sum, positions, list(map(operator.add, _gather(self.sum, positions), vals)))
+        count = [c + 1 for c in _gather(self.count, positions)]
+        _scatter(self.count, positions, count)
+        mean = _gather(self.mean, positions)
+        new_mean = [m + (v - m) / c for v, m, c in zip(vals, mean, count)]
+        m2 = _gather(self.m2, positions)
+        _scatter(
+            self.m2,
+            positions,
+            [x + (v - m) * (v - nm) for v, x, m, nm in zip(vals, m2, mean, new_mean)],
+        )
+        _scatter(self.mean, positions, new_mean)
+        weighted_sum = _gather(self.weighted_sum, positions)
+        _scatter(
+            self.weighted_sum,
+            positions,
+            [ws + v * w for v, ws, w in zip(vals, weighted_sum, weights)],
+        )
+        total_weight = _gather(self.total_weight, positions)
+        _scatter(self.total_weight, positions, list(map(operator.add, total_weight, weights)))
+
+
+class _NumpyColumns:
+    """Columns of the summaries in NumPy arrays, with spare capacity for appends"""
+
+    def __init__(self, capacity: int = 64) -> None:
+        self._size = 0
+        self._arrays = _make_numpy_arrays(capacity)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, maximum: list[Any], minimum: list[Any]) -> int:
+        """Append columns with initial extremes and return the offset of the first one."""
+        offset = self._size
+        end = self._reserve(len(maximum))
+        self._arrays["maximum"][offset:end] = maximum
+        self._arrays["minimum"][offset:end] = minimum
+        self._arrays["is_int"][offset:end] = [
+            isinstance(x, int) and isinstance(y, int) for x, y in zip(maximum, minimum)
+        ]
+        return offset
+
+    def extend(self, other: "_NumpyColumns") -> int:
+        """Append the columns of other and return the offset of the first one."""
+        offset = self._size
+        end = self._reserve(len(other))
+        for name, array in self._arrays.items():
+            array[offset:end] = other._arrays[name][: len(other)]
+        return offset
+
+    def take(self, positions: Iterable[int]) -> "_NumpyColumns":
+        """Return a copy of the columns at positions."""
+        index = np.fromiter(positions, dtype=np.intp)
+        columns = _NumpyColumns(capacity=max(64, 2 * len(index)))
+        columns._size = len(index)
+        for name, array in self._arrays.items():
+            columns._arrays[name][: len(index)] = array[index]
+        return columns
+
+    def get(self, name: str, start: int, end: int) -> list[Any]:
+        """Return the values of a summary for a range of columns."""
+        values = self._arrays[name][start:end].tolist()
+        if name in ("maximum", "minimum"):
+            is_int = self._arrays["is_int"][start:end].tolist()
+            values = [int(x) if y else x for x, y in zip(values, is_int)]
+        return values
+
+    @staticmethod
+    def make_positions(positions: list[int]) -> _Positions:
+        """Return the positions in the form used by update."""
+        return np.array(positions, dtype=np.intp)
+
+    def update(
+        self,
+        positions: _Positions,
+        vals: list[Any],
+        elapsed: list[float],
+        lengths: Iterable[int],
+    ) -> None:
+        """Update the columns at positions with one value each. elapsed is the weight of each
+        key, whose values are the next lengths values.
+        """
+        arrays = self._arrays
+        values = np.array(vals, dtype=np.float64)
+        weights = np.repeat(np.array(elapsed, dtype=np.float64), list(lengths))
+        # fmax and fmin are the forms of maximum and minimum that ignore NaN, like the list
+        # comparisons.
+        arrays["maximum"][positions] = np.fmax(arrays["maximum"][positions], values)
+        arrays["minimum"][positions] = np.fmin(arrays["minimum"][positions], values)
+        arrays["is_int"][positions] &= np.fromiter(
+            map(isinstance, vals, repeat(int)), dtype=bool, count=len(vals)
+        )
+        arrays["sum"][positions] += values
+        count = arrays["count"][positions] + 1
+        arrays["count"][positions] = count
+        mean = arrays["mean"][positions]
+        delta = values - mean
+        new_mean = mean + delta / count
+        arrays["m2"][positions] += delta * (values - new_mean)
+        arrays["mean"][positions] = new_mean
+        arrays["weighted_sum"][positions] += values * weights
+        arrays["total_weight"][positions] += weights
+
+    def _reserve(self, num_columns: int) -> int:
+        """Grow the arrays for num_columns more columns and return the new size."""
+        end = self._size + num_columns
+        capacity = len(self._arrays["maximum"])
+        if end > capacity:
+            arrays = _make_numpy_arrays(max(end, 2 * capacity))
+            for name, array in self._arrays.items():
+                arrays[name][: self._size] = array[: self._size]
+            self._arrays = arrays
+        self._size = end
+        return end
+
+
+_COLUMN_NAMES = (
+    "maximum",
+    "minimum",
+    "sum",
+    "count",
+    "mean",
+    "m2",
+    "weighted_sum",
+    "total_weight",
+)
+
+
+def _make_numpy_arrays(capacity: int) -> dict[str, Any]:
+    arrays = {x: np.zeros(capacity, dtype=np.float64) for x in _COLUMN_NAMES}
+    arrays["count"] = np.zeros(capacity, dtype=np.int64)
+    # Whether all values of a column were integers
+    arrays["is_int"] = np.zeros(capacity, dtype=bool)
+    return arrays
+
+
+def _gather(column: list[Any], positions: _Positions) -> list[Any]:
+    if isinstance(positions, range):
+        return column[positions.start : positions.stop]
+    return list(map(column.__getitem__, positions))
+
+
+def _scatter(column: list[Any], positions: _Positions, values: list[Any]) -> None:
+    if isinstance(positions, range):
+        column[positions.start : positions.stop] = values
+    else:
+        for i, val in zip(positions, values):
+            column[i] = val
+
+
+class _KeyedStatSummaries(_FlatStatSummaries):
+    """Aggregates stats that are reported per key, such as per process. The columns are NumPy
+    arrays if NumPy is installed.
+    """
+
+    def __init__(self, initial_weight: float = 0.0) -> None:
+        super().__init__(initial_weight=initial_weight, use_numpy=True)
+
+    def finalize(self, keys: Iterable[str]) -> list[tuple[str, _Summary]]:
+        """Finalize and remove the summaries for keys. Keys that were never sampled are ignored.
+
+        Returns
+        -------
+        list
+            Tuples of (key, summary)
+        """
+        finalized = [(key, self.get_summary(key)) for key in set(keys).intersection(self.keys())]
+        self.remove(x[0] for x in finalized)
+        return finalized
+
+
+class _StatSketches:
+    """Tracks a quantile sketch of each stat per key."""
+
+    def __init__(self, percentiles: Iterable[float], relative_accuracy: float) -> None:
+        self._quantiles: dict[str, float] = {}
+        for percentile in percentiles:
+            if not 0 <= percentile <= 100:
+                msg = f"Percentiles must be between 0 and 100: {percentile}"
+                raise ValueError(msg)
+            self._quantiles[f"p{percentile:g}"] = percentile / 100
+        self._relative_accuracy = relative_accuracy
+        self._sketches: dict[Any, dict[str, DDSketch]] = {}
+
+    def update_keys(self, stats_by_key: dict[Any, dict[str, float]]) -> None:
+        """Add the stats for each key in the current interval."""
+        if self._quantiles:
+            for key, stats in stats_by_key.items():
+                self.update(key, stats)
+
+    def update(self, key: Any, stats: dict[str, float]) -> None:
+        """Add the stats for the key in the current interval."""
+        if not self._quantiles:
+            return
+        sketches = self._sketches.get(key)
+        if sketches is None:
+            sketches = self._sketches[key] = {}
+        for stat_name, val in stats.items():
+            sketch = sketches.get(stat_name)
+            if sketch is None:
+                sketch = sketches[stat_name] = DDSketch(self._relative_accuracy)
+            sketch.add(val)
+
+    def pop(self, key: Any) -> tuple[dict[str, dict[str, float]], dict[str, dict[str, Any]]]:
+        """Remove the sketches of the key and return the same values as get."""
+        results = self.get(key)
+        self._sketches.pop(key, None)
+        return results
+
+    def get(self, key: Any) -> tuple[dict[str, dict[str, float]], dict[str, dict[str, Any]]]:
+        """Return the percentiles of the key keyed by label, such as 'p95', and its serialized
+        sketches keyed by stat name.
+        """
+        sketches = self._sketches.get(key, {})
+        if not sketches:
+            return {}, {}
+        percentiles: dict[str, dict[str, float]] = {}
+        for label, quantile in self._quantiles.items():
+            percentiles[label] = {}
+            for stat_name, sketch in sketches.items():
+                val = sketch.get_quantile(quantile)
+                if val is not None:
+                    percentiles[label][stat_name] = val
+        return percentiles, {k: v.to_dict() for k, v in sketches.items()}
+
+
+class _PeakWindowAverages:
+    """Tracks the highest average of each stat over sliding windows. Window lengths are converted
+    to numbers of samples at the collection interval. Each update is O(1) per stat and window,
+    and each window holds at most its number of samples.
+    """
+
+    def __init__(self, windows: Iterable[float], interval: float) -> None:
+        # window label -> number of samples
+        self._sizes: dict[str, int] = {}
+        for window in windows:
+            if window <= 0:
+                msg = f"Sliding window lengths must be positive: {window}"
+                raise ValueError(msg)
+            self._sizes[f"{window:g}s"] = max(1, round(window / interval))
+        self._windows: dict[Any, dict[str, dict[str, _SlidingWindow]]] = {}
+
+    def update_keys(self, stats_by_key: dict[Any, dict[str, float]]) -> None:
+        """Add the stats for each key in the current interval."""
+        if self._sizes:
+            for key, stats in stats_by_key.items():
+                self.update(key, stats)
+
+    def update(self, key: Any, stats: dict[str, float]) -> None:
+        """Add the stats for the key in the current interval."""
+        if not self._sizes:
+            return
+        windows = self._windows.get(key)
+        if windows is None:
+            windows = self._windows[key] = {x: {} for x in self._sizes}
+        for label, size in self._sizes.items():
+            by_stat = windows[label]
+            for stat_name, val in stats.items():
+                window = by_stat.get(stat_name)
+                if window is None:
+                    window = by_stat[stat_name] = _SlidingWindow(size)
+                window.add(val)
+
+    def pop(self, key: Any) -> dict[str, dict[str, float]]:
+        """Remove the windows of the key and return the same values as get."""
+        results = self.get(key)
+        self._windows.pop(key, None)
+        return results
+
+    def get(self, key: Any) -> dict[str, dict[str, float]]:
+        """Return the peak averages of the key keyed by window label."""
+        windows = self._windows.get(key, {})
+        return {
+            label: {stat_name: x.peak for stat_name, x in by_stat.items()}
+            for label, by_stat in windows.items()
+        }
+
+
+class _SlidingWindow:
+    """Running sum of the most recent values and the highest average of any full window"""
+
+    __slots__ = ("_values", "_total", "_peak", "_num_updates")
+
+    def __init__(self, size: int) -> None:
+        self._values: deque[float] = deque(maxlen=size)
+        self._total = 0.0
+        self._peak: float | None = None
+        self._num_updates = 0
+
+    @property
+    def peak(self) -> float:
+        """Return the highest average of any full window. If the window never filled, return
+        the average of the values so far.
+        """
+        if self._peak is None:
+            return self._total / len(self._values) if self._values else 0.0
+        return self._peak
+
+    def add(self, val: float) -> None:
+        """Add a value, evicting the oldest one if the window is full."""
+        size = self._values.maxlen
+        if len(self._values) == size:
+            self._total -= self._values[0]
+        self._values.append(val)
+        self._num_updates += 1
+        if self._num_updates == size:
+            # Bound the floating-point error of the running sum.
+            self._total = sum(self._values)
+            self._num_updates = 0
+        else:
+            self._total += val
+        if len(self._values) == size:
+            average = self._total / size
+            if self._peak is None or average > self._peak:
+                self._peak = average
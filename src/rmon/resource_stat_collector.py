@@ -2,20 +2,57 @@
 
 import multiprocessing
 import time
-from typing import Any, Iterable, Optional
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterable, Optional
 
 import psutil
 from loguru import logger
 
+from .cgroup import CgroupStatCollector
+from .devices import DeviceStatCollector
 from .models import ResourceType, ComputeNodeResourceStatConfig
+from .process_cache import ProcessCache
+from .process_groups import ProcessGroupStatCollector
+from .procfs import (
+    DEFAULT_PROCFS_ROOT,
+    ProcfsReader,
+    ProcStat,
+    PRESSURE_RESOURCES,
+    VMSTAT_COUNTERS,
+    read_pressure_totals,
+    read_vmstat,
+)
 
 
 ONE_MB = 1024 * 1024
 
+# Extended per-process stats by cost tier, in increasing order of cost
+PROCESS_TIER_STATS = {
+    "io": ("read MB/s", "write MB/s"),
+    "threads": (
+        "num_threads",
+        "num_fds",
+        "voluntary_ctx_switches/s",
+        "involuntary_ctx_switches/s",
+    ),
+    "memory_full": ("uss", "pss"),
+}
+# Tier stats that are read as cumulative counters and reported as rates, with their divisors
+_PROCESS_RATE_STATS = {
+    "read MB/s": ONE_MB,
+    "write MB/s": ONE_MB,
+    "voluntary_ctx_switches/s": 1,
+    "involuntary_ctx_switches/s": 1,
+}
+
 
 class ResourceStatCollector:
     """Collects resource utilization statistics"""
 
+    # cpu_seconds is the cumulative CPU time of each process, including the CPU time of
+    # descendants that have exited and been reaped by a process in the tree.
+    PROCESS_STATS = ("cpu_percent", "rss", "cpu_seconds")
+
     DISK_STATS = (
         "read_count",
         "write_count",
@@ -40,8 +77,34 @@ class ResourceStatCollector:
         self._last_net_check_time: Optional[float] = None
         self._update_disk_stats(psutil.disk_io_counters())
         self._update_net_stats(psutil.net_io_counters())
-        self._cached_processes: dict[int, psutil.Process] = {}
+        # (procfs root, check time, cumulative counters)
+        self._last_pressure_counters: Optional[tuple[str, float, dict[str, int]]] = None
+        self._update_pressure_stats(DEFAULT_PROCFS_ROOT)
+        self._process_cache = ProcessCache()
+        # process key -> (pid, start time) of the process first monitored under the key
+        self._process_key_identities: dict[str, tuple[int, float]] = {}
+        self._reused_process_keys: set[str] = set()
+        # Processes whose CPU utilization baseline was recorded during the current interval.
+        self._unprimed_pids: set[int] = set()
         self._max_process_cpu_percent = multiprocessing.cpu_count() * 100
+        self._procfs_reader: Optional[ProcfsReader] = None
+        self._procfs_last_cpu_ticks: Optional[int] = None
+        # pid -> (starttime, utime + stime) as of the last collection
+        self._procfs_process_ticks: dict[int, tuple[int, int]] = {}
+        # pid -> (process start time, monotonic time, cumulative tier counters)
+        self._process_tier_counters: dict[int, tuple[float, float, dict[str, int]]] = {}
+        # Time spent reading each process tier in the last interval and in total
+        self._process_tier_durations: dict[str, float] = {}
+        self._process_tier_total_durations: dict[str, float] = {}
+        self._process_tier_num_intervals = 0
+        self._cgroup_collector: Optional[CgroupStatCollector] = None
+        self._discovered_cgroup: Optional[str] = None
+        self._device_collector = DeviceStatCollector()
+        self._process_group_collector: Optional[ProcessGroupStatCollector] = None
+        self._capture_times: dict[ResourceType, float] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Concurrent collections that did not finish within the budget of an earlier interval.
+        self._pending: dict[ResourceType, Future] = {}
 
     def _update_disk_stats(self, data: Any):
         for stat in self.DISK_STATS:
@@ -53,26 +116,113 @@ class ResourceStatCollector:
             setattr(self, stat, getattr(data, stat, 0))
         self._last_net_check_time = time.time()
 
+    def _update_pressure_stats(self, procfs_root: str) -> dict[str, int]:
+        counters = read_pressure_totals(procfs_root)
+        counters.update(read_vmstat(procfs_root))
+        self._last_pressure_counters = (procfs_root, time.time(), counters)
+        return counters
+
     def get_stats(
         self, config: ComputeNodeResourceStatConfig, pids: Optional[dict[str, int]] = None
     ) -> dict[ResourceType, dict[str, Any]]:
         """Return a dict keyed by ResourceType of all enabled stats."""
+        funcs = self._make_collection_funcs(config, pids)
+        self._capture_times.clear()
+        if config.concurrent_collection:
+            timeout = config.collection_timeout or config.interval
+            return self._get_stats_concurrently(funcs, timeout)
+
         data: dict[ResourceType, dict[str, Any]] = {}
-        if config.cpu:
-            data[ResourceType.CPU] = self.get_cpu_stats()
-        if config.disk:
-            data[ResourceType.DISK] = self.get_disk_stats()
-        if config.memory:
-            data[ResourceType.MEMORY] = self.get_memory_stats()
-        if config.network:
-            data[ResourceType.NETWORK] = self.get_network_stats()
+        for resource_type, func in funcs.items():
+            data[resource_type] = func()
+            self._capture_times[resource_type] = time.time()
+        return data
+
+    def _make_collection_funcs(
+        self, config: ComputeNodeResourceStatConfig, pids: Optional[dict[str, int]]
+    ) -> dict[ResourceType, Callable[[], dict[str, Any]]]:
+        funcs: dict[ResourceType, Callable[[], dict[str, Any]]] = {}
+        for resource_type in (
+            ResourceType.CPU,
+            ResourceType.DISK,
+            ResourceType.MEMORY,
+            ResourceType.NETWORK,
+        ):
+            if getattr(config, resource_type.value):
+                funcs[resource_type] = getattr(self, f"get_{resource_type.value}_stats")
+        if config.pressure:
+            funcs[ResourceType.PRESSURE] = lambda: self.get_pressure_stats(config.procfs_root)
+        for resource_type in config.list_device_resource_types():
+            if getattr(config, resource_type.value):
+                funcs[resource_type] = self._make_device_stats_func(resource_type, config)
         if config.process:
             if pids is None:
                 msg = "pids cannot be None if process stats are enabled"
                 raise ValueError(msg)
-            data[ResourceType.PROCESS] = self.get_processes_stats(pids, config)
+            funcs[ResourceType.PROCESS] = lambda: self.get_processes_stats(pids, config)
+        if config.process_group:
+            funcs[ResourceType.PROCESS_GROUP] = lambda: self.get_process_group_stats(config)
+        if config.cgroup:
+            funcs[ResourceType.CGROUP] = lambda: self.get_cgroup_stats(config)
+        return funcs
+
+    def _make_device_stats_func(
+        self, resource_type: ResourceType, config: ComputeNodeResourceStatConfig
+    ) -> Callable[[], dict[str, Any]]:
+        method = getattr(self._device_collector, f"get_{resource_type.value}_stats")
+        return lambda: method(include=config.device_include, exclude=config.device_exclude)
+
+    def _get_stats_concurrently(
+        self, funcs: dict[ResourceType, Callable[[], dict[str, Any]]], timeout: float
+    ) -> dict[ResourceType, dict[str, Any]]:
+        """Collect stats for each resource type in parallel. Resource types that do not finish
+        within timeout seconds are omitted, and their results are returned by the first call after
+        they finish instead of a new collection.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=len(ResourceType), thread_name_prefix="rmon-collector"
+            )
+
+        data: dict[ResourceType, dict[str, Any]] = {}
+        futures: dict[ResourceType, Future] = {}
+        for resource_type, func in funcs.items():
+            pending = self._pending.get(resource_type)
+            if pending is not None:
+                if not pending.done():
+                    logger.warning(
+                        "Skip collection of {}: the previous collection is still running",
+                        resource_type.value,
+                    )
+                    continue
+                # The late collection already advanced the counter baselines, such as for disk
+                # and network rates, and so discarding its result would lose its interval.
+                # Return it, with its own capture time, and collect again at the next call.
+                self._pending.pop(resource_type)
+                self._capture_times[resource_type], data[resource_type] = pending.result()
+                logger.debug("Return the late collection of {}", resource_type.value)
+                continue
+            futures[resource_type] = self._executor.submit(_capture, func)
+
+        done, _ = wait(futures.values(), timeout=timeout)
+        for resource_type, future in futures.items():
+            if future in done:
+                self._capture_times[resource_type], data[resource_type] = future.result()
+            else:
+                logger.warning(
+                    "Collection of {} did not complete within {} seconds",
+                    resource_type.value,
+                    timeout,
+                )
+                self._pending[resource_type] = future
         return data
 
+    def get_capture_times(self) -> dict[ResourceType, float]:
+        """Return the times (seconds since the epoch) at which each resource type was captured
+        by the last call to get_stats.
+        """
+        return dict(self._capture_times)
+
     def get_cpu_stats(self) -> dict[str, Any]:
         """Gets CPU current resource stats information."""
         stats = psutil.cpu_times_percent()._asdict()
@@ -113,72 +263,262 @@ class ResourceStatCollector:
         self._update_net_stats(data)
         return stats
 
+    def get_cgroup_stats(self, config: ComputeNodeResourceStatConfig) -> dict[str, Any]:
+        """Return stats for the configured cgroups, keyed by cgroup path."""
+        if (
+            self._cgroup_collector is None
+            or str(self._cgroup_collector.root) != config.cgroupfs_root
+        ):
+            self._cgroup_collector = CgroupStatCollector(config.cgroupfs_root)
+            self._discovered_cgroup = None
+
+        cgroups = config.cgroup_paths
+        if not cgroups:
+            if self._discovered_cgroup is None:
+                self._discovered_cgroup = self._cgroup_collector.discover_job_cgroup(
+                    config.procfs_root
+                )
+                if self._discovered_cgroup is None:
+                    logger.warning("Could not discover a cgroup v2 hierarchy for this process")
+                    self._discovered_cgroup = ""
+                else:
+                    logger.info("Monitor cgroup={}", self._discovered_cgroup)
+            cgroups = [self._discovered_cgroup] if self._discovered_cgroup else []
+
+        return self._cgroup_collector.get_stats(cgroups)
+
+    def get_process_group_stats(self, config: ComputeNodeResourceStatConfig) -> dict[str, Any]:
+        """Return stats for the configured process groups, keyed by group name."""
+        if self._process_group_collector is None:
+            self._process_group_collector = ProcessGroupStatCollector(config.procfs_root)
+        start = time.perf_counter()
+        stats = self._process_group_collector.get_stats(config.process_groups)
+        logger.debug(
+            "Collected process group stats for groups={} duration={:.3f} ms",
+            list(stats),
+            (time.perf_counter() - start) * 1000,
+        )
+        return stats
+
+    def get_pressure_stats(self, procfs_root: str = DEFAULT_PROCFS_ROOT) -> dict[str, Any]:
+        """Gets pressure stall and virtual memory stats for the time since the last check.
+        Stall times are reported as the percentage of elapsed time that some or all tasks were
+        stalled on a resource. Virtual memory counters are reported as rates per second, except
+        for oom_kill, which is the number of OOM kills in the interval.
+        """
+        assert self._last_pressure_counters is not None
+        last_root, last_check_time, last_counters = self._last_pressure_counters
+        counters = self._update_pressure_stats(procfs_root)
+        if last_root != procfs_root:
+            last_counters = counters
+        elapsed = self._last_pressure_counters[1] - last_check_time
+        stats: dict[str, Any] = {"elapsed_seconds": elapsed}
+        for resource in PRESSURE_RESOURCES:
+            for kind in ("some", "full"):
+                name = f"{resource}_{kind}"
+                stalled = (counters[name] - last_counters[name]) / 1_000_000
+                stats[f"{name}_percent"] = stalled / elapsed * 100 if elapsed > 0 else 0.0
+        for name in VMSTAT_COUNTERS:
+            delta = counters[name] - last_counters[name]
+            if name == "oom_kill":
+                stats[name] = delta
+            else:
+                stats[f"{name}_per_sec"] = delta / elapsed if elapsed > 0 else 0.0
+        return stats
+
     def _get_process(self, pid: int) -> psutil.Process | None:
-        process = self._cached_processes.get(pid)
-        if process is None:
-            try:
-                process = psutil.Process(pid)
-                # Initialize CPU utilization tracking per psutil docs.
-                process.cpu_percent(interval=0.25)
-                self._cached_processes[pid] = process
-            except psutil.NoSuchProcess:
-                logger.warning("PID={} does not exist", pid)
-                return None
-            except psutil.AccessDenied:
-                logger.warning("PID={}: access denied", pid)
-                return None
+        try:
+            process, is_new = self._process_cache.get(pid)
+            if is_new:
+                # Initialize CPU utilization tracking per psutil docs. Don't block; the first
+                # measurement is made in _get_cpu_percent.
+                process.cpu_percent(interval=None)
+                self._unprimed_pids.add(pid)
+        except psutil.NoSuchProcess:
+            logger.warning("PID={} does not exist", pid)
+            self._unprimed_pids.discard(pid)
+            return None
+        except psutil.AccessDenied:
+            logger.warning("PID={}: access denied", pid)
+            self._process_cache.pop(pid)
+            return None
 
         return process
 
+    def _get_cpu_percent(self, process: psutil.Process) -> float:
+        """Return the CPU utilization of the process since the last call. Must be called inside
+        process.oneshot().
+        """
+        if process.pid not in self._unprimed_pids:
+            return process.cpu_percent()
+
+        # The baseline was just recorded, so psutil can't compute a meaningful value until the
+        # next interval. Report the average utilization since the process started instead.
+        self._unprimed_pids.discard(process.pid)
+        times = process.cpu_times()
+        lifetime = time.time() - process.create_time()
+        if lifetime <= 0:
+            return 0.0
+        return (times.user + times.system) / lifetime * 100
+
     def clear_cache(self) -> None:
         """Clear all cached data."""
-        self._cached_processes.clear()
+        self._process_cache.clear()
+        self._process_key_identities.clear()
+        self._reused_process_keys.clear()
+        self._unprimed_pids.clear()
+        self._process_tier_counters.clear()
+        self._procfs_process_ticks.clear()
+        self._procfs_last_cpu_ticks = None
+
+    def shutdown(self) -> None:
+        """Stop the threads used for concurrent collection."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._pending.clear()
 
     def clear_stale_processes(self, cur_pids: Iterable[int]) -> None:
         """Remove cached process objects that are no longer running."""
-        for pid in set(self._cached_processes).difference(cur_pids):
-            self._cached_processes.pop(pid)
+        for pid in set(self._process_cache.pids()).difference(cur_pids):
+            self._process_cache.pop(pid)
+            self._unprimed_pids.discard(pid)
+            self._process_tier_counters.pop(pid, None)
 
     def get_processes_stats(self, pids, config: ComputeNodeResourceStatConfig) -> dict[str, Any]:
         """Return stats for multiple processes."""
+        start = time.perf_counter()
+        for tier in config.process_tiers:
+            if tier not in PROCESS_TIER_STATS:
+                msg = f"Unsupported process tier={tier}. Choices: {list(PROCESS_TIER_STATS)}"
+                raise ValueError(msg)
+        self._process_tier_durations = dict.fromkeys(config.process_tiers, 0.0)
+        self._process_cache.max_size = config.process_cache_size
+        if config.process_backend == "procfs":
+            stats, num_processes = self._get_processes_stats_procfs(pids, config)
+        elif config.process_backend == "psutil":
+            stats, num_processes = self._get_processes_stats_psutil(pids, config)
+        else:
+            msg = f"Unsupported process_backend={config.process_backend}"
+            raise ValueError(msg)
+        self._prune_process_key_identities(pids)
+
+        logger.debug(
+            "Collected process stats for PIDs={} num_processes={} duration={:.3f} ms",
+            list(pids.values()),
+            num_processes,
+            (time.perf_counter() - start) * 1000,
+        )
+        if self._process_tier_durations:
+            self._process_tier_num_intervals += 1
+            for tier, duration in self._process_tier_durations.items():
+                self._process_tier_total_durations[tier] = (
+                    self._process_tier_total_durations.get(tier, 0.0) + duration
+                )
+            logger.debug(
+                "Process tier durations (ms): {}",
+                {k: round(v * 1000, 3) for k, v in self._process_tier_durations.items()},
+            )
+        return stats
+
+    def get_process_cache_stats(self) -> dict[str, int]:
+        """Return the size and hit, miss, and eviction counters of the process cache."""
+        return self._process_cache.get_stats()
+
+    def _is_same_process(self, key: str, pid: int, start_time: float) -> bool:
+        """Return False if the process ID of the key was reused by a process that started after
+        the one first monitored under the key.
+        """
+        identity = self._process_key_identities.get(key)
+        if identity is None or identity[0] != pid:
+            self._process_key_identities[key] = (pid, start_time)
+            return True
+        if identity[1] == start_time:
+            return True
+        if key not in self._reused_process_keys:
+            logger.warning(
+                "PID={} of process key={} was reused by a new process. Ignoring it.", pid, key
+            )
+            self._reused_process_keys.add(key)
+        return False
+
+    def _prune_process_key_identities(self, keys: Iterable[str]) -> None:
+        keys = set(keys)
+        for key in set(self._process_key_identities).difference(keys):
+            self._process_key_identities.pop(key)
+        self._reused_process_keys.intersection_update(keys)
+
+    def get_process_tier_costs(self) -> dict[str, dict[str, float]]:
+        """Return the time in milliseconds spent reading each extended process tier in the last
+        interval and on average per interval.
+        """
+        return {
+            tier: {
+                "last_interval_ms": self._process_tier_durations.get(tier, 0.0) * 1000,
+                "average_ms": total / self._process_tier_num_intervals * 1000,
+            }
+            for tier, total in self._process_tier_total_durations.items()
+        }
+
+    def _get_processes_stats_psutil(
+        self, pids: dict[str, int], config: ComputeNodeResourceStatConfig
+    ) -> tuple[dict[str, Any], int]:
+        # Scan the process table once per interval instead of once per monitored process.
+        children_by_ppid = get_children_by_ppid() if config.include_child_processes else None
         stats: dict[str, Any] = {}
         cur_pids = set()
         for name, pid in pids.items():
-            _stats, children = self.get_process_stats(pid, config)
+            _stats, children = self.get_process_stats(pid, config, children_by_ppid, key=name)
             if _stats is not None:
                 stats[name] = _stats
                 cur_pids.add(pid)
                 cur_pids.update(children)
 
         self.clear_stale_processes(cur_pids)
-        logger.debug("Collected process stats for PIDs={}", list(pids.values()))
-        return stats
+        return stats, len(cur_pids)
 
     def get_process_stats(
-        self, pid: int, config: ComputeNodeResourceStatConfig
+        self,
+        pid: int,
+        config: ComputeNodeResourceStatConfig,
+        children_by_ppid: Optional[dict[int, list[int]]] = None,
+        key: Optional[str] = None,
     ) -> tuple[Optional[dict[str, Any]], list[int]]:
-        """Return stats for one process. Returns None if the pid does not exist."""
+        """Return stats for one process. Returns None if the pid does not exist or, when key is
+        set, if the pid was reused by a different process than the one first monitored under
+        the key.
+
+        Parameters
+        ----------
+        pid : int
+        config : ComputeNodeResourceStatConfig
+        children_by_ppid : dict | None
+            Mapping of parent process ID to child process IDs, as returned by
+            get_children_by_ppid. Used to find child processes if include_child_processes is
+            enabled. If None, build a new mapping.
+        key : str | None
+            Process key under which the stats are reported
+        """
         children: list[int] = []
         process = self._get_process(pid)
         if process is None:
             return None, children
         try:
+            if key is not None and not self._is_same_process(key, pid, process.create_time()):
+                return None, children
             with process.oneshot():
-                cpu_percent = process.cpu_percent()
+                cpu_percent = self._get_cpu_percent(process)
                 rss = process.memory_info().rss
                 if cpu_percent > self._max_process_cpu_percent:
                     logger.warning("Invalid process CPU measurement: {}", cpu_percent)
                     cpu_percent = self._max_process_cpu_percent
 
-                stats = {"cpu_percent": cpu_percent, "rss": rss}
-                if config.include_child_processes:
-                    for child in process.children(recursive=config.recurse_child_processes):
-                        cached_child = self._get_process(child.pid)
-                        if cached_child is not None:
-                            stats["cpu_percent"] += cached_child.cpu_percent()
-                            stats["rss"] += cached_child.memory_info().rss
-                            children.append(child.pid)
-                return stats, children
+                stats = {
+                    "cpu_percent": cpu_percent,
+                    "rss": rss,
+                    "cpu_seconds": _get_cpu_seconds(process),
+                }
+                stats.update(self._get_tier_stats_psutil(process, config.process_tiers))
         except psutil.NoSuchProcess:
             logger.warning("PID={} does not exist", pid)
             return None, []
@@ -186,6 +526,283 @@ class ResourceStatCollector:
             logger.warning("PID={}: access denied", pid)
             return None, []
 
+        if config.include_child_processes:
+            if children_by_ppid is None:
+                children_by_ppid = get_children_by_ppid()
+            children = self._add_child_process_stats(stats, pid, config, children_by_ppid)
+        return stats, children
+
+    def _add_child_process_stats(
+        self,
+        stats: dict[str, Any],
+        pid: int,
+        config: ComputeNodeResourceStatConfig,
+        children_by_ppid: dict[int, list[int]],
+    ) -> list[int]:
+        """Add the stats of the child processes to stats and return the child process IDs."""
+        children: list[int] = []
+        for child_pid in find_children(pid, children_by_ppid, config.recurse_child_processes):
+            child = self._get_process(child_pid)
+            if child is None:
+                continue
+            try:
+                with child.oneshot():
+                    stats["cpu_percent"] += self._get_cpu_percent(child)
+                    stats["rss"] += child.memory_info().rss
+                    stats["cpu_seconds"] += _get_cpu_seconds(child)
+                    _add_stats(stats, self._get_tier_stats_psutil(child, config.process_tiers))
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                # The child exited after the process table was scanned.
+                continue
+            children.append(child_pid)
+        return children
+
+    def _get_tier_stats_psutil(self, process: psutil.Process, tiers: list[str]) -> dict[str, Any]:
+        """Return the stats for the extended tiers of one process. Must be called inside
+        process.oneshot().
+        """
+        if not tiers:
+            return {}
+        counters: dict[str, int] = {}
+        for tier in tiers:
+            start = time.perf_counter()
+            try:
+                counters.update(_PSUTIL_TIER_READERS[tier](process))
+            except psutil.AccessDenied:
+                logger.debug("PID={}: access denied for process tier={}", process.pid, tier)
+                counters.update(dict.fromkeys(PROCESS_TIER_STATS[tier], 0))
+            # get_process_stats can be called without get_processes_stats, which resets the
+            # durations.
+            self._process_tier_durations[tier] = (
+                self._process_tier_durations.get(tier, 0.0) + time.perf_counter() - start
+            )
+        return self._make_tier_stats(
+            process.pid, process.create_time(), time.time() - process.create_time(), counters
+        )
+
+    def _get_tier_stats_procfs(
+        self, reader: ProcfsReader, proc_stat: ProcStat, uptime_ticks: float, tiers: list[str]
+    ) -> dict[str, Any]:
+        """Return the stats for the extended tiers of one process from the procfs."""
+        if not tiers:
+            return {}
+        counters: dict[str, int] = {}
+        for tier in tiers:
+            start = time.perf_counter()
+            counters.update(_PROCFS_TIER_READERS[tier](reader, proc_stat.pid))
+            self._process_tier_durations[tier] = (
+                self._process_tier_durations.get(tier, 0.0) + time.perf_counter() - start
+            )
+        lifetime = (uptime_ticks - proc_stat.starttime) / reader.clock_ticks
+        return self._make_tier_stats(proc_stat.pid, proc_stat.starttime, lifetime, counters)
+
+    def _make_tier_stats(
+        self, pid: int, start_time: float, lifetime: float, counters: dict[str, int]
+    ) -> dict[str, Any]:
+        """Convert cumulative tier counters to rates since the last interval. If the process has
+        not been seen before, report the average rates since it started.
+        """
+        now = time.monotonic()
+        previous = self._process_tier_counters.get(pid)
+        self._process_tier_counters[pid] = (start_time, now, counters)
+        if previous is not None and previous[0] == start_time:
+            last_counters, elapsed = previous[2], now - previous[1]
+        else:
+            last_counters, elapsed = {}, lifetime
+
+        stats: dict[str, Any] = {}
+        for name, val in counters.items():
+            divisor = _PROCESS_RATE_STATS.get(name)
+            if divisor is None:
+                stats[name] = val
+            elif elapsed > 0:
+                stats[name] = (val - last_counters.get(name, 0)) / elapsed / divisor
+            else:
+                stats[name] = 0.0
+        return stats
+
+    def _get_procfs_reader(self, config: ComputeNodeResourceStatConfig) -> ProcfsReader:
+        if self._procfs_reader is None or str(self._procfs_reader.root) != config.procfs_root:
+            self._procfs_reader = ProcfsReader(config.procfs_root)
+            self._procfs_process_ticks.clear()
+            self._procfs_last_cpu_ticks = None
+        return self._procfs_reader
+
+    def _get_processes_stats_procfs(
+        self, pids: dict[str, int], config: ComputeNodeResourceStatConfig
+    ) -> tuple[dict[str, Any], int]:
+        """Return stats for multiple processes by reading the procfs directly."""
+        reader = self._get_procfs_reader(config)
+        cpu_ticks = reader.read_cpu_ticks()
+        uptime_ticks = reader.read_uptime() * reader.clock_ticks
+        elapsed_ticks = (
+            None
+            if self._procfs_last_cpu_ticks is None
+            else (cpu_ticks - self._procfs_last_cpu_ticks) / reader.num_cpus
+        )
+        if config.include_child_processes:
+            # Read every process once so that children can be found from the ppid fields.
+            proc_stats = reader.read_process_stats()
+            children_by_ppid = make_children_index((x.pid, x.ppid) for x in proc_stats.values())
+        else:
+            proc_stats = reader.read_process_stats(pids.values())
+
+        stats: dict[str, Any] = {}
+        process_ticks: dict[int, tuple[int, int]] = {}
+        for name, pid in pids.items():
+            if pid not in proc_stats:
+                logger.warning("PID={} does not exist", pid)
+                continue
+            if not self._is_same_process(name, pid, proc_stats[pid].starttime):
+                continue
+            tree = [pid]
+            if config.include_child_processes:
+                tree += find_children(pid, children_by_ppid, config.recurse_child_processes)
+
+            _stats: dict[str, Any] = {"cpu_percent": 0.0, "rss": 0, "cpu_seconds": 0.0}
+            for _pid in tree:
+                proc_stat = proc_stats[_pid]
+                rss = reader.read_rss(_pid)
+                if rss is None:
+                    continue
+                cpu_percent = self._get_procfs_cpu_percent(proc_stat, elapsed_ticks, uptime_ticks)
+                process_ticks[_pid] = (proc_stat.starttime, proc_stat.utime + proc_stat.stime)
+                if _pid == pid and cpu_percent > self._max_process_cpu_percent:
+                    logger.warning("Invalid process CPU measurement: {}", cpu_percent)
+                    cpu_percent = self._max_process_cpu_percent
+                _stats["cpu_percent"] += cpu_percent
+                _stats["rss"] += rss
+                _stats["cpu_seconds"] += (
+                    proc_stat.utime + proc_stat.stime + proc_stat.cutime + proc_stat.cstime
+                ) / reader.clock_ticks
+                _add_stats(
+                    _stats,
+                    self._get_tier_stats_procfs(
+                        reader, proc_stat, uptime_ticks, config.process_tiers
+                    ),
+                )
+            stats[name] = _stats
+
+        self._procfs_process_ticks = process_ticks
+        for pid in set(self._process_tier_counters).difference(process_ticks):
+            self._process_tier_counters.pop(pid)
+        self._procfs_last_cpu_ticks = cpu_ticks
+        return stats, len(process_ticks)
+
+    def _get_procfs_cpu_percent(
+        self, proc_stat: ProcStat, elapsed_ticks: Optional[float], uptime_ticks: float
+    ) -> float:
+        ticks = proc_stat.utime + proc_stat.stime
+        previous = self._procfs_process_ticks.get(proc_stat.pid)
+        if previous is not None and previous[0] == proc_stat.starttime and elapsed_ticks:
+            return (ticks - previous[1]) / elapsed_ticks * 100
+        # This process has not been seen before. Report its average utilization since it
+        # started instead of waiting for a second sample.
+        lifetime_ticks = uptime_ticks - proc_stat.starttime
+        if lifetime_ticks <= 0:
+            return 0.0
+        return ticks / lifetime_ticks * 100
+
     @staticmethod
     def _mb_per_sec(num_bytes, elapsed_seconds) -> float:
         return float(num_bytes) / ONE_MB / elapsed_seconds
+
+
+def _get_cpu_seconds(process: psutil.Process) -> float:
+    """Return the cumulative CPU time of the process and its reaped descendants."""
+    times = process.cpu_times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def _add_stats(total: dict[str, Any], stats: dict[str, Any]) -> None:
+    """Add the values in stats to the values of the same names in total."""
+    for name, val in stats.items():
+        total[name] = total.get(name, 0) + val
+
+
+def _capture(func: Callable[[], dict[str, Any]]) -> tuple[float, dict[str, Any]]:
+    data = func()
+    return time.time(), data
+
+
+def get_children_by_ppid() -> dict[int, list[int]]:
+    """Scan the process table once and return a mapping of parent process ID to child
+    process IDs.
+    """
+    return make_children_index((x.pid, x.info["ppid"]) for x in psutil.process_iter(["ppid"]))
+
+
+def make_children_index(pid_ppid_pairs: Iterable[tuple[int, int]]) -> dict[int, list[int]]:
+    """Return a mapping of parent process ID to child process IDs."""
+    children_by_ppid: dict[int, list[int]] = {}
+    for pid, ppid in pid_ppid_pairs:
+        children_by_ppid.setdefault(ppid, []).append(pid)
+    return children_by_ppid
+
+
+def find_children(pid: int, children_by_ppid: dict[int, list[int]], recursive: bool) -> list[int]:
+    """Return the child process IDs of pid from a mapping of parent pid to child pids."""
+    children = list(children_by_ppid.get(pid, []))
+    if recursive:
+        i = 0
+        while i < len(children):
+            children.extend(children_by_ppid.get(children[i], []))
+            i += 1
+    return children
+
+
+def _read_io_psutil(process: psutil.Process) -> dict[str, int]:
+    if not hasattr(process, "io_counters"):
+        # Not supported on macOS.
+        return dict.fromkeys(PROCESS_TIER_STATS["io"], 0)
+    counters = process.io_counters()
+    return {"read MB/s": counters.read_bytes, "write MB/s": counters.write_bytes}
+
+
+def _read_threads_psutil(process: psutil.Process) -> dict[str, int]:
+    ctx_switches = process.num_ctx_switches()
+    return {
+        "num_threads": process.num_threads(),
+        # num_fds is not available on Windows.
+        "num_fds": process.num_fds() if hasattr(process, "num_fds") else 0,
+        "voluntary_ctx_switches/s": ctx_switches.voluntary,
+        "involuntary_ctx_switches/s": ctx_switches.involuntary,
+    }
+
+
+def _read_memory_full_psutil(process: psutil.Process) -> dict[str, int]:
+    info = process.memory_full_info()
+    # pss is only available on Linux.
+    return {"uss": info.uss, "pss": getattr(info, "pss", 0)}
+
+
+def _read_io_procfs(reader: ProcfsReader, pid: int) -> dict[str, int]:
+    read_bytes, write_bytes = reader.read_io(pid) or (0, 0)
+    return {"read MB/s": read_bytes, "write MB/s": write_bytes}
+
+
+def _read_threads_procfs(reader: ProcfsReader, pid: int) -> dict[str, int]:
+    status = reader.read_status(pid)
+    return {
+        "num_threads": status.get("Threads", 0),
+        "num_fds": reader.count_fds(pid),
+        "voluntary_ctx_switches/s": status.get("voluntary_ctxt_switches", 0),
+        "involuntary_ctx_switches/s": status.get("nonvoluntary_ctxt_switches", 0),
+    }
+
+
+def _read_memory_full_procfs(reader: ProcfsReader, pid: int) -> dict[str, int]:
+    uss, pss = reader.read_smaps_rollup(pid) or (0, 0)
+    return {"uss": uss, "pss": pss}
+
+
+_PSUTIL_TIER_READERS: dict[str, Callable[[psutil.Process], dict[str, int]]] = {
+    "io": _read_io_psutil,
+    "threads": _read_threads_psutil,
+    "memory_full": _read_memory_full_psutil,
+}
+_PROCFS_TIER_READERS: dict[str, Callable[[ProcfsReader, int], dict[str, int]]] = {
+    "io": _read_io_procfs,
+    "threads": _read_threads_procfs,
+    "memory_full": _read_memory_full_procfs,
+}
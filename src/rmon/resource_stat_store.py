@@ -1,19 +1,74 @@
 """Stores time-series resource utilization stats."""
 
+import queue
 import socket
-from datetime import datetime
+import threading
+import time
+from array import array
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable, Iterator, NamedTuple, Sequence
 
 from loguru import logger
+from .cgroup import CgroupStatCollector
 from .common import DEFAULT_BUFFERED_WRITE_COUNT
-from .models import ResourceType, ComputeNodeResourceStatConfig
+from .devices import DeviceStatCollector
+from .models import ResourceType, ComputeNodeResourceStatConfig, ProcessStatResults
+from .process_groups import ProcessGroupStatCollector
 from .plots import plot_to_file
-from .utils.sql import insert_rows, make_table
+from .process_result_sinks import PROCESS_RESULTS_TABLE
+from .resource_stat_collector import PROCESS_TIER_STATS, ResourceStatCollector
+from .utils.sql import (
+    KEYS_TABLE,
+    SCHEMA_VERSION,
+    connect,
+    make_create_table_query,
+    make_insert_query,
+)
+
+
+# Columns of the process table. Stats of extended tiers that are not enabled are null.
+_PROCESS_COLUMNS = ResourceStatCollector.PROCESS_STATS + tuple(
+    x for stats in PROCESS_TIER_STATS.values() for x in stats
+)
+
+# Array typecodes of the column types. Other types are buffered in lists.
+_TYPECODES = {int: "q", float: "d", bool: "q"}
+# Seconds between checks of the writer thread while waiting for space in its queue
+_POLL_INTERVAL = 0.1
+
+# Resource types that are stored in long tables with one row per key per interval
+_KEYED_STATS = {
+    ResourceType.PROCESS_GROUP: ProcessGroupStatCollector.STATS,
+    ResourceType.CGROUP: CgroupStatCollector.STATS,
+    ResourceType.PERCPU: DeviceStatCollector.PERCPU_STATS,
+    ResourceType.PERDISK: DeviceStatCollector.PERDISK_STATS,
+    ResourceType.PERNIC: DeviceStatCollector.PERNIC_STATS,
+}
 
 
 class ResourceStatStore:
-    """Stores resource utilization stats in a SQLite database on a periodic basis."""
+    """Stores resource utilization stats in a SQLite database on a periodic basis.
+
+    The store keeps one connection open for its lifetime, with the pragmas of the config. Each
+    flush inserts the buffered rows of all resource types in a single transaction. Call close
+    when done.
+
+    The schema version is stored as the user_version of the database. Timestamps are seconds
+    since the epoch. Tables with one row per key per interval, such as the process table, store
+    an integer key_id that references the keys table, and they are indexed by key_id and
+    timestamp. Each table has a view named <table>_view with local times and key names.
+
+    Rows are buffered in one array per column. The store flushes all buffers when any of these
+    limits is reached: buffered_write_count rows of one resource type, config.max_buffer_bytes
+    estimated bytes in all buffers, or config.max_buffer_age seconds since the oldest buffered
+    row. The age is checked on every call to record_stats, and so no more than max_buffer_age
+    plus one interval of data is lost if the process is killed.
+
+    If config.background_writes is True, flushes hand their rows to a writer thread through a
+    bounded queue so that slow writes don't delay collection. A flush waits up to
+    config.write_queue_timeout seconds for space in the queue and otherwise drops its rows,
+    which are counted in get_write_stats. close waits for all queued rows to be written.
+    """
 
     def __init__(
         self,
@@ -25,15 +80,39 @@ class ResourceStatStore:
     ) -> None:
         self._config = config
         self._buffered_write_count = buffered_write_count
-        self._bufs: dict[ResourceType, list[tuple]] = {}
+        self._bufs: dict[ResourceType, _ColumnBuffer] = {}
+        # Enabled resource types without a table, which were reported once
+        self._missing_tables: set[ResourceType] = set()
+        # Monotonic time at which the oldest buffered row was recorded
+        self._oldest_row_time: float | None = None
+        self._num_buffered_bytes = 0
+        self._insert_queries: dict[ResourceType, str] = {}
+        self._key_ids: dict[str, int] = {}
+        # Keys that were assigned IDs since the last flush
+        self._new_keys: list[tuple[int, str]] = []
+        # Rows of the process_results table, which is created with the first row
+        self._process_results: list[tuple] = []
+        self._has_process_results_table = False
         self._db_file = db_file
         self._name = name
+        # The connection is only used by the writer thread after the tables are created.
+        self._con = connect(db_file, config.sqlite_pragmas, check_same_thread=False)
         self._initialize_tables(stats)
+        self._num_batches_written = 0
+        self._num_rows_written = 0
+        self._num_rows_dropped = 0
+        self._writer = (
+            _BackgroundWriter(self._write_batch, config.write_queue_size)
+            if config.background_writes
+            else None
+        )
 
     def __del__(self) -> None:
         for resource_type in ResourceType:
             if self._bufs.get(resource_type, []):
                 logger.warning("Destructing with stats still in cache: {}", resource_type.value)
+        if self._writer is not None and self._writer.is_alive():
+            logger.warning("Destructing with a running writer thread. Call close() first.")
 
     @property
     def config(self) -> ComputeNodeResourceStatConfig:
@@ -45,37 +124,168 @@ class ResourceStatStore:
         """Set the selected config."""
         self._config = config
 
+    def close(self) -> None:
+        """Flush all cached data, wait for it to be written, and close the database
+        connection.
+        """
+        self._flush(timeout=None)
+        if self._writer is not None:
+            self._writer.close()
+        self._con.close()
+        logger.debug("Closed db_file={}", self._db_file)
+
     def flush(self) -> None:
-        """Flush all cached data to the database."""
-        for resource_type in ResourceType:
-            self._flush_resource_type(resource_type)
+        """Flush all cached data to the database in one transaction. With background writes,
+        queue the data for the writer thread instead.
+        """
+        self._flush(timeout=self._config.write_queue_timeout)
+
+    def get_write_stats(self) -> dict[str, int]:
+        """Return the numbers of flushed batches and rows that were written, of rows that were
+        dropped because the write queue was full, and of rows whose background write failed.
+        """
+        return {
+            "batches_written": self._num_batches_written,
+            "rows_written": self._num_rows_written,
+            "rows_dropped": self._num_rows_dropped,
+            "rows_failed": 0 if self._writer is None else self._writer.num_rows_failed,
+            "max_queue_depth": 0 if self._writer is None else self._writer.max_queue_depth,
+        }
+
+    def record_process_results(self, results: list[ProcessStatResults]) -> None:
+        """Buffer the results of finalized processes for the process_results table. They are
+        written with the next flush.
+        """
+        timestamp = time.time()
+        self._process_results += [
+            (timestamp, x.process_key, x.num_samples, x.total_cpu_seconds, x.model_dump_json())
+            for x in results
+        ]
+        if self._oldest_row_time is None and self._process_results:
+            self._oldest_row_time = time.monotonic()
+
+    def _flush(self, timeout: float | None) -> None:
+        bufs = {k: v for k, v in self._bufs.items() if v}
+        self._oldest_row_time = None
+        self._num_buffered_bytes = 0
+        if not bufs and not self._process_results:
+            return
+        for resource_type, buf in bufs.items():
+            self._bufs[resource_type] = buf.make_empty()
+        batch = _Batch(keys=self._new_keys, buffers=bufs, process_results=self._process_results)
+        self._new_keys = []
+        self._process_results = []
+        if self._writer is None:
+            self._write_batch(batch)
+        elif not self._writer.submit(batch, timeout):
+            # Later rows may reference the keys of the dropped rows.
+            self._new_keys[:0] = batch.keys
+            num_rows = batch.get_num_rows()
+            self._num_rows_dropped += num_rows
+            logger.warning(
+                "Dropped {} rows because the database writer is behind. Total dropped: {}",
+                num_rows,
+                self._num_rows_dropped,
+            )
+
+    def _write_batch(self, batch: "_Batch") -> None:
+        with self._con:
+            self._con.executemany(make_insert_query(KEYS_TABLE, 2), batch.keys)
+            for resource_type, buf in batch.buffers.items():
+                # The connection caches the prepared statement of each query.
+                self._con.executemany(self._insert_queries[resource_type], buf.rows())
+            if batch.process_results:
+                self._write_process_results(batch.process_results)
+        if batch.process_results:
+            self._has_process_results_table = True
+        self._num_batches_written += 1
+        self._num_rows_written += batch.get_num_rows()
+        logger.debug("Flushed resource_types={}", [x.value for x in batch.buffers])
+
+    def _write_process_results(self, rows: list[tuple]) -> None:
+        if not self._has_process_results_table:
+            row = {
+                "timestamp": 0.0,
+                "id": "",
+                "num_samples": 0,
+                "total_cpu_seconds": 0.0,
+                "results": "",
+            }
+            types = {k: type(v) for k, v in row.items()}
+            self._con.execute(make_create_table_query(PROCESS_RESULTS_TABLE, row, types=types))
+        self._con.executemany(make_insert_query(PROCESS_RESULTS_TABLE, len(rows[0])), rows)
 
     def plot_to_file(self) -> None:
         """Plots the stats to HTML files."""
         plot_to_file(self._db_file, name=self._name)
 
-    def record_stats(self, stats: dict[ResourceType, dict[str, Any]]) -> None:
-        """Records resource stats information for the current interval."""
-        timestamp = str(datetime.now())
+    def record_stats(
+        self,
+        stats: dict[ResourceType, dict[str, Any]],
+        timestamps: dict[ResourceType, float] | None = None,
+    ) -> None:
+        """Records resource stats information for the current interval.
+
+        Parameters
+        ----------
+        stats : dict
+            Stats keyed by resource type, as returned by ResourceStatCollector.get_stats
+        timestamps : dict | None
+            Optional capture times (seconds since the epoch) keyed by resource type, as returned
+            by ResourceStatCollector.get_capture_times. Resource types without a capture time
+            use the current time.
+        """
+        max_age = self._config.max_buffer_age
+        if (
+            max_age is not None
+            and self._oldest_row_time is not None
+            and time.monotonic() - self._oldest_row_time >= max_age
+        ):
+            self.flush()
+        now = time.time()
+        timestamps = timestamps or {}
         for rtype in ComputeNodeResourceStatConfig.list_system_resource_types():
-            if getattr(self._config, rtype.value):
-                row = {"timestamp": timestamp}
+            if getattr(self._config, rtype.value) and rtype in stats:
+                if rtype not in self._bufs:
+                    self._warn_missing_table(rtype)
+                    continue
+                row = {"timestamp": timestamps.get(rtype, now)}
                 row.update(stats[rtype])
                 self._add_stats(rtype, tuple(row.values()))
-        if self._config.process:
+        if self._config.process and ResourceType.PROCESS in stats:
+            timestamp = timestamps.get(ResourceType.PROCESS, now)
             for name, _stats in stats[ResourceType.PROCESS].items():
-                row = {"timestamp": timestamp, "id": name}
-                row.update(_stats)
-                self._add_stats(ResourceType.PROCESS, tuple(row.values()))
+                values = (_stats.get(x) for x in _PROCESS_COLUMNS)
+                key_id = self._get_key_id(name)
+                self._add_stats(ResourceType.PROCESS, (timestamp, key_id, *values))
+        for rtype, stat_names in _KEYED_STATS.items():
+            if getattr(self._config, rtype.value) and rtype in stats:
+                timestamp = timestamps.get(rtype, now)
+                for name, _stats in stats[rtype].items():
+                    values = (_stats[x] for x in stat_names)
+                    self._add_stats(rtype, (timestamp, self._get_key_id(name), *values))
+
+    def _get_key_id(self, name: str) -> int:
+        key_id = self._key_ids.get(name)
+        if key_id is None:
+            key_id = self._key_ids[name] = len(self._key_ids) + 1
+            self._new_keys.append((key_id, name))
+        return key_id
 
     def _add_stats(self, resource_type: ResourceType, values: tuple) -> None:
-        self._bufs[resource_type].append(values)
-        if len(self._bufs[resource_type]) >= self._buffered_write_count:
-            self._flush_resource_type(resource_type)
+        buf = self._bufs[resource_type]
+        self._num_buffered_bytes += buf.append(values)
+        if self._oldest_row_time is None:
+            self._oldest_row_time = time.monotonic()
+        max_bytes = self._config.max_buffer_bytes
+        if len(buf) >= self._buffered_write_count or (
+            max_bytes is not None and self._num_buffered_bytes >= max_bytes
+        ):
+            self.flush()
 
     @staticmethod
     def _fix_column_names(row: dict[str, Any]) -> dict[str, Any]:
-        converted = {"timestamp": ""}
+        converted: dict[str, Any] = {"timestamp": 0.0}
         illegal_chars = (" ", "/")
         for name, val in row.items():
             for char in illegal_chars:
@@ -84,41 +294,181 @@ class ResourceStatStore:
 
         return converted
 
-    def _flush_resource_type(self, resource_type: ResourceType) -> None:
-        rows = self._bufs[resource_type]
-        if rows:
-            insert_rows(self._db_file, resource_type.value.lower(), rows)
-            self._bufs[resource_type].clear()
-            logger.debug("Flushed resource_type={}", resource_type.value)
-
     def _initialize_tables(self, stats: dict[ResourceType, dict[str, Any]]) -> None:
-        make_table(
-            self._db_file,
-            ResourceType.CPU.value.lower(),
-            self._fix_column_names(stats[ResourceType.CPU]),
-        )
-        self._bufs[ResourceType.CPU] = []
-        make_table(
-            self._db_file,
-            ResourceType.DISK.value.lower(),
-            self._fix_column_names(stats[ResourceType.DISK]),
-        )
-        self._bufs[ResourceType.DISK] = []
-        make_table(
-            self._db_file,
-            ResourceType.MEMORY.value.lower(),
-            self._fix_column_names(stats[ResourceType.MEMORY]),
-        )
-        self._bufs[ResourceType.MEMORY] = []
-        make_table(
-            self._db_file,
-            ResourceType.NETWORK.value.lower(),
-            self._fix_column_names(stats[ResourceType.NETWORK]),
-        )
-        self._bufs[ResourceType.NETWORK] = []
-        make_table(
-            self._db_file,
-            ResourceType.PROCESS.value.lower(),
-            {"timestamp": "", "id": "", "cpu_percent": 0.0, "rss": 0.0},
-        )
-        self._bufs[ResourceType.PROCESS] = []
+        with self._con:
+            self._con.execute(
+                make_create_table_query(KEYS_TABLE, {"id": 0, "name": ""}, primary_key="id")
+            )
+            for resource_type in ComputeNodeResourceStatConfig.list_system_resource_types():
+                # The initial stats determine the columns. Types that they lack, such as
+                # pressure from callers that predate it, don't get a table.
+                if resource_type in stats:
+                    self._make_table(resource_type, self._fix_column_names(stats[resource_type]))
+                elif getattr(self._config, resource_type.value):
+                    self._warn_missing_table(resource_type)
+            process_row = self._fix_column_names(
+                {"key_id": 0, **dict.fromkeys(_PROCESS_COLUMNS, 0.0)}
+            )
+            self._make_table(
+                ResourceType.PROCESS,
+                process_row,
+                types={k: type(v) for k, v in process_row.items()},
+            )
+            for resource_type, stat_names in _KEYED_STATS.items():
+                row: dict[str, Any] = {"key_id": 0}
+                row.update(dict.fromkeys(stat_names, 0.0))
+                self._make_table(resource_type, self._fix_column_names(row))
+            self._con.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def _warn_missing_table(self, resource_type: ResourceType) -> None:
+        if resource_type not in self._missing_tables:
+            logger.warning(
+                "{} stats are enabled but were not in the initial stats, such as because they "
+                "are not available on this system. Their table was not created, and they will "
+                "not be recorded.",
+                resource_type.value,
+            )
+            self._missing_tables.add(resource_type)
+
+    def _make_table(
+        self,
+        resource_type: ResourceType,
+        row: dict[str, Any],
+        types: dict[str, type] | None = None,
+    ) -> None:
+        table = resource_type.value.lower()
+        self._con.execute(make_create_table_query(table, row, types=types))
+        time_column = "strftime('%Y-%m-%d %H:%M:%f', timestamp, 'unixepoch', 'localtime') AS time"
+        if "key_id" in row:
+            self._con.execute(
+                f"CREATE INDEX {table}_key_id_timestamp ON {table}(key_id, timestamp)"
+            )
+            self._con.execute(
+                f"CREATE VIEW {table}_view AS SELECT {time_column}, {KEYS_TABLE}.name AS id, "
+                f"{table}.* FROM {table} JOIN {KEYS_TABLE} ON {KEYS_TABLE}.id = {table}.key_id"
+            )
+        else:
+            self._con.execute(f"CREATE VIEW {table}_view AS SELECT {time_column}, * FROM {table}")
+        self._insert_queries[resource_type] = make_insert_query(table, len(row))
+        column_types = types or {k: type(v) for k, v in row.items()}
+        self._bufs[resource_type] = _ColumnBuffer([_TYPECODES.get(column_types[x]) for x in row])
+        logger.debug("Created table={} in db_file={}", table, self._db_file)
+
+
+class _ColumnBuffer:
+    """Buffers the rows of one table in one array per column. A column whose type has no array
+    typecode, or that receives a value that doesn't fit its array, such as a null, is buffered
+    in a list.
+    """
+
+    __slots__ = ("_columns", "_typecodes", "_num_rows")
+
+    def __init__(self, typecodes: Sequence[str | None]) -> None:
+        self._typecodes = list(typecodes)
+        self._columns: list[array | list] = [array(x) if x else [] for x in typecodes]
+        self._num_rows = 0
+
+    def __len__(self) -> int:
+        return self._num_rows
+
+    def append(self, values: tuple) -> int:
+        """Append a row and return its estimated size in bytes."""
+        try:
+            for column, val in zip(self._columns, values):
+                column.append(val)
+        except (TypeError, OverflowError):
+            self._append_remaining(values)
+        self._num_rows += 1
+        return 8 * len(values)
+
+    def _append_remaining(self, values: tuple) -> None:
+        """Append the values of the columns that don't have the current row yet."""
+        for i, (column, val) in enumerate(zip(self._columns, values)):
+            if len(column) > self._num_rows:
+                continue
+            try:
+                column.append(val)
+            except (TypeError, OverflowError):
+                # Buffer this column in a list from now on.
+                self._typecodes[i] = None
+                self._columns[i] = column = list(column)
+                column.append(val)
+
+    def make_empty(self) -> "_ColumnBuffer":
+        """Return an empty buffer with the same column types."""
+        return _ColumnBuffer(self._typecodes)
+
+    def rows(self) -> Iterator[tuple]:
+        """Return an iterator over the rows."""
+        return zip(*self._columns)
+
+
+class _Batch(NamedTuple):
+    """Rows to write in one transaction"""
+
+    # (key_id, name) of the keys that were added since the previous batch
+    keys: list[tuple[int, str]]
+    buffers: dict[ResourceType, _ColumnBuffer]
+    # Rows of the process_results table
+    process_results: list[tuple]
+
+    def get_num_rows(self) -> int:
+        """Return the number of rows of stats and process results."""
+        return sum(len(x) for x in self.buffers.values()) + len(self.process_results)
+
+
+class _BackgroundWriter:
+    """Writes batches of rows in a thread, in the order in which they were submitted."""
+
+    def __init__(self, write_func: Callable[[_Batch], None], queue_size: int) -> None:
+        self._write_func = write_func
+        self._queue: queue.Queue[_Batch | None] = queue.Queue(maxsize=queue_size)
+        self.max_queue_depth = 0
+        self.num_rows_failed = 0
+        self._thread = threading.Thread(target=self._run, name="rmon-db-writer", daemon=True)
+        self._thread.start()
+
+    def is_alive(self) -> bool:
+        """Return True if the thread is running."""
+        return self._thread.is_alive()
+
+    def submit(self, batch: _Batch, timeout: float | None) -> bool:
+        """Queue a batch, waiting up to timeout seconds for space, or as long as the thread runs
+        if timeout is None. Return False if the queue stayed full or the thread stopped.
+        """
+        if not self._put(batch, timeout):
+            return False
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return True
+
+    def close(self) -> None:
+        """Wait for all queued batches to be written and stop the thread."""
+        if not self._put(None, None):
+            logger.error("The database writer thread stopped unexpectedly")
+        self._thread.join()
+
+    def _put(self, item: _Batch | None, timeout: float | None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # Wait in bounded steps so that a stopped thread can't block the caller forever.
+        while self._thread.is_alive():
+            wait = _POLL_INTERVAL if deadline is None else deadline - time.monotonic()
+            try:
+                self._queue.put(item, timeout=max(0.0, min(wait, _POLL_INTERVAL)))
+                return True
+            except queue.Full:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return False
+        return False
+
+    def _run(self) -> None:
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                break
+            try:
+                self._write_func(batch)
+            except Exception:  # pylint: disable=broad-exception-caught
+                # Any error must not stop the thread, which would block close.
+                num_rows = batch.get_num_rows()
+                self.num_rows_failed += num_rows
+                logger.exception("Failed to write {} rows to the database", num_rows)
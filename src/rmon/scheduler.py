@@ -0,0 +1,110 @@
+"""Schedules resource stat collection on a fixed-rate interval."""
+
+import time
+from typing import Any, Callable, Optional
+
+from .common import MIN_INTERVAL
+
+
+class FixedRateScheduler:
+    """Schedules ticks on a fixed grid of deadlines derived from a monotonic clock.
+
+    The time spent performing the work for one tick does not delay the following ticks. If the
+    work for a tick runs past the next deadline, the tick is counted as an overrun and the next
+    tick starts immediately. Any deadlines that passed entirely during an overrun are counted as
+    missed ticks and skipped.
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Any] = time.sleep,
+    ) -> None:
+        self._check_interval(interval)
+        self._interval = interval
+        self._clock = clock
+        self._sleep = sleep
+        self._next_deadline = self._clock()
+        self._num_ticks = 0
+        self._num_overruns = 0
+        self._num_missed_ticks = 0
+        self._max_tick_duration = 0.0
+        self._tick_start: Optional[float] = None
+
+    @staticmethod
+    def _check_interval(interval: float) -> None:
+        if interval < MIN_INTERVAL:
+            msg = f"interval={interval} must be at least {MIN_INTERVAL} seconds"
+            raise ValueError(msg)
+
+    @property
+    def interval(self) -> float:
+        """Return the interval in seconds."""
+        return self._interval
+
+    @interval.setter
+    def interval(self, interval: float) -> None:
+        """Set the interval in seconds. The next tick is rescheduled relative to the previous
+        deadline.
+        """
+        self._check_interval(interval)
+        self._next_deadline += interval - self._interval
+        self._interval = interval
+
+    @property
+    def num_missed_ticks(self) -> int:
+        """Return the number of deadlines that were skipped because of overruns."""
+        return self._num_missed_ticks
+
+    @property
+    def num_overruns(self) -> int:
+        """Return the number of ticks whose work ran past the next deadline."""
+        return self._num_overruns
+
+    @property
+    def num_ticks(self) -> int:
+        """Return the number of completed ticks."""
+        return self._num_ticks
+
+    def get_stats(self) -> dict[str, Any]:
+        """Return a summary of the scheduling behavior."""
+        return {
+            "interval": self._interval,
+            "num_ticks": self._num_ticks,
+            "num_overruns": self._num_overruns,
+            "num_missed_ticks": self._num_missed_ticks,
+            "max_tick_duration": self._max_tick_duration,
+        }
+
+    def is_tick_due(self) -> bool:
+        """Return True if the deadline for the next tick has passed."""
+        return self._clock() >= self._next_deadline
+
+    def time_until_next_tick(self) -> float:
+        """Return the number of seconds until the next deadline, or 0 if it has passed."""
+        return max(0.0, self._next_deadline - self._clock())
+
+    def wait_for_next_tick(self) -> None:
+        """Sleep until the next deadline."""
+        remaining = self.time_until_next_tick()
+        if remaining > 0:
+            self._sleep(remaining)
+
+    def start_tick(self) -> None:
+        """Record the start of the work for one tick."""
+        self._tick_start = self._clock()
+
+    def complete_tick(self) -> None:
+        """Record the completion of the work for one tick and schedule the next deadline."""
+        now = self._clock()
+        if self._tick_start is not None:
+            self._max_tick_duration = max(self._max_tick_duration, now - self._tick_start)
+            self._tick_start = None
+        self._num_ticks += 1
+        self._next_deadline += self._interval
+        if now > self._next_deadline:
+            self._num_overruns += 1
+            missed = int((now - self._next_deadline) // self._interval)
+            self._num_missed_ticks += missed
+            self._next_deadline += missed * self._interval
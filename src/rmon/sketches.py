@@ -0,0 +1,196 @@
+"""Streaming quantile sketches"""
+
+import math
+from typing import Any
+
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+DEFAULT_MAX_NUM_BINS = 2048
+
+
+class DDSketch:
+    """Quantile sketch with relative-error guarantees, as described in "DDSketch: A Fast and
+    Fully-Mergeable Quantile Sketch with Relative-Error Guarantees" (Masson et al., 2019).
+
+    Values are counted in logarithmically-sized bins, and so any quantile is estimated within
+    relative_accuracy of the true value. Memory is bounded by max_num_bins per sign. If a sketch
+    exceeds that, the bins of its smallest positive values or of its most negative values are
+    collapsed, which only affects the accuracy of the lowest quantiles. Sketches with the same
+    parameters can be merged, and they can be serialized with to_dict.
+    """
+
+    def __init__(
+        self,
+        relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+        max_num_bins: int = DEFAULT_MAX_NUM_BINS,
+    ) -> None:
+        if not 0 < relative_accuracy < 1:
+            msg = f"relative_accuracy must be between 0 and 1: {relative_accuracy}"
+            raise ValueError(msg)
+        if max_num_bins < 1:
+            msg = f"max_num_bins must be at least 1: {max_num_bins}"
+            raise ValueError(msg)
+        self._relative_accuracy = relative_accuracy
+        self._max_num_bins = max_num_bins
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        # Values with a magnitude below this are counted as zero.
+        self._min_indexable_value = math.exp(-1000 * self._log_gamma)
+        # Counts for positive values and the magnitudes of negative values. The lowest positive
+        # values and the highest magnitudes of negative values are the lowest quantiles.
+        self._positive = _Bins(max_num_bins, collapse_highest=False)
+        self._negative = _Bins(max_num_bins, collapse_highest=True)
+        self._zero_count = 0
+        self._count = 0
+        self._min = math.inf
+        self._max = -math.inf
+
+    @property
+    def count(self) -> int:
+        """Return the number of values added to the sketch."""
+        return self._count
+
+    @property
+    def relative_accuracy(self) -> float:
+        """Return the relative accuracy of quantile estimates."""
+        return self._relative_accuracy
+
+    def add(self, val: float) -> None:
+        """Add a value to the sketch. NaN values are ignored."""
+        if math.isnan(val):
+            return
+        if val > self._min_indexable_value:
+            self._positive.add(self._index(val), 1)
+        elif val < -self._min_indexable_value:
+            self._negative.add(self._index(-val), 1)
+        else:
+            self._zero_count += 1
+        self._count += 1
+        self._min = min(self._min, val)
+        self._max = max(self._max, val)
+
+    def merge(self, other: "DDSketch") -> None:
+        """Add the values of another sketch to this sketch."""
+        if other.relative_accuracy != self._relative_accuracy:
+            msg = (
+                "Cannot merge sketches with different relative accuracies: "
+                f"{self._relative_accuracy} {other.relative_accuracy}"
+            )
+            raise ValueError(msg)
+        for index, count in other._positive.counts.items():
+            self._positive.add(index, count)
+        for index, count in other._negative.counts.items():
+            self._negative.add(index, count)
+        self._zero_count += other._zero_count
+        self._count += other._count
+        self._min = min(self._min, other._min)
+        self._max = max(self._max, other._max)
+
+    def get_quantile(self, quantile: float) -> float | None:
+        """Return the estimated value at quantile, which must be between 0 and 1. Returns None if
+        the sketch is empty.
+        """
+        if not 0 <= quantile <= 1:
+            msg = f"quantile must be between 0 and 1: {quantile}"
+            raise ValueError(msg)
+        if self._count == 0:
+            return None
+        # The extremes are tracked exactly.
+        if quantile == 0:
+            return self._min
+        if quantile == 1:
+            return self._max
+
+        rank = quantile * (self._count - 1)
+        total = 0
+        negative = self._negative.counts
+        for index in sorted(negative, reverse=True):
+            total += negative[index]
+            if total > rank:
+                return self._clamp(-self._value(index))
+        total += self._zero_count
+        if total > rank:
+            return 0.0
+        positive = self._positive.counts
+        for index in sorted(positive):
+            total += positive[index]
+            if total > rank:
+                return self._clamp(self._value(index))
+        return self._max
+
+    def to_dict(self) -> dict[str, Any]:
+        """Return a JSON-serializable representation of the sketch."""
+        return {
+            "relative_accuracy": self._relative_accuracy,
+            "max_num_bins": self._max_num_bins,
+            "count": self._count,
+            "zero_count": self._zero_count,
+            "min": self._min if self._count else None,
+            "max": self._max if self._count else None,
+            "positive": sorted(self._positive.counts.items()),
+            "negative": sorted(self._negative.counts.items()),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "DDSketch":
+        """Construct a sketch from the output of to_dict."""
+        sketch = cls(
+            relative_accuracy=data["relative_accuracy"], max_num_bins=data["max_num_bins"]
+        )
+        for index, count in data["positive"]:
+            sketch._positive.add(int(index), count)
+        for index, count in data["negative"]:
+            sketch._negative.add(int(index), count)
+        sketch._zero_count = data["zero_count"]
+        sketch._count = data["count"]
+        if sketch._count:
+            sketch._min = data["min"]
+            sketch._max = data["max"]
+        return sketch
+
+    def _index(self, val: float) -> int:
+        return math.ceil(math.log(val) / self._log_gamma)
+
+    def _value(self, index: int) -> float:
+        # This is the midpoint of the bin in relative terms.
+        return 2 * self._gamma**index / (self._gamma + 1)
+
+    def _clamp(self, val: float) -> float:
+        return min(max(val, self._min), self._max)
+
+
+class _Bins:
+    """Counts per bin index, with at most max_num_bins bins. If there are more, the bins at the
+    lowest indexes, or the highest if collapse_highest is True, are merged into one.
+    """
+
+    def __init__(self, max_num_bins: int, collapse_highest: bool) -> None:
+        self.counts: dict[int, int] = {}
+        self._max_num_bins = max_num_bins
+        # The collapsing end is the lowest end of the keys, which are the indexes times sign.
+        self._sign = -1 if collapse_highest else 1
+        # Key of the bin that holds the collapsed counts, which is the lowest key. Lower keys
+        # are added to it. None until the first collapse.
+        self._limit: int | None = None
+
+    def add(self, index: int, count: int) -> None:
+        """Add count to the bin at index."""
+        if self._limit is not None and self._sign * index < self._limit:
+            index = self._sign * self._limit
+        self.counts[index] = self.counts.get(index, 0) + count
+        if len(self.counts) > self._max_num_bins:
+            self._collapse()
+
+    def _collapse(self) -> None:
+        """Merge the bin with the lowest key into the next one."""
+        sign = self._sign
+        if self._limit is None:
+            self._limit = min(sign * x for x in self.counts)
+        count = self.counts.pop(sign * self._limit)
+        # Only the limit increases, and so the scans of all collapses add up to the range of
+        # the indexes.
+        key = self._limit + 1
+        while sign * key not in self.counts:
+            key += 1
+        self.counts[sign * key] += count
+        self._limit = key
@@ -1,15 +1,69 @@
 """Utility functions for interacting with a SQLite database"""
 
+import itertools
 import sqlite3
+from array import array
+from contextlib import closing
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Iterable, Iterator, Optional, Sequence
 
 from loguru import logger
 
 
+try:
+    import numpy as np  # type: ignore
+except ImportError:
+    np = None
+
+
 _TYPE_MAP = {int: "INTEGER", float: "REAL", str: "TEXT", bool: "INTEGER"}
 
+# Version of the schema of the stats database, which is stored as its user_version
+# 1: TEXT timestamps in ISO format and TEXT id columns. Databases without a version use this.
+# 2: REAL timestamps in seconds since the epoch, and key_id columns that reference the keys table
+#    instead of id columns, with an index on (key_id, timestamp)
+SCHEMA_VERSION = 2
+KEYS_TABLE = "keys"
+
+DEFAULT_CHUNK_SIZE = 10_000
+# Typecodes of the arrays that hold the values of columns, by declared type
+_ARRAY_TYPECODES = {"INTEGER": "q", "REAL": "d"}
+
+# WAL journaling avoids rewriting a rollback journal on every commit, and synchronous=NORMAL only
+# syncs the WAL at checkpoints. A crash of the application can't corrupt the database in this
+# mode, though a power loss can roll back the last transactions.
+DEFAULT_PRAGMAS: dict[str, str | int] = {"journal_mode": "WAL", "synchronous": "NORMAL"}
+
+
+def connect(
+    db_file: Path,
+    pragmas: Optional[dict[str, str | int]] = None,
+    check_same_thread: bool = True,
+) -> sqlite3.Connection:
+    """Open a connection that is meant to be kept open for many transactions.
+
+    Parameters
+    ----------
+    db_file : Path
+        Database file. Create if it doesn't already exist.
+    pragmas : dict | None
+        Pragmas to set on the connection, such as {"synchronous": "OFF"}. Defaults to
+        DEFAULT_PRAGMAS.
+    check_same_thread : bool
+        If False, allow the connection to be used by a thread other than the one that created
+        it. The caller must ensure that only one thread uses it at a time.
+    """
+    con = sqlite3.connect(db_file, check_same_thread=check_same_thread)
+    for name, value in (DEFAULT_PRAGMAS if pragmas is None else pragmas).items():
+        if not name.isidentifier() or not str(value).replace("-", "").isalnum():
+            con.close()
+            msg = f"Invalid SQLite pragma: {name}={value}"
+            raise ValueError(msg)
+        con.execute(f"PRAGMA {name}={value}")
+    logger.debug("Connected to db_file={} with pragmas={}", db_file, pragmas)
+    return con
+
 
 def make_table(
     db_file: Path, table: str, row: dict[str, Any], primary_key=None, types=None
@@ -29,6 +83,16 @@ def make_table(
         If a dict is passed, use it as a mapping of column to type.
         This is required if values can be null.
     """
+    with sqlite3.connect(db_file) as con:
+        cur = con.cursor()
+        cur.execute(make_create_table_query(table, row, primary_key=primary_key, types=types))
+        con.commit()
+    con.close()
+    logger.debug("Created table={} in db_file={}", table, db_file)
+
+
+def make_create_table_query(table: str, row: dict[str, Any], primary_key=None, types=None) -> str:
+    """Return the query that creates a table. Refer to make_table for the parameters."""
     schema = []
     for name, val in row.items():
         if types is None:
@@ -40,13 +104,14 @@ def make_table(
             entry += " PRIMARY KEY"
         schema.append(entry)
 
-    with sqlite3.connect(db_file) as con:
-        cur = con.cursor()
-        schema_text = ", ".join(schema)
-        cur.execute(f"CREATE TABLE {table}({schema_text})")
-        con.commit()
-    con.close()
-    logger.debug("Created table={} in db_file={}", table, db_file)
+    schema_text = ", ".join(schema)
+    return f"CREATE TABLE {table}({schema_text})"
+
+
+def make_insert_query(table: str, num_columns: int) -> str:
+    """Return the query that inserts one row of num_columns values into a table."""
+    placeholder = ",".join(["?"] * num_columns)
+    return f"INSERT INTO {table} VALUES({placeholder})"
 
 
 def insert_rows(db_file: Path, table: str, rows: list[tuple]) -> None:
@@ -65,14 +130,185 @@ def insert_rows(db_file: Path, table: str, rows: list[tuple]) -> None:
 
     with sqlite3.connect(db_file) as con:
         cur = con.cursor()
-        placeholder = ",".join(["?"] * len(rows[0]))
-        query = f"INSERT INTO {table} VALUES({placeholder})"
-        cur.executemany(query, rows)
+        cur.executemany(make_insert_query(table, len(rows[0])), rows)
         con.commit()
     con.close()
     logger.debug("Inserted rows into table={} in db_file={}", table, db_file)
 
 
+def get_schema_version(db_file: Path) -> int:
+    """Return the version of the schema of the stats database."""
+    with sqlite3.connect(db_file) as con:
+        version = con.execute("PRAGMA user_version").fetchone()[0]
+    con.close()
+    return version or 1
+
+
+def _read_key_names(cur: sqlite3.Cursor) -> dict[int, str]:
+    return dict(cur.execute(f"SELECT id, name FROM {KEYS_TABLE}").fetchall())
+
+
+def _convert_timestamp(value: str | float) -> datetime:
+    # Schema version 1 stored ISO-format strings.
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return datetime.fromtimestamp(value)
+
+
+def _to_epoch(value: str | float) -> float:
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).timestamp()
+    return value
+
+
+def _to_column(values: Iterable[Any], typecode: str | None) -> Sequence[Any]:
+    """Return the values in an array if they all fit the typecode, and otherwise in a list."""
+    values = list(values)
+    if typecode is not None:
+        try:
+            return array(typecode, values)
+        except (TypeError, OverflowError):
+            # Columns can store NULL or values of other types, such as REAL in INTEGER columns.
+            if typecode == "q":
+                return _to_column(values, "d")
+    return values
+
+
+def _join_columns(parts: list[Sequence[Any]], typecode: str | None) -> Sequence[Any]:
+    if not parts:
+        return _to_column([], typecode)
+    typecodes = {getattr(x, "typecode", None) for x in parts}
+    if len(parts) == 1 or (len(typecodes) == 1 and None not in typecodes):
+        column = parts[0]
+        for part in parts[1:]:
+            column.extend(part)  # type: ignore
+        return column
+    return _to_column(itertools.chain.from_iterable(parts), None if None in typecodes else "d")
+
+
+def _to_numpy(column: Sequence[Any]) -> Any:
+    if np is not None and isinstance(column, array):
+        return np.array(column)
+    return column
+
+
+def _to_list(column: Any) -> list[Any]:
+    return column if isinstance(column, list) else column.tolist()
+
+
+class _ColumnQuery:
+    """Query that reads columns of a table of the stats database in one pass"""
+
+    def __init__(
+        self,
+        cur: sqlite3.Cursor,
+        table: str,
+        columns: Optional[list[str]],
+        filters: Optional[dict[str, Any]],
+        start: float | datetime | None,
+        end: float | datetime | None,
+        group_by_key: bool = False,
+    ) -> None:
+        self._cur = cur
+        declared_types = {x[1]: x[2] for x in cur.execute(f"PRAGMA table_info({table})")}
+        if not declared_types:
+            msg = f"{table=} does not exist"
+            raise ValueError(msg)
+        self._has_key_ids = "key_id" in declared_types
+        self._key_names = _read_key_names(cur) if self._has_key_ids else {}
+        self._has_text_timestamps = cur.execute("PRAGMA user_version").fetchone()[0] < 2
+        available = [("id" if x == "key_id" else x) for x in declared_types]
+        self.columns = columns or available
+        if group_by_key:
+            self.columns = ["id", *(x for x in self.columns if x != "id")]
+        filters = filters or {}
+        time_range = {} if start is None and end is None else {"timestamp": None}
+        for column in (*self.columns, *filters, *time_range):
+            if column not in available:
+                msg = f"{column=} is not in {table=}: {available}"
+                raise ValueError(msg)
+        self.typecodes = [
+            "d" if x == "timestamp" else _ARRAY_TYPECODES.get(declared_types.get(x, ""))
+            for x in self.columns
+        ]
+
+        key_column = "key_id" if self._has_key_ids else "id"
+        selected = ", ".join(key_column if x == "id" else x for x in self.columns)
+        self._text = f"SELECT {selected} FROM {table}"
+        self._params: list[Any] = []
+        conditions = self._make_conditions(filters, start, end)
+        if conditions:
+            self._text += " WHERE " + " AND ".join(conditions)
+        # Scanning the table in rowid order is faster than ordering by key through the index.
+        self._text += " ORDER BY rowid"
+
+    def _make_conditions(
+        self,
+        filters: dict[str, Any],
+        start: float | datetime | None,
+        end: float | datetime | None,
+    ) -> list[str]:
+        conditions = []
+        key_ids = {v: k for k, v in self._key_names.items()}
+        for column, value in filters.items():
+            if column == "id" and self._has_key_ids:
+                # A key that is not in the table matches no rows.
+                column, value = "key_id", key_ids.get(value)
+            conditions.append(f"{column} = ?")
+            self._params.append(value)
+        for operator, bound in ((">=", start), ("<", end)):
+            if bound is not None:
+                if not isinstance(bound, datetime):
+                    bound = datetime.fromtimestamp(bound)
+                if self._has_text_timestamps:
+                    # The strings can have different numbers of fractional digits. SQLite
+                    # compares their times to the millisecond.
+                    conditions.append(f"julianday(timestamp) {operator} julianday(?)")
+                    self._params.append(str(bound))
+                else:
+                    conditions.append(f"timestamp {operator} ?")
+                    self._params.append(bound.timestamp())
+        return conditions
+
+    def iter_chunks(self, chunk_size: int) -> Iterator[dict[str, Sequence[Any]]]:
+        """Run the query and return the values of each chunk of rows by column."""
+        for rows in self._iter_rows(chunk_size):
+            yield self._to_columns(rows)
+
+    def iter_chunks_by_key(self, chunk_size: int) -> Iterator[dict[str, dict[str, Sequence[Any]]]]:
+        """Run the query and return the values of each chunk of rows by key and column. The
+        query must have been created with group_by_key.
+        """
+        for chunk in self._iter_rows(chunk_size):
+            groups: dict[Any, list[tuple]] = {}
+            for row in chunk:
+                groups.setdefault(row[0], []).append(row)
+            yield {
+                self._key_names[k] if self._has_key_ids else k: self._to_columns(v, first=1)
+                for k, v in groups.items()
+            }
+
+    def _iter_rows(self, chunk_size: int) -> Iterator[list[tuple]]:
+        if chunk_size < 1:
+            msg = f"chunk_size must be at least 1: {chunk_size}"
+            raise ValueError(msg)
+        self._cur.execute(self._text, self._params)
+        while rows := self._cur.fetchmany(chunk_size):
+            yield rows
+
+    def _to_columns(self, rows: list[tuple], first: int = 0) -> dict[str, Sequence[Any]]:
+        columns = {}
+        for column, values, typecode in itertools.islice(
+            zip(self.columns, zip(*rows), self.typecodes), first, None
+        ):
+            if column == "id" and self._has_key_ids:
+                values = tuple(map(self._key_names.__getitem__, values))
+            elif column == "timestamp" and self._has_text_timestamps:
+                values = tuple(map(_to_epoch, values))
+            columns[column] = _to_column(values, typecode)
+        return columns
+
+
 def read_table(db_file: Path, table: str) -> tuple[list[tuple], list[str]]:
     """Read all rows from the table.
 
@@ -94,79 +330,180 @@ def read_table(db_file: Path, table: str) -> tuple[list[tuple], list[str]]:
         return rows, columns
 
 
+def iter_table_chunks(
+    db_file: Path,
+    table: str,
+    columns: Optional[list[str]] = None,
+    filters: Optional[dict[str, Any]] = None,
+    start: float | datetime | None = None,
+    end: float | datetime | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[dict[str, Any]]:
+    """Stream the rows of a table in chunks. Refer to read_columns for the parameters.
+
+    Yields
+    ------
+    dict
+        Values of up to chunk_size rows, keyed by the columns
+    """
+    with closing(sqlite3.connect(db_file)) as con:
+        query = _ColumnQuery(con.cursor(), table, columns, filters, start, end)
+        for chunk in query.iter_chunks(chunk_size):
+            yield {k: _to_numpy(v) for k, v in chunk.items()}
+
+
+def read_columns(
+    db_file: Path,
+    table: str,
+    columns: Optional[list[str]] = None,
+    filters: Optional[dict[str, Any]] = None,
+    start: float | datetime | None = None,
+    end: float | datetime | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> dict[str, Any]:
+    """Read columns of a table with one query.
+
+    Numeric columns are returned as NumPy arrays if NumPy is installed, and otherwise as arrays
+    from the array module. Columns with text or NULL values are returned as lists. Timestamps
+    are returned as seconds since the epoch, and the key_id column of a table as an id column
+    with the names of the keys, for all schema versions.
+
+    Parameters
+    ----------
+    db_file : Path
+    table : str
+    columns : list[str] | None
+        Only read these columns. If None, read all columns.
+    filters : dict | None
+        Only read the rows where the columns have these values.
+    start : float | datetime | None
+        Only read the rows at or after this time, in seconds since the epoch.
+    end : float | datetime | None
+        Only read the rows before this time, in seconds since the epoch.
+    chunk_size : int
+        Number of rows to fetch from the database at a time
+
+    Returns
+    -------
+    dict
+        Values keyed by the columns
+    """
+    with closing(sqlite3.connect(db_file)) as con:
+        query = _ColumnQuery(con.cursor(), table, columns, filters, start, end)
+        parts: dict[str, list[Sequence[Any]]] = {x: [] for x in query.columns}
+        for chunk in query.iter_chunks(chunk_size):
+            for column, values in chunk.items():
+                parts[column].append(values)
+    return {
+        column: _to_numpy(_join_columns(parts[column], typecode))
+        for column, typecode in zip(query.columns, query.typecodes)
+    }
+
+
+def read_columns_by_key(
+    db_file: Path,
+    table: str,
+    columns: Optional[list[str]] = None,
+    start: float | datetime | None = None,
+    end: float | datetime | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> dict[str, dict[str, Any]]:
+    """Read columns of a table with one row per key per interval, such as the process table,
+    with one query. Refer to read_columns for the parameters and the types of the values.
+
+    Returns
+    -------
+    dict
+        Keys are the names of the keys, such as process keys. Values are the columns of their
+        rows, excluding id.
+    """
+    with closing(sqlite3.connect(db_file)) as con:
+        query = _ColumnQuery(con.cursor(), table, columns, None, start, end, group_by_key=True)
+        parts: dict[str, dict[str, list[Sequence[Any]]]] = {}
+        for chunk in query.iter_chunks_by_key(chunk_size):
+            for key, key_chunk in chunk.items():
+                key_parts = parts.setdefault(key, {x: [] for x in key_chunk})
+                for column, values in key_chunk.items():
+                    key_parts[column].append(values)
+    typecodes = dict(zip(query.columns, query.typecodes))
+    return {
+        key: {x: _to_numpy(_join_columns(y, typecodes[x])) for x, y in key_parts.items()}
+        for key, key_parts in parts.items()
+    }
+
+
 def read_table_as_dict(
     db_file: Path,
     table: str,
     columns: Optional[list[str]] = None,
     timestamp_column: Optional[str] = None,
-    filters: Optional[dict[str, str]] = None,
+    filters: Optional[dict[str, Any]] = None,
 ) -> dict[str, list[Any]]:
-    """Read all rows from the table and return them as a dict keyed by the columns.
+    """Read all rows from the table and return them as a dict keyed by the columns. The key_id
+    column of a table is returned as an id column with the names of the keys. Use read_columns
+    to read large tables into arrays.
 
     Parameters
     ----------
-    db_file
-    table
+    db_file : Path
+    table : str
     columns
         Only read these columns. If None, return all columns.
     timestamp_column
-        If not None, treat this column as timestamp strings in ISO format.
+        If not None, convert this column to datetime objects. It can contain seconds since the
+        epoch or ISO-format strings.
     filters
-        If not None, insert these key/value pairs in the WHERE clause.
+        If not None, only read the rows where the columns have these values.
 
     Returns
     -------
     dict
     """
-    with sqlite3.connect(db_file) as con:
-        cur = con.cursor()
-        data = {}
-        where_clause = (
-            ""
-            if filters is None
-            else "WHERE " + " ".join([f"{k}='{v}'" for k, v in filters.items()])
-        )
-        cols = columns or list_column_names(db_file, table)
-        if timestamp_column is not None and timestamp_column not in cols:
-            msg = f"{timestamp_column=} is not in {cols=}"
+    data = {k: _to_list(v) for k, v in read_columns(db_file, table, columns, filters).items()}
+    if timestamp_column is not None:
+        if timestamp_column not in data:
+            msg = f"{timestamp_column=} is not in columns={list(data)}"
             raise ValueError(msg)
-
-        for column in cols:
-            query = f"SELECT {column} FROM {table} {where_clause}"
-            values = cur.execute(query).fetchall()
-            if timestamp_column is not None and column == timestamp_column:
-                values_ = [datetime.fromisoformat(x[0]) for x in values]
-            else:
-                values_ = [x[0] for x in values]
-            data[column] = values_
-        return data
+        data[timestamp_column] = [_convert_timestamp(x) for x in data[timestamp_column]]
+    return data
 
 
-def read_process_tables(db_file: Path, table: str) -> dict[str, dict[str, Any]]:
+def read_process_tables(
+    db_file: Path, table: str, columns: Optional[list[str]] = None
+) -> dict[str, dict[str, Any]]:
     """Return the process tables partitioned by ID.
 
+    Parameters
+    ----------
+    db_file
+    table
+    columns
+        Columns to read. Defaults to timestamp, cpu_percent, and rss.
+
     Returns
     -------
     dict
         Keys are identifers for each monitored process.
         Values are tables as dicts as returned by read_table_as_dict.
     """
+    process_data: dict[str, dict[str, Any]] = {}
+    tables = read_columns_by_key(db_file, table, columns or ["timestamp", "cpu_percent", "rss"])
+    for key, key_table in tables.items():
+        data = {k: _to_list(v) for k, v in key_table.items()}
+        if "timestamp" in data:
+            data["timestamp"] = [_convert_timestamp(x) for x in data["timestamp"]]
+        process_data[key] = data
+    return process_data
+
+
+def list_tables(db_file: Path) -> list[str]:
+    """Return the names of the tables in the database."""
     with sqlite3.connect(db_file) as con:
-        process_data: dict[str, dict[str, Any]] = {}
         cur = con.cursor()
-        query = f"SELECT DISTINCT id FROM {table}"
-        rows = cur.execute(query).fetchall()
-        for row in rows:
-            id_ = row[0]
-            process_data[id_] = read_table_as_dict(
-                db_file,
-                table,
-                columns=["timestamp", "cpu_percent", "rss"],
-                timestamp_column="timestamp",
-                filters={"id": id_},
-            )
-
-    return process_data
+        query = "SELECT name FROM sqlite_master WHERE type='table'"
+        data = [x[0] for x in cur.execute(query).fetchall()]
+    con.close()
+    return data
 
 
 def list_column_names(db_file: Path, table: str) -> list[str]:
@@ -0,0 +1,107 @@
+"""Tests the cgroup v2 collector"""
+
+from pathlib import Path
+
+import pytest
+
+from rmon.cgroup import CgroupStatCollector
+from rmon.models import ComputeNodeResourceStatConfig, ResourceType
+from rmon.resource_stat_aggregator import ResourceStatAggregator
+from rmon.resource_stat_collector import ResourceStatCollector
+
+
+JOB_CGROUP = "system.slice/slurmstepd.scope/job_1234"
+
+
+def _write_cgroup(
+    path: Path, usage_usec: int, rbytes: int, memory: int, peak: bool = True
+) -> None:
+    path.mkdir(parents=True, exist_ok=True)
+    (path / "cpu.stat").write_text(
+        f"usage_usec {usage_usec}\nuser_usec {usage_usec}\nsystem_usec 0\n"
+        "nr_periods 0\nnr_throttled 0\nthrottled_usec 0\n"
+    )
+    (path / "io.stat").write_text(
+        f"8:0 rbytes={rbytes} wbytes=0 rios=10 wios=0 dbytes=0 dios=0\n"
+        f"8:16 rbytes={rbytes} wbytes=0 rios=10 wios=0 dbytes=0 dios=0\n"
+    )
+    (path / "memory.current").write_text(f"{memory}\n")
+    if peak:
+        (path / "memory.peak").write_text(f"{memory * 2}\n")
+    (path / "pids.current").write_text("7\n")
+
+
+class FakeClock:
+    """Clock that only advances when told to."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_cgroup_stats(tmp_path, monkeypatch):
+    """Test the computation of cgroup stats from cgroupfs files."""
+    clock = FakeClock()
+    monkeypatch.setattr("rmon.cgroup.time.monotonic", clock)
+    _write_cgroup(tmp_path / JOB_CGROUP, usage_usec=0, rbytes=0, memory=100)
+    collector = CgroupStatCollector(tmp_path)
+    assert collector.get_stats([JOB_CGROUP, "missing"]) == {}
+
+    clock.now = 2.0
+    _write_cgroup(tmp_path / JOB_CGROUP, usage_usec=3_000_000, rbytes=1024 * 1024, memory=200)
+    stats = collector.get_stats([JOB_CGROUP])
+    job_stats = stats["/" + JOB_CGROUP]
+    assert set(job_stats) == set(CgroupStatCollector.STATS)
+    assert job_stats["cpu_percent"] == pytest.approx(150.0)
+    assert job_stats["read MB/s"] == pytest.approx(1.0)
+    assert job_stats["read IOPS"] == 0.0
+    assert job_stats["memory_current"] == 200
+    assert job_stats["memory_peak"] == 400
+    assert job_stats["pids_current"] == 7
+
+
+def test_discover_job_cgroup(tmp_path, monkeypatch):
+    """Test discovery of the Slurm job cgroup from /proc/self/cgroup."""
+    proc = tmp_path / "proc"
+    (proc / "self").mkdir(parents=True)
+    (proc / "self" / "cgroup").write_text(f"0::/{JOB_CGROUP}/step_0/user/task_0\n")
+    collector = CgroupStatCollector(tmp_path)
+    monkeypatch.setenv("SLURM_JOB_ID", "1234")
+    assert collector.discover_job_cgroup(proc) == "/" + JOB_CGROUP
+    monkeypatch.delenv("SLURM_JOB_ID")
+    assert collector.discover_job_cgroup(proc) == "/" + JOB_CGROUP
+
+    (proc / "self" / "cgroup").write_text("0::/user.slice/session-1.scope\n")
+    assert collector.discover_job_cgroup(proc) == "/user.slice/session-1.scope"
+    (proc / "self" / "cgroup").write_text("4:memory:/user.slice\n")
+    assert collector.discover_job_cgroup(proc) is None
+
+
+def test_cgroup_aggregation(tmp_path):
+    """Test collection and aggregation of cgroup stats."""
+    _write_cgroup(tmp_path / JOB_CGROUP, usage_usec=0, rbytes=0, memory=100, peak=False)
+    config = ComputeNodeResourceStatConfig(
+        cpu=False,
+        memory=False,
+        process=False,
+        cgroup=True,
+        cgroup_paths=[JOB_CGROUP],
+        cgroupfs_root=str(tmp_path),
+    )
+    collector = ResourceStatCollector()
+    agg = ResourceStatAggregator(config, collector.get_stats(config))
+    for memory in (200, 400):
+        _write_cgroup(tmp_path / JOB_CGROUP, usage_usec=0, rbytes=0, memory=memory, peak=False)
+        agg.update_stats(collector.get_stats(config))
+
+    results = agg.finalize_system_stats()
+    assert not results.results
+    assert len(results.keyed_results) == 1
+    result = results.keyed_results[0]
+    assert result.resource_type == ResourceType.CGROUP
+    assert result.key == "/" + JOB_CGROUP
+    assert result.num_samples == 2
+    assert result.average["memory_current"] == 300
+    assert result.maximum["memory_peak"] == 400
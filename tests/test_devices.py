@@ -0,0 +1,126 @@
+"""Tests the per-device collectors"""
+
+import time
+from collections import namedtuple
+
+import pytest
+
+from rmon.devices import DeviceStatCollector, filter_devices
+from rmon.models import ComputeNodeResourceStatConfig, ResourceType
+from rmon.plots import plot_to_file
+from rmon.resource_stat_aggregator import ResourceStatAggregator
+from rmon.resource_stat_collector import ResourceStatCollector
+from rmon.resource_stat_store import ResourceStatStore
+from rmon.utils.sql import read_table_as_dict
+
+
+CpuTimes = namedtuple("CpuTimes", ["user", "system", "idle", "iowait"])
+DiskCounters = namedtuple(
+    "DiskCounters", ["read_count", "write_count", "read_bytes", "write_bytes", "busy_time"]
+)
+
+
+class FakeClock:
+    """Clock that only advances when told to."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_filter_devices():
+    """Test the device include and exclude patterns."""
+    names = ["sda", "nvme0n1", "nvme1n1", "loop0", "lo", "eth0"]
+    assert filter_devices(names) == names
+    assert filter_devices(names, include=["nvme*"]) == ["nvme0n1", "nvme1n1"]
+    assert filter_devices(names, include=["nvme*"], exclude=["nvme1*"]) == ["nvme0n1"]
+    assert filter_devices(names, exclude=["loop*", "lo"]) == ["sda", "nvme0n1", "nvme1n1", "eth0"]
+
+
+def test_percpu_and_perdisk_stats(monkeypatch):
+    """Test the computation of per-CPU and per-disk stats from psutil counters."""
+    clock = FakeClock()
+    monkeypatch.setattr("rmon.devices.time.monotonic", clock)
+    cpu_times = [CpuTimes(0, 0, 0, 0), CpuTimes(0, 0, 0, 0)]
+    disks = {
+        "nvme0n1": DiskCounters(0, 0, 0, 0, 0),
+        "loop0": DiskCounters(0, 0, 0, 0, 0),
+    }
+    monkeypatch.setattr("rmon.devices.psutil.cpu_times", lambda percpu: cpu_times)
+    monkeypatch.setattr("rmon.devices.psutil.disk_io_counters", lambda perdisk: dict(disks))
+    collector = DeviceStatCollector()
+    assert collector.get_percpu_stats() == {}
+    assert collector.get_perdisk_stats() == {}
+
+    clock.now = 2.0
+    cpu_times[:] = [CpuTimes(75, 25, 0, 0), CpuTimes(10, 0, 80, 10)]
+    disks["nvme0n1"] = DiskCounters(20, 0, 4 * 1024 * 1024, 0, 1000)
+    stats = collector.get_percpu_stats(exclude=["cpu5"])
+    assert stats["cpu0"]["cpu_percent"] == pytest.approx(100.0)
+    assert stats["cpu0"]["user"] == pytest.approx(75.0)
+    assert stats["cpu1"]["cpu_percent"] == pytest.approx(10.0)
+    assert stats["cpu1"]["iowait"] == pytest.approx(10.0)
+
+    stats = collector.get_perdisk_stats(exclude=["loop*"])
+    assert list(stats) == ["nvme0n1"]
+    assert stats["nvme0n1"]["read MB/s"] == pytest.approx(2.0)
+    assert stats["nvme0n1"]["read IOPS"] == pytest.approx(10.0)
+    assert stats["nvme0n1"]["busy_percent"] == pytest.approx(50.0)
+
+
+def test_percpu_stats_guest_time(monkeypatch, tmp_path):
+    """Test that guest time, which Linux also counts in user time, is only counted once."""
+    monkeypatch.setattr("rmon.devices.psutil.PROCFS_PATH", str(tmp_path))
+    stat_file = tmp_path / "stat"
+    # Fields: user nice system idle iowait irq softirq steal guest guest_nice
+    stat_file.write_text("cpu  0 0 0 0 0 0 0 0 0 0\ncpu0 0 0 0 0 0 0 0 0 0 0\n")
+    collector = DeviceStatCollector()
+    assert collector.get_percpu_stats() == {}
+
+    stat_file.write_text("cpu  100 0 0 100 0 0 0 0 50 0\ncpu0 100 0 0 100 0 0 0 0 50 0\n")
+    stats = collector.get_percpu_stats()
+    assert stats["cpu0"]["user"] == pytest.approx(50.0)
+    assert stats["cpu0"]["idle"] == pytest.approx(50.0)
+    assert stats["cpu0"]["cpu_percent"] == pytest.approx(50.0)
+
+
+def test_device_stats_storage(tmp_path):
+    """Test aggregation, storage, and plotting of per-device stats."""
+    config = ComputeNodeResourceStatConfig(
+        cpu=False,
+        memory=False,
+        process=False,
+        percpu=True,
+        perdisk=True,
+        pernic=True,
+        monitor_type="periodic",
+    )
+    collector = ResourceStatCollector()
+    stats = collector.get_stats(ComputeNodeResourceStatConfig.all_enabled(), pids={})
+    agg = ResourceStatAggregator(config, stats)
+    # Record the baseline for the device counters.
+    collector.get_stats(config)
+    db_file = tmp_path / "stats.sqlite"
+    store = ResourceStatStore(config, db_file, stats)
+    for _ in range(2):
+        # Let the CPU time counters advance.
+        time.sleep(0.1)
+        stats = collector.get_stats(config)
+        agg.update_stats(stats)
+        store.record_stats(stats, timestamps=collector.get_capture_times())
+    store.flush()
+
+    results = agg.finalize_system_stats()
+    cpu_results = [x for x in results.keyed_results if x.resource_type == ResourceType.PERCPU]
+    assert cpu_results
+    assert {x.key for x in cpu_results} == set(stats[ResourceType.PERCPU])
+    assert all(x.num_samples == 2 for x in cpu_results)
+
+    table = read_table_as_dict(db_file, "percpu")
+    assert set(table) == {"timestamp", "id", *DeviceStatCollector.PERCPU_STATS}
+    assert len(table["id"]) == 2 * len(cpu_results)
+
+    plot_to_file(db_file)
+    assert (tmp_path / "html" / "stats_percpu.html").exists()
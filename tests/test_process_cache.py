@@ -0,0 +1,65 @@
+"""Tests the process cache"""
+
+import os
+import subprocess
+import sys
+
+import psutil
+
+from rmon.models import ComputeNodeResourceStatConfig
+from rmon.process_cache import ProcessCache
+from rmon.resource_stat_collector import ResourceStatCollector
+
+
+def test_process_cache(monkeypatch):
+    """Test hits, misses, and capacity and stale evictions."""
+    processes = [subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])]
+    processes.append(subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"]))
+    try:
+        cache = ProcessCache(max_size=2)
+        process, is_new = cache.get(os.getpid())
+        assert is_new
+        assert cache.get(os.getpid()) == (process, False)
+        cache.get(processes[0].pid)
+        # The least recently used process is evicted.
+        cache.get(processes[1].pid)
+        assert os.getpid() not in cache
+        assert cache.pids() == [processes[0].pid, processes[1].pid]
+
+        # Simulate reuse of the process ID by a different process.
+        monkeypatch.setattr(psutil.Process, "is_running", lambda self: False)
+        _, is_new = cache.get(processes[1].pid)
+        assert is_new
+        assert cache.get_stats() == {
+            "size": 2,
+            "max_size": 2,
+            "hits": 1,
+            "misses": 4,
+            "stale_evictions": 1,
+            "capacity_evictions": 1,
+        }
+
+        cache.max_size = 1
+        assert cache.pids() == [processes[1].pid]
+    finally:
+        for popen in processes:
+            popen.kill()
+            popen.wait()
+
+
+def test_process_key_reuse():
+    """Test that a process key is not reported when its PID is reused by a new process."""
+    for backend in ("psutil", "procfs"):
+        collector = ResourceStatCollector()
+        config = ComputeNodeResourceStatConfig(
+            cpu=False, memory=False, process=True, process_backend=backend
+        )
+        pids = {"self": os.getpid()}
+        assert "self" in collector.get_processes_stats(pids, config)
+        _, start_time = collector._process_key_identities["self"]
+        collector._process_key_identities["self"] = (os.getpid(), start_time - 1)
+        assert not collector.get_processes_stats(pids, config)
+
+        # The identity is forgotten when the key is no longer monitored.
+        collector.get_processes_stats({}, config)
+        assert "self" in collector.get_processes_stats(pids, config)
@@ -0,0 +1,132 @@
+"""Tests the discovery of processes that match a rule"""
+
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from rmon.models import ComputeNodeResourceStatConfig, ProcessMatchRule
+from rmon.process_discovery import ProcessDiscoverer, make_process_key
+from rmon.procfs import ProcfsReader
+from rmon.resource_monitor import run_monitor_sync
+
+
+def _remove_process(root, pid: int) -> None:
+    path = root / str(pid)
+    for file in path.iterdir():
+        file.unlink()
+    path.rmdir()
+
+
+def _write_process(root, pid: int, ppid: int, cmdline: list[str], starttime: int = 0) -> None:
+    path = root / str(pid)
+    path.mkdir(exist_ok=True)
+    fields = ["S", str(ppid)] + ["0"] * 17 + [str(starttime), "0", "0"]
+    (path / "stat").write_text(f"{pid} (worker) {' '.join(fields)}\n")
+    (path / "cmdline").write_bytes(b"\0".join(x.encode() for x in cmdline) + b"\0")
+    (path / "comm").write_text(cmdline[0] + "\n")
+
+
+@pytest.fixture
+def procfs_root(tmp_path):
+    """Create a procfs fixture with the files read by the discoverer."""
+    (tmp_path / "stat").write_text("cpu  0 0 0 0 0 0 0 0 0 0\ncpu0 0 0 0 0 0 0 0 0 0 0\n")
+    _write_process(tmp_path, 100, 1, ["python", "worker.py", "--id", "1"])
+    _write_process(tmp_path, 101, 1, ["bash"])
+    _write_process(tmp_path, 102, 50, ["python", "worker.py", "--id", "2"])
+    return tmp_path
+
+
+def test_process_discovery(procfs_root, monkeypatch):
+    """Test discovery of new processes and detection of exited processes."""
+    num_reads = []
+    num_stat_reads = []
+    read_cmdline = ProcfsReader.read_cmdline
+    read_process_stat = ProcfsReader.read_process_stat
+
+    def counting_read_cmdline(self, pid):
+        num_reads.append(pid)
+        return read_cmdline(self, pid)
+
+    def counting_read_process_stat(self, pid):
+        num_stat_reads.append(pid)
+        return read_process_stat(self, pid)
+
+    monkeypatch.setattr(ProcfsReader, "read_cmdline", counting_read_cmdline)
+    monkeypatch.setattr(ProcfsReader, "read_process_stat", counting_read_process_stat)
+    discoverer = ProcessDiscoverer(ProcessMatchRule(cmdline_regex=r"worker\.py"), procfs_root)
+    new, exited = discoverer.update()
+    key1 = make_process_key("python", ["python", "worker.py", "--id", "1"], 100)
+    key2 = make_process_key("python", ["python", "worker.py", "--id", "2"], 102)
+    assert new == {key1: 100, key2: 102}
+    assert not exited
+    assert sorted(num_reads) == [100, 101, 102]
+
+    # Only the new process is read. The rejected process is not read again.
+    num_reads.clear()
+    num_stat_reads.clear()
+    _write_process(procfs_root, 103, 1, ["python", "worker.py", "--id", "3"])
+    _remove_process(procfs_root, 100)
+    new, exited = discoverer.update()
+    assert list(new.values()) == [103]
+    assert exited == [key1]
+    assert num_reads == [103]
+    assert sorted(num_stat_reads) == [102, 103]
+    assert sorted(discoverer.get_pids().values()) == [102, 103]
+
+    # A new process reuses the ID of a tracked process.
+    _write_process(procfs_root, 102, 50, ["python", "worker.py", "--id", "5"], starttime=10)
+    new, exited = discoverer.update()
+    assert list(new.values()) == [102]
+    assert exited == [key2]
+
+    # The ID of a rejected process is checked again after the process exits.
+    _remove_process(procfs_root, 101)
+    assert discoverer.update() == ({}, [])
+    _write_process(procfs_root, 101, 1, ["python", "worker.py", "--id", "4"], starttime=10)
+    new, exited = discoverer.update()
+    assert list(new.values()) == [101]
+    assert sorted(discoverer.get_pids().values()) == [101, 102, 103]
+
+    discoverer = ProcessDiscoverer(ProcessMatchRule(ppid=50), procfs_root)
+    new, _ = discoverer.update()
+    assert list(new.values()) == [102]
+
+
+def test_run_monitor_sync_with_discovery():
+    """Test that processes that start and exit during collection are monitored and
+    finalized.
+    """
+    marker = "rmon-discovery-test"
+    cmd = [sys.executable, "-c", "import time; time.sleep(30)", marker]
+    worker_pids: list[int] = []
+
+    def run_worker() -> None:
+        time.sleep(0.5)
+        process = subprocess.Popen(cmd)
+        worker_pids.append(process.pid)
+        time.sleep(1.0)
+        process.kill()
+        process.wait()
+
+    config = ComputeNodeResourceStatConfig(
+        cpu=False,
+        memory=False,
+        process=True,
+        include_child_processes=False,
+        process_match=ProcessMatchRule(cmdline_regex=marker),
+        interval=0.2,
+    )
+    thread = threading.Thread(target=run_worker)
+    thread.start()
+    try:
+        _, process_results = run_monitor_sync(config, {}, duration=2)
+    finally:
+        thread.join()
+
+    assert len(process_results.results) == 1
+    result = process_results.results[0]
+    assert result.process_key.endswith(f"({worker_pids[0]})")
+    assert result.num_samples > 1
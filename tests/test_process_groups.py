@@ -0,0 +1,64 @@
+"""Tests the process group collector"""
+
+import getpass
+import subprocess
+import sys
+
+from rmon.models import ComputeNodeResourceStatConfig, ProcessGroupRule, ResourceType
+from rmon.process_groups import ProcessGroupStatCollector, _RuleMatcher
+from rmon.resource_stat_aggregator import ResourceStatAggregator
+from rmon.resource_stat_collector import ResourceStatCollector
+
+
+def test_rule_matcher():
+    """Test matching of processes against group rules."""
+    info = {"name": "python", "cmdline": ["python", "worker.py"], "username": "alice"}
+    job = "/system.slice/job_1234"
+    assert _RuleMatcher(ProcessGroupRule(name="a", cmdline_regex=r"worker\.py")).matches(
+        info, None
+    )
+    assert not _RuleMatcher(ProcessGroupRule(name="a", name_regex="^bash$")).matches(info, None)
+    rule = ProcessGroupRule(name="a", name_regex="python", username="bob")
+    assert not _RuleMatcher(rule).matches(info, None)
+    rule = ProcessGroupRule(name="a", cgroup="system.slice/job_1234")
+    assert _RuleMatcher(rule).matches(info, job)
+    assert _RuleMatcher(rule).matches(info, job + "/step_0")
+    assert not _RuleMatcher(rule).matches(info, job + "5")
+    assert not _RuleMatcher(rule).matches(info, None)
+
+
+def test_process_group_stats():
+    """Test that the stats of all matching processes are summed into one group."""
+    marker = "rmon-process-group-test"
+    cmd = [sys.executable, "-c", "import sys, time; time.sleep(30)", marker]
+    processes = [subprocess.Popen(cmd) for _ in range(3)]
+    config = ComputeNodeResourceStatConfig(
+        cpu=False,
+        memory=False,
+        process=False,
+        process_groups=[
+            ProcessGroupRule(name="workers", cmdline_regex=marker, username=getpass.getuser()),
+            ProcessGroupRule(name="none", name_regex="^does-not-exist$"),
+        ],
+    )
+    try:
+        collector = ResourceStatCollector()
+        stats = collector.get_stats(config)
+        agg = ResourceStatAggregator(config, stats)
+        for _ in range(2):
+            stats = collector.get_stats(config)
+            agg.update_stats(stats)
+        group_stats = stats[ResourceType.PROCESS_GROUP]
+        assert group_stats["workers"]["num_processes"] == 3
+        assert group_stats["workers"]["rss"] > 0
+        assert group_stats["none"] == dict.fromkeys(ProcessGroupStatCollector.STATS, 0)
+
+        results = agg.finalize_system_stats()
+        keys = {
+            x.key for x in results.keyed_results if x.resource_type == ResourceType.PROCESS_GROUP
+        }
+        assert keys == {"workers", "none"}
+    finally:
+        for process in processes:
+            process.kill()
+            process.wait()
@@ -0,0 +1,200 @@
+"""Tests the procfs process backend"""
+
+import os
+from pathlib import Path
+
+import pytest
+
+from rmon.models import ComputeNodeResourceStatConfig
+from rmon.procfs import ProcfsReader
+from rmon.resource_stat_collector import ResourceStatCollector
+
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+NUM_CPUS = 4
+
+
+def _write_system_files(root: Path, cpu_ticks: int, uptime: float) -> None:
+    # Only the first field (user) varies. The remaining seven fields are zero.
+    lines = [f"cpu  {cpu_ticks} 0 0 0 0 0 0 0 0 0"]
+    for i in range(NUM_CPUS):
+        lines.append(f"cpu{i} {cpu_ticks // NUM_CPUS} 0 0 0 0 0 0 0 0 0")
+    (root / "stat").write_text("\n".join(lines) + "\n")
+    (root / "uptime").write_text(f"{uptime} 0.0\n")
+
+
+def _write_process(
+    root: Path, pid: int, ppid: int, utime: int, stime: int, rss_pages: int, starttime: int = 0
+) -> None:
+    path = root / str(pid)
+    path.mkdir(exist_ok=True)
+    fields = ["S", str(ppid)] + ["0"] * 9 + [str(utime), str(stime), "3", "4"] + ["0"] * 4
+    fields += [str(starttime), "0", "0"]
+    (path / "stat").write_text(f"{pid} (my (odd) name) {' '.join(fields)}\n")
+    (path / "statm").write_text(f"1000 {rss_pages} 0 0 0 0 0\n")
+
+
+@pytest.fixture
+def procfs_tree(tmp_path):
+    """Create a procfs fixture with a parent process, a child, and a grandchild."""
+    _write_system_files(tmp_path, cpu_ticks=0, uptime=100.0)
+    _write_process(tmp_path, 100, 1, utime=0, stime=0, rss_pages=10)
+    _write_process(tmp_path, 101, 100, utime=0, stime=0, rss_pages=20)
+    _write_process(tmp_path, 102, 101, utime=0, stime=0, rss_pages=30)
+    _write_process(tmp_path, 200, 1, utime=0, stime=0, rss_pages=40)
+    return tmp_path
+
+
+def test_procfs_reader(procfs_tree):
+    """Test parsing of the procfs files."""
+    reader = ProcfsReader(procfs_tree)
+    assert reader.num_cpus == NUM_CPUS
+    assert sorted(reader.list_pids()) == [100, 101, 102, 200]
+    stat = reader.read_process_stat(101)
+    assert stat is not None
+    assert stat.ppid == 100
+    assert stat.cutime == 3
+    assert stat.cstime == 4
+    assert reader.read_process_stat(999) is None
+    assert reader.read_rss(102) == 30 * PAGE_SIZE
+    assert reader.read_uptime() == 100.0
+
+
+@pytest.mark.parametrize("recurse", [False, True])
+def test_procfs_backend(procfs_tree, recurse):
+    """Test collection of process stats with the procfs backend."""
+    config = ComputeNodeResourceStatConfig(
+        process_backend="procfs",
+        procfs_root=str(procfs_tree),
+        include_child_processes=True,
+        recurse_child_processes=recurse,
+    )
+    collector = ResourceStatCollector()
+    pids = {"parent": 100, "other": 200, "missing": 999}
+    stats = collector.get_processes_stats(pids, config)
+    assert set(stats) == {"parent", "other"}
+    expected_pages = 60 if recurse else 30
+    assert stats["parent"]["rss"] == expected_pages * PAGE_SIZE
+    assert stats["parent"]["cpu_percent"] == 0.0
+
+    # Advance one second on every CPU. The parent uses half of one CPU and the child uses one
+    # full CPU.
+    _write_system_files(procfs_tree, cpu_ticks=NUM_CPUS * CLOCK_TICKS, uptime=101.0)
+    _write_process(procfs_tree, 100, 1, utime=CLOCK_TICKS // 2, stime=0, rss_pages=10)
+    _write_process(
+        procfs_tree, 101, 100, utime=CLOCK_TICKS // 2, stime=CLOCK_TICKS // 2, rss_pages=20
+    )
+    stats = collector.get_processes_stats(pids, config)
+    assert stats["parent"]["cpu_percent"] == pytest.approx(150.0)
+    # Each process in the fixture has 3 + 4 ticks of CPU time from reaped children.
+    expected_ticks = CLOCK_TICKS * 3 // 2 + (21 if recurse else 14)
+    assert stats["parent"]["cpu_seconds"] == pytest.approx(expected_ticks / CLOCK_TICKS)
+    assert stats["other"]["cpu_percent"] == 0.0
+
+
+def test_procfs_backend_new_process(procfs_tree):
+    """Test that a process seen for the first time reports its average since it started."""
+    config = ComputeNodeResourceStatConfig(
+        process_backend="procfs",
+        procfs_root=str(procfs_tree),
+        include_child_processes=False,
+    )
+    # The process started 10 seconds ago and has used 5 seconds of CPU time.
+    _write_process(
+        procfs_tree,
+        300,
+        1,
+        utime=5 * CLOCK_TICKS,
+        stime=0,
+        rss_pages=1,
+        starttime=90 * CLOCK_TICKS,
+    )
+    collector = ResourceStatCollector()
+    stats = collector.get_processes_stats({"new": 300}, config)
+    assert stats["new"]["cpu_percent"] == pytest.approx(50.0)
+
+
+def _write_pressure_files(root: Path, cpu_some_usec: int, pgmajfault: int) -> None:
+    (root / "pressure").mkdir(exist_ok=True)
+    (root / "pressure" / "cpu").write_text(
+        f"some avg10=0.00 avg60=0.00 avg300=0.00 total={cpu_some_usec}\n"
+        "full avg10=0.00 avg60=0.00 avg300=0.00 total=0\n"
+    )
+    (root / "vmstat").write_text(f"pgfault 100\npgmajfault {pgmajfault}\noom_kill 1\n")
+
+
+def test_pressure_stats(tmp_path, monkeypatch):
+    """Test the computation of pressure stall and vmstat rates from procfs files."""
+    now = [1000.0]
+    monkeypatch.setattr("rmon.resource_stat_collector.time.time", lambda: now[0])
+    _write_pressure_files(tmp_path, cpu_some_usec=0, pgmajfault=0)
+    collector = ResourceStatCollector()
+    # The first call for a procfs root records a baseline.
+    stats = collector.get_pressure_stats(str(tmp_path))
+    assert stats["cpu_some_percent"] == 0.0
+
+    now[0] += 2.0
+    _write_pressure_files(tmp_path, cpu_some_usec=500_000, pgmajfault=50)
+    stats = collector.get_pressure_stats(str(tmp_path))
+    assert stats["elapsed_seconds"] == pytest.approx(2.0)
+    assert stats["cpu_some_percent"] == pytest.approx(25.0)
+    assert stats["cpu_full_percent"] == 0.0
+    # The memory and io files are missing.
+    assert stats["memory_some_percent"] == 0.0
+    assert stats["pgmajfault_per_sec"] == pytest.approx(25.0)
+    assert stats["pgfault_per_sec"] == 0.0
+    assert stats["oom_kill"] == 0
+
+
+def test_procfs_process_tiers(procfs_tree, monkeypatch):
+    """Test the extended process tiers with the procfs backend."""
+    now = [0.0]
+    monkeypatch.setattr("rmon.resource_stat_collector.time.monotonic", lambda: now[0])
+    config = ComputeNodeResourceStatConfig(
+        process_backend="procfs",
+        procfs_root=str(procfs_tree),
+        include_child_processes=False,
+        process_tiers=["io", "threads", "memory_full"],
+    )
+
+    def write_files(read_mb: int, ctx_switches: int) -> None:
+        path = procfs_tree / "300"
+        (path / "io").write_text(
+            f"rchar: 1\nread_bytes: {read_mb * 1024 * 1024}\nwrite_bytes: 0\n"
+        )
+        (path / "status").write_text(
+            "Name:\tworker\nThreads:\t4\n"
+            f"voluntary_ctxt_switches:\t{ctx_switches}\nnonvoluntary_ctxt_switches:\t0\n"
+        )
+        (path / "smaps_rollup").write_text(
+            "00400000-7ffd0000 ---p 00000000 00:00 0 [rollup]\n"
+            "Rss:                 300 kB\nPss:                 200 kB\n"
+            "Private_Clean:        50 kB\nPrivate_Dirty:        50 kB\n"
+        )
+        (path / "fd").mkdir(exist_ok=True)
+        for i in range(3):
+            (path / "fd" / str(i)).touch()
+
+    # The process started 10 seconds ago.
+    _write_process(procfs_tree, 300, 1, utime=0, stime=0, rss_pages=1, starttime=90 * CLOCK_TICKS)
+    write_files(read_mb=10, ctx_switches=100)
+    collector = ResourceStatCollector()
+    stats = collector.get_processes_stats({"worker": 300}, config)["worker"]
+    assert stats["read MB/s"] == pytest.approx(1.0)
+    assert stats["voluntary_ctx_switches/s"] == pytest.approx(10.0)
+    assert stats["num_threads"] == 4
+    assert stats["num_fds"] == 3
+    assert stats["pss"] == 200 * 1024
+    assert stats["uss"] == 100 * 1024
+
+    now[0] = 2.0
+    write_files(read_mb=14, ctx_switches=200)
+    stats = collector.get_processes_stats({"worker": 300}, config)["worker"]
+    assert stats["read MB/s"] == pytest.approx(2.0)
+    assert stats["voluntary_ctx_switches/s"] == pytest.approx(50.0)
+    assert set(collector.get_process_tier_costs()) == {"io", "threads", "memory_full"}
+
+    config.process_tiers = ["bad"]
+    with pytest.raises(ValueError):
+        collector.get_processes_stats({"worker": 300}, config)
@@ -1,5 +1,6 @@
 """Tests the resource monitor CLI commands"""
 
+import multiprocessing
 import os
 import signal
 import socket
@@ -9,6 +10,17 @@ from pathlib import Path
 
 import psutil
 
+from rmon import (
+    ComputeNodeResourceStatConfig,
+    ResourceStatSnapshot,
+    ShutDownCommand,
+    SnapshotCommand,
+    run_monitor_async,
+)
+from rmon.cli.collect import _remove_db_file
+from rmon.models import ComputeNodeProcessResourceStatResults, ComputeNodeResourceStatResults
+from rmon.utils.sql import read_table
+
 
 def test_resource_monitor_sync(tmp_path):
     """Test the monitor in sync mode."""
@@ -33,6 +45,17 @@ def test_resource_monitor_sync(tmp_path):
     _check_files(tmp_path)
 
 
+def test_remove_db_file(tmp_path):
+    """Test that overwriting a database also removes the journal files of the previous run."""
+    db_file = tmp_path / "run1.sqlite"
+    for path in (db_file, tmp_path / "run1.sqlite-wal", tmp_path / "run1.sqlite-shm"):
+        path.write_bytes(b"left by a killed run")
+    _remove_db_file(db_file)
+    assert not list(tmp_path.iterdir())
+    # Missing files are ignored.
+    _remove_db_file(db_file)
+
+
 def test_resource_monitor_sync_daemon(tmp_path):
     """Test the monitor in sync mode as a daemon."""
     my_pid = os.getpid()
@@ -130,6 +153,79 @@ def test_resource_monitor_async(tmp_path):
         _check_files(tmp_path)
 
 
+def test_run_monitor_async_command_latency(tmp_path):
+    """Test that commands are handled without waiting for the next collection interval."""
+    config = ComputeNodeResourceStatConfig(interval=30)
+    pids = {"test": os.getpid()}
+    parent_conn, child_conn = multiprocessing.Pipe()
+    args = (child_conn, config, pids, tmp_path / "monitor.log", None)
+    monitor_proc = multiprocessing.Process(target=run_monitor_async, args=args)
+    monitor_proc.start()
+    try:
+        time.sleep(1)
+        start = time.time()
+        parent_conn.send(ShutDownCommand(pids=pids))
+        system_results, process_results = parent_conn.recv()
+        assert time.time() - start < 0.5
+        assert isinstance(system_results, ComputeNodeResourceStatResults)
+        assert isinstance(process_results, ComputeNodeProcessResourceStatResults)
+        assert process_results.results[0].process_key == "test"
+    finally:
+        monitor_proc.join()
+
+
+def test_run_monitor_async_snapshots(tmp_path):
+    """Test that snapshots do not reset the summaries and are appended periodically."""
+    snapshot_file = tmp_path / "snapshots.json"
+    config = ComputeNodeResourceStatConfig(
+        interval=0.1, snapshot_interval=0.3, snapshot_file=str(snapshot_file)
+    )
+    pids = {"test": os.getpid()}
+    parent_conn, child_conn = multiprocessing.Pipe()
+    args = (child_conn, config, pids, tmp_path / "monitor.log", None)
+    monitor_proc = multiprocessing.Process(target=run_monitor_async, args=args)
+    monitor_proc.start()
+    try:
+        time.sleep(1)
+        parent_conn.send(SnapshotCommand(pids=pids))
+        first = parent_conn.recv()
+        time.sleep(0.5)
+        parent_conn.send(SnapshotCommand(pids=pids))
+        second = parent_conn.recv()
+        parent_conn.send(ShutDownCommand(pids=pids))
+        system_results, process_results = parent_conn.recv()
+    finally:
+        monitor_proc.join()
+
+    assert isinstance(first, ResourceStatSnapshot)
+    assert second.timestamp > first.timestamp
+    first_samples = first.process_results.results[0].num_samples
+    assert second.process_results.results[0].num_samples > first_samples
+    assert process_results.results[0].num_samples > first_samples
+    assert system_results.results[0].num_samples > first.system_results.results[0].num_samples
+    lines = snapshot_file.read_text().splitlines()
+    assert len(lines) >= 2
+    assert ResourceStatSnapshot.model_validate_json(lines[-1]).process_results.results
+
+
+def test_run_monitor_async_sigterm(tmp_path):
+    """Test that SIGTERM flushes the buffered rows through the background writer."""
+    config = ComputeNodeResourceStatConfig(
+        interval=0.1, monitor_type="periodic", background_writes=True
+    )
+    db_file = tmp_path / "stats.sqlite"
+    pids = {"test": os.getpid()}
+    _, child_conn = multiprocessing.Pipe()
+    args = (child_conn, config, pids, tmp_path / "monitor.log", db_file, "test", 1000)
+    monitor_proc = multiprocessing.Process(target=run_monitor_async, args=args)
+    monitor_proc.start()
+    time.sleep(1)
+    monitor_proc.terminate()
+    monitor_proc.join()
+    assert monitor_proc.exitcode == 0
+    assert read_table(db_file, "process")[0]
+
+
 def _check_files(path: Path) -> None:
     hostname = socket.gethostname()
     assert (path / f"{hostname}.sqlite").exists()
@@ -0,0 +1,354 @@
+"""Tests the resource stat aggregator"""
+
+import json
+import random
+import statistics
+import sys
+import time
+from typing import Any
+
+import pytest
+
+from rmon.models import ComputeNodeResourceStatConfig, ProcessStatResults, ResourceType
+from rmon.process_result_sinks import (
+    PROCESS_RESULTS_TABLE,
+    CallbackProcessResultSink,
+    JsonLinesProcessResultSink,
+    SqliteProcessResultSink,
+)
+from rmon.resource_stat_aggregator import ResourceStatAggregator, _FlatStatSummaries
+from rmon.resource_stat_collector import ResourceStatCollector
+from rmon.resource_stat_store import ResourceStatStore
+from rmon.sketches import DDSketch
+from rmon.utils.sql import read_table
+
+
+def _make_process_stats(*keys: str) -> dict[ResourceType, dict]:
+    stats = {"cpu_percent": 10.0, "rss": 100, "cpu_seconds": 1.0}
+    return {ResourceType.PROCESS: {x: dict(stats) for x in keys}}
+
+
+def test_auto_finalize_processes(tmp_path):
+    """Test that processes that are no longer sampled are finalized to the sinks."""
+    config = ComputeNodeResourceStatConfig(
+        cpu=False, memory=False, process=True, process_finalize_grace_period=0
+    )
+    finalized: list[ProcessStatResults] = []
+    results_file = tmp_path / "results.jsonl"
+    db_file = tmp_path / "results.sqlite"
+    collector = ResourceStatCollector()
+    stats = collector.get_stats(ComputeNodeResourceStatConfig.all_enabled(), pids={})
+    collector.shutdown()
+    store = ResourceStatStore(config, db_file, stats, buffered_write_count=1)
+    sinks = [
+        CallbackProcessResultSink(finalized.extend),
+        JsonLinesProcessResultSink(results_file),
+        SqliteProcessResultSink(store),
+    ]
+    agg = ResourceStatAggregator(config, {}, process_result_sinks=sinks)
+    agg.update_stats(_make_process_stats("a", "b"))
+    agg.update_stats(_make_process_stats("a", "b"))
+    assert not finalized
+    agg.update_stats(_make_process_stats("a"))
+    assert [(x.process_key, x.num_samples) for x in finalized] == [("b", 2)]
+    assert finalized[0].average["rss"] == 100
+
+    lines = results_file.read_text().splitlines()
+    assert [json.loads(x)["process_key"] for x in lines] == ["b"]
+    store.close()
+    rows, columns = read_table(db_file, PROCESS_RESULTS_TABLE)
+    assert len(rows) == 1
+    assert dict(zip(columns, rows[0]))["id"] == "b"
+
+    results = agg.finalize_process_stats(["a", "b"]).results
+    assert [(x.process_key, x.num_samples) for x in results] == [("a", 3)]
+
+
+def test_auto_finalize_processes_without_sinks():
+    """Test that results are kept until requested when there are no sinks."""
+    config = ComputeNodeResourceStatConfig(
+        cpu=False, memory=False, process=True, process_finalize_grace_period=0
+    )
+    agg = ResourceStatAggregator(config, {})
+    agg.update_stats(_make_process_stats("a", "b"))
+    agg.update_stats(_make_process_stats("a"))
+    results = agg.finalize_process_stats(["a", "b"]).results
+    assert sorted((x.process_key, x.num_samples) for x in results) == [("a", 2), ("b", 1)]
+
+    # Only the newest results are kept.
+    config.max_kept_process_results = 2
+    agg = ResourceStatAggregator(config, {})
+    for key in ("a", "b", "c", "d"):
+        agg.update_stats(_make_process_stats(key))
+    agg.update_stats({ResourceType.PROCESS: {}})
+    assert [x.process_key for x in agg.pop_exited_process_results()] == ["c", "d"]
+
+
+def test_grace_period_with_keyed_stats():
+    """Test that the grace period does not change the clock of the keyed stats, which use the
+    current time if they have no capture time.
+    """
+    config = ComputeNodeResourceStatConfig(
+        cpu=False, memory=False, process=True, percpu=True, process_finalize_grace_period=60
+    )
+    agg = ResourceStatAggregator(config, {})
+    for i, with_process in enumerate((True, False, True)):
+        stats: dict[ResourceType, Any] = {ResourceType.PERCPU: {"cpu0": {"percent": 10.0 * i}}}
+        if with_process:
+            stats.update(_make_process_stats("a"))
+        agg.update_stats(stats)
+
+    (result,) = agg.finalize_system_stats().keyed_results
+    assert result.num_samples == 3
+    # The first sample is weighted by the interval and the others by the microseconds between
+    # the updates.
+    assert result.time_weighted_average["percent"] == pytest.approx(0.0, abs=0.1)
+
+
+def test_finalize_exited_processes():
+    """Test that the results of exited processes are sent to the sinks and not kept."""
+    config = ComputeNodeResourceStatConfig(cpu=False, memory=False, process=True)
+    finalized: list[ProcessStatResults] = []
+    agg = ResourceStatAggregator(
+        config, {}, process_result_sinks=[CallbackProcessResultSink(finalized.extend)]
+    )
+    agg.update_stats(_make_process_stats("a", "b"))
+    agg.finalize_exited_processes(["b", "c"])
+    assert [x.process_key for x in finalized] == ["b"]
+    assert not agg.pop_exited_process_results()
+
+    agg = ResourceStatAggregator(config, {})
+    agg.update_stats(_make_process_stats("a", "b"))
+    agg.finalize_exited_processes(["b"])
+    assert [x.process_key for x in agg.pop_exited_process_results()] == ["b"]
+    assert not agg.pop_exited_process_results()
+
+
+def test_peak_averages():
+    """Test the highest sliding-window averages of system and process stats."""
+    config = ComputeNodeResourceStatConfig(
+        cpu=True, memory=False, process=True, interval=1, peak_average_windows=[2, 10]
+    )
+    agg = ResourceStatAggregator(config, {ResourceType.CPU: {"cpu_percent": 0.0}})
+    for val in (1.0, 5.0, 3.0, 1.0):
+        agg.update_stats(
+            {
+                ResourceType.CPU: {"cpu_percent": val},
+                ResourceType.PROCESS: {"a": {"cpu_percent": val * 2}},
+            }
+        )
+
+    (result,) = agg.finalize_system_stats().results
+    # The 10-second window never fills, and so its peak is the average of all samples.
+    assert result.peak_averages == {"2s": {"cpu_percent": 4.0}, "10s": {"cpu_percent": 2.5}}
+    (process_result,) = agg.finalize_process_stats(["a"]).results
+    assert process_result.peak_averages == {
+        "2s": {"cpu_percent": 8.0},
+        "10s": {"cpu_percent": 5.0},
+    }
+
+
+def test_percentiles():
+    """Test percentiles of system and process stats."""
+    config = ComputeNodeResourceStatConfig(
+        cpu=True, memory=False, process=True, percentiles=[50, 100]
+    )
+    agg = ResourceStatAggregator(config, {ResourceType.CPU: {"cpu_percent": 0.0}})
+    for val in range(1, 102):
+        agg.update_stats(
+            {
+                ResourceType.CPU: {"cpu_percent": float(val)},
+                ResourceType.PROCESS: {"a": {"rss": val * 1000}},
+            }
+        )
+
+    (result,) = agg.finalize_system_stats().results
+    assert result.percentiles["p50"]["cpu_percent"] == pytest.approx(51, rel=0.01)
+    assert result.percentiles["p100"]["cpu_percent"] == 101
+    (process_result,) = agg.finalize_process_stats(["a"]).results
+    assert process_result.percentiles["p50"]["rss"] == pytest.approx(51_000, rel=0.01)
+    sketch = DDSketch.from_dict(process_result.sketches["rss"])
+    assert sketch.count == 101
+
+
+def test_snapshot():
+    """Test that snapshots do not reset the summaries."""
+    config = ComputeNodeResourceStatConfig(
+        cpu=True, memory=False, process=True, percentiles=[50], peak_average_windows=[10]
+    )
+    agg = ResourceStatAggregator(config, {ResourceType.CPU: {"cpu_percent": 0.0}})
+    stats = {ResourceType.CPU: {"cpu_percent": 10.0}, **_make_process_stats("a")}
+    agg.update_stats(stats)
+    start = time.time()
+    first = agg.get_snapshot()
+    assert start <= first.timestamp <= time.time()
+    assert first.process_results.results[0].num_samples == 1
+    assert first.process_results.results[0].percentiles["p50"]["rss"] == pytest.approx(100)
+    second = agg.get_snapshot()
+    assert second.model_dump(exclude={"timestamp"}) == first.model_dump(exclude={"timestamp"})
+
+    agg.update_stats(stats)
+    (result,) = agg.finalize_system_stats().results
+    assert result.num_samples == 2
+    assert result.peak_averages == first.system_results.results[0].peak_averages
+    (process_result,) = agg.finalize_process_stats(["a"]).results
+    assert process_result.num_samples == 2
+    assert process_result.sketches["rss"]["count"] == 2
+
+
+def test_variance_and_time_weighted_average():
+    """Test the online variance and the averages weighted by the time between samples."""
+    config = ComputeNodeResourceStatConfig(cpu=True, memory=False, process=True, interval=1)
+    agg = ResourceStatAggregator(config, {ResourceType.CPU: {"cpu_percent": 0.0}})
+    rng = random.Random(0)
+    values = [rng.uniform(0, 100) for _ in range(50)]
+    # The samples are a second apart, except for one pause of 10 seconds.
+    times = [1000.0 + i + (9 if i >= 25 else 0) for i in range(len(values))]
+    for val, timestamp in zip(values, times):
+        # Process "b" is added halfway through, which changes the layout of the summaries.
+        process_stats = {"a": {"cpu_percent": val}}
+        if timestamp > times[25]:
+            process_stats["b"] = {"cpu_percent": 2 * val}
+        agg.update_stats(
+            {ResourceType.CPU: {"cpu_percent": val}, ResourceType.PROCESS: process_stats},
+            timestamps={ResourceType.CPU: timestamp, ResourceType.PROCESS: timestamp},
+        )
+
+    # The first sample is weighted by the interval.
+    weights = [1.0] + [y - x for x, y in zip(times, times[1:])]
+    expected = sum(x * y for x, y in zip(values, weights)) / sum(weights)
+    (result,) = agg.finalize_system_stats().results
+    assert result.variance["cpu_percent"] == pytest.approx(statistics.pvariance(values))
+    assert result.standard_deviation["cpu_percent"] == pytest.approx(statistics.pstdev(values))
+    assert result.time_weighted_average["cpu_percent"] == pytest.approx(expected)
+    assert result.time_weighted_average["cpu_percent"] != pytest.approx(
+        result.average["cpu_percent"]
+    )
+
+    results = {x.process_key: x for x in agg.finalize_process_stats(["a", "b"]).results}
+    assert results["a"].variance["cpu_percent"] == pytest.approx(statistics.pvariance(values))
+    assert results["a"].time_weighted_average["cpu_percent"] == pytest.approx(expected)
+    assert results["b"].standard_deviation["cpu_percent"] == pytest.approx(
+        statistics.pstdev([2 * x for x in values[26:]])
+    )
+    assert results["b"].time_weighted_average["cpu_percent"] == pytest.approx(
+        2 * statistics.mean(values[26:])
+    )
+
+
+def _update_reference(summaries: dict, key, stat_dict: dict, init_first: bool) -> None:
+    """Update summaries as the original dict-based implementation did."""
+    if key not in summaries:
+        if not init_first:
+            msg = f"{key=} was not initialized"
+            raise KeyError(msg)
+        summaries[key] = [1, dict(stat_dict), dict(stat_dict), dict(stat_dict)]
+        return
+    summary = summaries[key]
+    summary[0] += 1
+    for stat_name, val in stat_dict.items():
+        if val > summary[1][stat_name]:
+            summary[1][stat_name] = val
+        elif val < summary[2][stat_name]:
+            summary[2][stat_name] = val
+        summary[3][stat_name] += val
+
+
+def test_aggregator_matches_reference():
+    """Test that the flat summaries match the original dict-based implementation."""
+    rng = random.Random(0)
+    config = ComputeNodeResourceStatConfig(cpu=True, memory=True, process=True)
+    initial = {
+        ResourceType.CPU: {"cpu_percent": 0.0, "count": 0},
+        ResourceType.MEMORY: {"used": 0, "percent": 0.0},
+    }
+    agg = ResourceStatAggregator(config, initial)
+    system: dict = {
+        x: [0, dict.fromkeys(y, 0.0), dict.fromkeys(y, sys.maxsize), dict.fromkeys(y, 0.0)]
+        for x, y in initial.items()
+    }
+    processes: dict = {}
+    finalized: list = []
+    keys = [f"p{i}" for i in range(20)]
+    for tick in range(200):
+        stats: dict[ResourceType, Any] = {
+            # The counter only increases, and so its minimum stays at the initial value.
+            ResourceType.CPU: {"cpu_percent": rng.uniform(0, 100), "count": tick + 1},
+            ResourceType.MEMORY: {"used": rng.randint(-5, 1000), "percent": rng.random()},
+            ResourceType.PROCESS: {
+                x: {"cpu_percent": rng.uniform(-1, 100), "rss": rng.randint(0, 10**9)}
+                for x in keys
+                if rng.random() < 0.9
+            },
+        }
+        agg.update_stats(stats)
+        for rtype in (ResourceType.CPU, ResourceType.MEMORY):
+            _update_reference(system, rtype, stats[rtype], init_first=False)
+        for key, stat_dict in stats[ResourceType.PROCESS].items():
+            _update_reference(processes, key, stat_dict, init_first=True)
+        if tick % 50 == 49:
+            done = rng.sample(keys, 3)
+            finalized += agg.finalize_process_stats(done).results
+            for key in done:
+                keys.remove(key)
+                keys.append(f"p{tick}-{key}")
+
+    finalized += agg.finalize_process_stats(list(processes)).results
+    assert len(finalized) == len(processes)
+    for result in finalized:
+        samples, maximum, minimum, total = processes[result.process_key]
+        assert result.num_samples == samples
+        # The types of the values must match too.
+        assert json.dumps(result.maximum) == json.dumps(maximum)
+        assert json.dumps(result.minimum) == json.dumps(minimum)
+        assert result.average == {k: v / samples for k, v in total.items()}
+
+    results = agg.finalize_system_stats().results
+    assert len(results) == 2
+    for result in results:
+        samples, maximum, minimum, total = system[result.resource_type]
+        assert result.num_samples == samples
+        assert result.maximum == maximum
+        assert result.minimum == minimum
+        assert result.average == {k: v / samples for k, v in total.items()}
+    assert results[0].minimum["count"] == sys.maxsize
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_summary_layout(use_numpy):
+    """Test that the columns of a key stay in place as other keys and stats come and go."""
+    if use_numpy:
+        pytest.importorskip("numpy")
+    summaries = _FlatStatSummaries(use_numpy=use_numpy)
+    values: dict = {"a": {"x": [], "y": []}, "b": {"x": [], "z": []}}
+    num_samples = {"a": 0, "b": 0}
+    for tick in range(40):
+        stats: dict[str, dict[str, Any]] = {
+            "a": {"x": tick, "y": -tick / 2},
+            f"k{tick}": {"x": 3 * tick},
+        }
+        if tick == 0 or tick > 20:
+            # The new stat moves the columns of "b" to the end.
+            stats["b"] = {"x": tick} if tick == 0 else {"z": tick / 3, "x": tick}
+        summaries.update(stats, timestamps=float(tick))
+        for key in set(stats).intersection(values):
+            num_samples[key] += 1
+            for name, val in stats[key].items():
+                values[key][name].append(val)
+        if tick == 0:
+            offset = summaries._layout["a"][0]
+        else:
+            summaries.remove([f"k{tick - 1}"])
+        # Compaction is the only thing that moves the columns of "a".
+        assert summaries._layout["a"][0] in (offset, 0)
+
+    assert len(summaries._columns) <= 2 * sum(len(x[1]) for x in summaries._layout.values())
+    for key, stat_values in values.items():
+        summary = summaries.get_summary(key)
+        assert summary.num_samples == num_samples[key]
+        for name, vals in stat_values.items():
+            assert summary.maximum[name] == max(vals)
+            assert summary.minimum[name] == min(vals)
+            assert type(summary.maximum[name]) is type(vals[0])
+            assert summary.average[name] == pytest.approx(sum(vals) / num_samples[key])
+            assert summary.variance[name] == pytest.approx(statistics.pvariance(vals))
@@ -0,0 +1,183 @@
+"""Tests the ResourceStatCollector"""
+
+import os
+import subprocess
+import sys
+import time
+
+from rmon.models import ComputeNodeResourceStatConfig, ResourceType
+from rmon.resource_stat_collector import PROCESS_TIER_STATS, ResourceStatCollector, find_children
+
+
+def test_find_children():
+    """Test resolution of process trees from a ppid index."""
+    children_by_ppid = {1: [10, 11], 10: [100], 100: [1000]}
+    assert find_children(1, children_by_ppid, recursive=False) == [10, 11]
+    assert find_children(1, children_by_ppid, recursive=True) == [10, 11, 100, 1000]
+    assert find_children(5, children_by_ppid, recursive=True) == []
+
+
+def test_process_tree_stats():
+    """Test that every monitored tree is resolved from one snapshot of the process table."""
+    script = "import subprocess, time; p = subprocess.Popen(['sleep', '30']); time.sleep(30)"
+    with subprocess.Popen([sys.executable, "-c", script]) as pipe:
+        try:
+            collector = ResourceStatCollector()
+            config = ComputeNodeResourceStatConfig(
+                include_child_processes=True, recurse_child_processes=True
+            )
+            pids = {"self": os.getpid(), "child": pipe.pid}
+            for _ in range(50):
+                stats, children = collector.get_process_stats(os.getpid(), config)
+                if len(children) >= 2:
+                    break
+                time.sleep(0.1)
+            assert stats is not None
+            assert pipe.pid in children
+            stats = collector.get_processes_stats(pids, config)
+            assert set(stats) == {"self", "child"}
+            assert stats["self"]["rss"] > stats["child"]["rss"]
+        finally:
+            pipe.kill()
+
+
+def test_new_processes_do_not_block():
+    """Test that the first collection of new processes does not wait on CPU measurements."""
+    processes = [subprocess.Popen(["sleep", "30"]) for _ in range(20)]
+    try:
+        collector = ResourceStatCollector()
+        config = ComputeNodeResourceStatConfig(include_child_processes=False)
+        pids = {f"sleep {x.pid}": x.pid for x in processes}
+        start = time.time()
+        stats = collector.get_processes_stats(pids, config)
+        assert time.time() - start < 1
+        assert len(stats) == len(processes)
+        for _stats in stats.values():
+            assert _stats["cpu_percent"] >= 0.0
+    finally:
+        for process in processes:
+            process.kill()
+            process.wait()
+
+
+def test_concurrent_collection():
+    """Test collection of all resource types in parallel."""
+    collector = ResourceStatCollector()
+    config = ComputeNodeResourceStatConfig.all_enabled()
+    config.concurrent_collection = True
+    try:
+        start = time.time()
+        stats = collector.get_stats(config, pids={"self": os.getpid()})
+        expected = {x for x in ResourceType if getattr(config, x.value)}
+        assert set(stats) == expected
+        capture_times = collector.get_capture_times()
+        assert set(capture_times) == expected
+        for timestamp in capture_times.values():
+            assert start <= timestamp <= time.time()
+    finally:
+        collector.shutdown()
+
+
+def test_concurrent_collection_timeout():
+    """Test that resource types that exceed the time budget are omitted."""
+    collector = ResourceStatCollector()
+    config = ComputeNodeResourceStatConfig(
+        cpu=True, memory=True, process=False, concurrent_collection=True, collection_timeout=0.1
+    )
+
+    num_calls: list[int] = []
+
+    def slow_memory_stats():
+        if not num_calls:
+            time.sleep(0.5)
+        num_calls.append(1)
+        return {}
+
+    collector.get_memory_stats = slow_memory_stats  # type: ignore
+    try:
+        stats = collector.get_stats(config)
+        assert set(stats) == {ResourceType.CPU}
+        # The previous collection is still running, so it is skipped again.
+        stats = collector.get_stats(config)
+        assert set(stats) == {ResourceType.CPU}
+        time.sleep(0.5)
+        stats = collector.get_stats(config)
+        assert set(stats) == {ResourceType.CPU, ResourceType.MEMORY}
+        # That was the late result. The next call collects again.
+        assert len(num_calls) == 1
+        collector.get_stats(config)
+        assert len(num_calls) == 2
+    finally:
+        collector.shutdown()
+
+
+def test_concurrent_collection_late_counters():
+    """Test that a late result of a counter-based collector is returned rather than dropped,
+    because the late collection already advanced the baseline of the next one.
+    """
+    collector = ResourceStatCollector()
+    config = ComputeNodeResourceStatConfig(
+        cpu=False, memory=True, process=False, concurrent_collection=True, collection_timeout=0.1
+    )
+    counter = {"total": 0, "baseline": 0}
+
+    def slow_counter_stats():
+        stats = {"count": counter["total"] - counter["baseline"]}
+        counter["baseline"] = counter["total"]
+        if counter["total"] == 10:
+            time.sleep(0.5)
+        return stats
+
+    collector.get_memory_stats = slow_counter_stats  # type: ignore
+    counts = []
+    try:
+        for _ in range(3):
+            counter["total"] += 10
+            start = time.time()
+            stats = collector.get_stats(config)
+            if ResourceType.MEMORY in stats:
+                counts.append(stats[ResourceType.MEMORY]["count"])
+                late = counts == [10]
+                assert (collector.get_capture_times()[ResourceType.MEMORY] < start) == late
+            time.sleep(0.6)
+    finally:
+        collector.shutdown()
+    assert counts == [10, 20]
+
+
+def test_cpu_seconds_include_exited_children():
+    """Test that CPU time of short-lived children is included after they exit."""
+    busy = "import time; end = time.time() + 0.5\nwhile time.time() < end: pass"
+    script = (
+        f"import subprocess, sys, time; subprocess.run([sys.executable, '-c', {busy!r}]); "
+        "print('done', flush=True); time.sleep(30)"
+    )
+    with subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE) as pipe:
+        try:
+            collector = ResourceStatCollector()
+            config = ComputeNodeResourceStatConfig(include_child_processes=True)
+            assert pipe.stdout is not None
+            assert pipe.stdout.readline().strip() == b"done"
+            stats = collector.get_processes_stats({"parent": pipe.pid}, config)
+            assert stats["parent"]["cpu_seconds"] >= 0.4
+        finally:
+            pipe.kill()
+
+
+def test_process_tiers_psutil():
+    """Test the extended process tiers with the psutil backend."""
+    collector = ResourceStatCollector()
+    config = ComputeNodeResourceStatConfig(
+        include_child_processes=False, process_tiers=["io", "threads", "memory_full"]
+    )
+    stats = collector.get_processes_stats({"self": os.getpid()}, config)["self"]
+    for tier_stats in PROCESS_TIER_STATS.values():
+        for name in tier_stats:
+            assert stats[name] >= 0
+    assert stats["num_threads"] >= 1
+    assert stats["uss"] > 0
+
+    # A process can also be read directly, without get_processes_stats.
+    stats, _ = ResourceStatCollector().get_process_stats(os.getpid(), config)
+    assert stats is not None
+    assert stats["num_threads"] >= 1
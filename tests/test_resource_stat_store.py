@@ -0,0 +1,242 @@
+"""Tests the resource stat store"""
+
+import sqlite3
+import time
+
+import pytest
+from loguru import logger
+
+from rmon.models import ComputeNodeResourceStatConfig, ResourceType
+from rmon.resource_stat_collector import ResourceStatCollector
+from rmon.resource_stat_store import ResourceStatStore, _BackgroundWriter, _Batch, _ColumnBuffer
+from rmon.plots import plot_to_file
+from rmon.utils.sql import (
+    SCHEMA_VERSION,
+    connect,
+    get_schema_version,
+    insert_rows,
+    list_tables,
+    make_table,
+    read_process_tables,
+    read_table,
+    read_table_as_dict,
+)
+
+
+@pytest.fixture(scope="module")
+def initial_stats():
+    """Return stats for all resource types, which define the tables."""
+    collector = ResourceStatCollector()
+    yield collector.get_stats(ComputeNodeResourceStatConfig.all_enabled(), pids={})
+    collector.shutdown()
+
+
+def _make_stats(initial_stats: dict, cpu_percent: float, *process_keys: str) -> dict:
+    return {
+        ResourceType.CPU: {**initial_stats[ResourceType.CPU], "cpu_percent": cpu_percent},
+        ResourceType.PROCESS: {x: {"cpu_percent": cpu_percent, "rss": 100} for x in process_keys},
+    }
+
+
+def test_store_flushes_all_resource_types(tmp_path, initial_stats):
+    """Test that a full buffer flushes the rows of all resource types in one transaction."""
+    config = ComputeNodeResourceStatConfig(cpu=True, memory=False, process=True)
+    db_file = tmp_path / "stats.sqlite"
+    store = ResourceStatStore(config, db_file, initial_stats, buffered_write_count=3)
+    store.record_stats(_make_stats(initial_stats, 1.0, "a", "b"))
+    assert not read_table(db_file, "cpu")[0]
+    # The third process row fills the buffer.
+    store.record_stats(_make_stats(initial_stats, 2.0, "a", "b"))
+    assert len(read_table(db_file, "cpu")[0]) == 2
+    assert len(read_table(db_file, "process")[0]) == 3
+
+    store.close()
+    assert read_table_as_dict(db_file, "process")["id"] == ["a", "b", "a", "b"]
+    with sqlite3.connect(db_file) as con:
+        assert con.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_store_pragmas(tmp_path, initial_stats):
+    """Test configured pragmas and the rejection of invalid ones."""
+    config = ComputeNodeResourceStatConfig(
+        cpu=True, memory=False, sqlite_pragmas={"journal_mode": "DELETE", "synchronous": "OFF"}
+    )
+    db_file = tmp_path / "stats.sqlite"
+    store = ResourceStatStore(config, db_file, initial_stats)
+    store.record_stats(_make_stats(initial_stats, 1.0))
+    store.close()
+    assert len(read_table(db_file, "cpu")[0]) == 1
+    with sqlite3.connect(db_file) as con:
+        assert con.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+
+    with pytest.raises(ValueError):
+        connect(db_file, {"synchronous": "OFF; DROP TABLE cpu"})
+
+
+def test_store_background_writes(tmp_path, initial_stats):
+    """Test that background writes drop rows when the queue is full and write the rest."""
+    config = ComputeNodeResourceStatConfig(
+        cpu=True,
+        memory=False,
+        background_writes=True,
+        write_queue_size=1,
+        write_queue_timeout=0,
+    )
+    db_file = tmp_path / "stats.sqlite"
+    store = ResourceStatStore(config, db_file, initial_stats, buffered_write_count=1)
+    # Block the writer thread with a write lock from another connection.
+    blocker = sqlite3.connect(db_file)
+    blocker.execute("BEGIN EXCLUSIVE")
+    store.record_stats(_make_stats(initial_stats, 1.0))
+    # Let the writer take the first batch, which leaves room for one more in the queue.
+    time.sleep(0.2)
+    store.record_stats(_make_stats(initial_stats, 2.0))
+    store.record_stats(_make_stats(initial_stats, 3.0))
+    blocker.rollback()
+    blocker.close()
+    store.close()
+
+    assert store.get_write_stats() == {
+        "batches_written": 2,
+        "rows_written": 2,
+        "rows_dropped": 1,
+        "rows_failed": 0,
+        "max_queue_depth": 1,
+    }
+    rows, columns = read_table(db_file, "cpu")
+    assert [dict(zip(columns, x))["cpu_percent"] for x in rows] == [1.0, 2.0]
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_background_writer_errors():
+    """Test that write errors don't stop the writer and that a stopped writer doesn't block."""
+
+    def fail(batch: _Batch) -> None:
+        raise OverflowError
+
+    buffers = {ResourceType.CPU: _ColumnBuffer(["d"])}
+    buffers[ResourceType.CPU].append((1.0,))
+    writer = _BackgroundWriter(fail, queue_size=1)
+    assert writer.submit(_Batch(keys=[], buffers=buffers, process_results=[]), timeout=None)
+    writer.close()
+    assert writer.num_rows_failed == 1
+
+    def stop(batch: _Batch) -> None:
+        raise SystemExit
+
+    writer = _BackgroundWriter(stop, queue_size=1)
+    for _ in range(3):
+        writer.submit(_Batch(keys=[], buffers={}, process_results=[]), timeout=None)
+    assert not writer.is_alive()
+    assert not writer.submit(_Batch(keys=[], buffers={}, process_results=[]), timeout=None)
+    writer.close()
+
+
+def test_store_flush_policy(tmp_path, initial_stats):
+    """Test the flushes by buffer age and size and the buffering of null values."""
+    config = ComputeNodeResourceStatConfig(
+        cpu=True, memory=False, process=True, max_buffer_age=0.2, max_buffer_bytes=None
+    )
+    db_file = tmp_path / "stats.sqlite"
+    store = ResourceStatStore(config, db_file, initial_stats, buffered_write_count=1000)
+    store.record_stats(_make_stats(initial_stats, 1.0, "a"))
+    store.record_stats(_make_stats(initial_stats, 2.0, "a"))
+    assert not read_table(db_file, "cpu")[0]
+    time.sleep(0.2)
+    # The age of the buffered rows is checked before this row is added.
+    store.record_stats(_make_stats(initial_stats, 3.0, "a"))
+    assert len(read_table(db_file, "cpu")[0]) == 2
+
+    store.config = config.model_copy(update={"max_buffer_age": None, "max_buffer_bytes": 1000})
+    store.record_stats(_make_stats(initial_stats, 4.0, "a"))
+    assert len(read_table(db_file, "cpu")[0]) == 2
+    for i in range(10):
+        store.record_stats(_make_stats(initial_stats, 5.0 + i, "a"))
+    assert len(read_table(db_file, "cpu")[0]) > 4
+    store.close()
+
+    table = read_table_as_dict(db_file, "process")
+    assert len(table["id"]) == 14
+    row = {k: v[-1] for k, v in table.items()}
+    assert (row["id"], row["cpu_percent"], row["rss"], row["num_threads"]) == (
+        "a",
+        14.0,
+        100,
+        None,
+    )
+
+
+def test_store_schema(tmp_path, initial_stats):
+    """Test the epoch timestamps, the keys table, and the index of the process table."""
+    config = ComputeNodeResourceStatConfig(cpu=True, memory=False, process=True)
+    db_file = tmp_path / "stats.sqlite"
+    store = ResourceStatStore(config, db_file, initial_stats, buffered_write_count=2)
+    start = time.time()
+    for i in range(3):
+        store.record_stats(_make_stats(initial_stats, float(i), "a", "b" * 1000))
+    store.close()
+
+    assert get_schema_version(db_file) == SCHEMA_VERSION
+    with sqlite3.connect(db_file) as con:
+        assert con.execute("SELECT id, name FROM keys").fetchall() == [(1, "a"), (2, "b" * 1000)]
+        assert con.execute("SELECT DISTINCT typeof(timestamp) FROM process").fetchall() == [
+            ("real",)
+        ]
+        plan = con.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM process WHERE key_id = 1 ORDER BY timestamp"
+        ).fetchall()
+        assert "process_key_id_timestamp" in plan[0][-1]
+        query = "SELECT DISTINCT id FROM process_view ORDER BY key_id"
+        assert con.execute(query).fetchall() == [("a",), ("b" * 1000,)]
+    table = read_table_as_dict(db_file, "process", timestamp_column="timestamp")
+    assert table["timestamp"][0].timestamp() >= start
+    assert list(read_process_tables(db_file, "process")) == ["a", "b" * 1000]
+
+
+def test_store_without_initial_pressure_stats(tmp_path, initial_stats):
+    """Test the call pattern from before pressure stats existed: all_enabled() with initial
+    stats that lack them.
+    """
+    config = ComputeNodeResourceStatConfig.all_enabled()
+    old_stats = {k: v for k, v in initial_stats.items() if k != ResourceType.PRESSURE}
+    db_file = tmp_path / "stats.sqlite"
+    warnings: list[str] = []
+    handler_id = logger.add(warnings.append, level="WARNING", format="{message}")
+    try:
+        store = ResourceStatStore(config, db_file, old_stats)
+        store.record_stats(initial_stats)
+        store.record_stats(initial_stats)
+        store.close()
+    finally:
+        logger.remove(handler_id)
+    # The missing table is reported once.
+    assert len([x for x in warnings if x.startswith("pressure stats are enabled")]) == 1
+    tables = set(list_tables(db_file))
+    assert "cpu" in tables
+    assert "pressure" not in tables
+    assert len(read_table(db_file, "cpu")[0]) == 2
+    plot_to_file(db_file)
+
+
+def test_read_version_1_database(tmp_path):
+    """Test that databases written before the schema was versioned can still be read."""
+    db_file = tmp_path / "stats.sqlite"
+    make_table(db_file, "cpu", {"timestamp": "", "cpu_percent": 0.0})
+    insert_rows(db_file, "cpu", [("2024-01-01 00:00:00.5", 1.0), ("2024-01-01 00:00:01.5", 2.0)])
+    row = {"timestamp": "", "id": "", "cpu_percent": 0.0, "rss": 0.0}
+    make_table(db_file, "process", row, types={k: type(v) for k, v in row.items()})
+    insert_rows(
+        db_file,
+        "process",
+        [("2024-01-01 00:00:00.5", "a", 1.0, 10.0), ("2024-01-01 00:00:01.5", "a", 2.0, 20.0)],
+    )
+
+    assert get_schema_version(db_file) == 1
+    table = read_table_as_dict(db_file, "cpu", timestamp_column="timestamp")
+    assert table["timestamp"][1].second == 1
+    assert table["cpu_percent"] == [1.0, 2.0]
+    process_tables = read_process_tables(db_file, "process")
+    assert process_tables["a"]["rss"] == [10.0, 20.0]
+    plot_to_file(db_file)
+    assert (tmp_path / "html" / "stats_cpu.html").exists()
+    assert (tmp_path / "html" / "stats_process.html").exists()
@@ -0,0 +1,67 @@
+"""Tests the fixed-rate scheduler"""
+
+import pytest
+
+from rmon.scheduler import FixedRateScheduler
+
+
+class FakeClock:
+    """Clock that only advances when told to."""
+
+    def __init__(self) -> None:
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        """Advance the clock."""
+        self.now += seconds
+
+
+def test_scheduler_no_drift():
+    """Test that the time spent collecting does not delay later ticks."""
+    clock = FakeClock()
+    scheduler = FixedRateScheduler(0.1, clock=clock, sleep=clock.sleep)
+    tick_times = []
+    for _ in range(10):
+        assert scheduler.is_tick_due()
+        tick_times.append(clock.now)
+        scheduler.start_tick()
+        clock.sleep(0.03)
+        scheduler.complete_tick()
+        scheduler.wait_for_next_tick()
+
+    assert tick_times == pytest.approx([100.0 + i * 0.1 for i in range(10)])
+    assert scheduler.num_overruns == 0
+    assert scheduler.num_missed_ticks == 0
+    assert scheduler.get_stats()["max_tick_duration"] == pytest.approx(0.03)
+
+
+def test_scheduler_overruns():
+    """Test the accounting of overruns and missed ticks."""
+    clock = FakeClock()
+    scheduler = FixedRateScheduler(1.0, clock=clock, sleep=clock.sleep)
+
+    # A slow tick that finishes after the next deadline: the next tick runs immediately.
+    clock.sleep(1.5)
+    scheduler.complete_tick()
+    assert scheduler.num_overruns == 1
+    assert scheduler.num_missed_ticks == 0
+    assert scheduler.is_tick_due()
+
+    # A tick that runs through three more deadlines: two are skipped.
+    clock.sleep(3.2)
+    scheduler.complete_tick()
+    assert scheduler.num_overruns == 2
+    assert scheduler.num_missed_ticks == 2
+    assert scheduler.time_until_next_tick() == 0.0
+    scheduler.complete_tick()
+    assert scheduler.time_until_next_tick() == pytest.approx(0.3)
+    assert scheduler.num_ticks == 3
+
+
+def test_scheduler_invalid_interval():
+    """Test that intervals below the minimum are rejected."""
+    with pytest.raises(ValueError):
+        FixedRateScheduler(0.01)
@@ -0,0 +1,72 @@
+"""Tests the quantile sketches"""
+
+import json
+import random
+
+import pytest
+
+from rmon.sketches import DDSketch
+
+
+def _get_exact_quantile(values: list[float], quantile: float) -> float:
+    return sorted(values)[int(quantile * (len(values) - 1))]
+
+
+def test_ddsketch_accuracy():
+    """Test that quantiles are within the relative accuracy."""
+    rng = random.Random(0)
+    values = [rng.lognormvariate(3, 2) for _ in range(10_000)] + [0.0] * 100
+    values += [-rng.uniform(1, 10) for _ in range(100)]
+    sketch = DDSketch(relative_accuracy=0.01)
+    for val in values:
+        sketch.add(val)
+
+    assert sketch.count == len(values)
+    for quantile in (0, 0.01, 0.25, 0.5, 0.95, 0.99, 1):
+        expected = _get_exact_quantile(values, quantile)
+        assert sketch.get_quantile(quantile) == pytest.approx(expected, rel=0.01)
+    assert DDSketch().get_quantile(0.5) is None
+
+
+def test_ddsketch_merge_and_serialize():
+    """Test that merged and deserialized sketches match a sketch of all values."""
+    rng = random.Random(1)
+    values = [rng.uniform(0, 100) for _ in range(1000)]
+    full = DDSketch()
+    parts = [DDSketch(), DDSketch()]
+    for i, val in enumerate(values):
+        full.add(val)
+        parts[i % 2].add(val)
+
+    merged = DDSketch.from_dict(json.loads(json.dumps(parts[0].to_dict())))
+    merged.merge(parts[1])
+    assert merged.to_dict() == full.to_dict()
+    with pytest.raises(ValueError):
+        merged.merge(DDSketch(relative_accuracy=0.05))
+
+
+def test_ddsketch_max_num_bins():
+    """Test that the number of bins is bounded."""
+    sketch = DDSketch(relative_accuracy=0.01, max_num_bins=100)
+    values = [1.1**x for x in range(1000)]
+    for val in values:
+        sketch.add(val)
+    assert len(sketch.to_dict()["positive"]) == 100
+    # High quantiles are unaffected by collapsing the lowest bins.
+    assert sketch.get_quantile(0.99) == pytest.approx(_get_exact_quantile(values, 0.99), rel=0.01)
+
+
+def test_ddsketch_max_num_bins_mixed_signs():
+    """Test that collapsing the negative bins only affects the most negative values."""
+    rng = random.Random(2)
+    values = [-(1.05**x) for x in range(300)] + [rng.uniform(1, 2) for _ in range(1000)]
+    rng.shuffle(values)
+    sketch = DDSketch(relative_accuracy=0.01, max_num_bins=100)
+    for val in values:
+        sketch.add(val)
+    assert len(sketch.to_dict()["negative"]) == 100
+    # The negative values nearest zero and all higher quantiles keep their accuracy.
+    for quantile in (0.2, 0.23, 0.5, 0.99):
+        expected = _get_exact_quantile(values, quantile)
+        assert sketch.get_quantile(quantile) == pytest.approx(expected, rel=0.01)
+    assert sketch.get_quantile(0) == min(values)
@@ -0,0 +1,95 @@
+"""Tests the SQLite utilities"""
+
+from array import array
+
+import pytest
+
+from rmon.models import ComputeNodeResourceStatConfig, ResourceType
+from rmon.resource_stat_collector import ResourceStatCollector
+from rmon.resource_stat_store import ResourceStatStore
+from rmon.utils.sql import (
+    insert_rows,
+    iter_table_chunks,
+    make_table,
+    read_columns,
+    read_columns_by_key,
+)
+
+
+def _to_list(values) -> list:
+    return values if isinstance(values, list) else values.tolist()
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    """Return a database with 10 rows in the cpu table and 20 in the process table."""
+    collector = ResourceStatCollector()
+    initial_stats = collector.get_stats(ComputeNodeResourceStatConfig.all_enabled(), pids={})
+    collector.shutdown()
+    config = ComputeNodeResourceStatConfig(cpu=True, memory=False, process=True)
+    db_file = tmp_path / "stats.sqlite"
+    store = ResourceStatStore(config, db_file, initial_stats)
+    for i in range(10):
+        stats = {
+            ResourceType.CPU: {**initial_stats[ResourceType.CPU], "cpu_percent": float(i)},
+            ResourceType.PROCESS: {
+                "b": {"cpu_percent": float(i), "rss": i},
+                "a": {"cpu_percent": 2.0 * i, "rss": 2 * i},
+            },
+        }
+        store.record_stats(stats, timestamps={ResourceType.CPU: 1000.0 + i})
+    store.close()
+    return db_file
+
+
+def test_read_columns(db_file):
+    """Test the types of the columns, the filters, and the time range."""
+    table = read_columns(db_file, "cpu", columns=["timestamp", "cpu_percent"], chunk_size=3)
+    assert list(table) == ["timestamp", "cpu_percent"]
+    assert _to_list(table["timestamp"]) == [1000.0 + i for i in range(10)]
+    assert _to_list(table["cpu_percent"]) == [float(i) for i in range(10)]
+    assert isinstance(table["cpu_percent"], array) or hasattr(table["cpu_percent"], "dtype")
+
+    table = read_columns(db_file, "cpu", columns=["cpu_percent"], start=1002, end=1005.0)
+    assert _to_list(table["cpu_percent"]) == [2.0, 3.0, 4.0]
+
+    table = read_columns(db_file, "process", columns=["id", "rss"], filters={"id": "a"})
+    assert table["id"] == ["a"] * 10
+    assert _to_list(table["rss"]) == [2 * i for i in range(10)]
+    # The num_threads column was not recorded.
+    assert read_columns(db_file, "process", columns=["num_threads"])["num_threads"] == [None] * 20
+    assert not read_columns(db_file, "process", filters={"id": "c"})["id"]
+
+    chunks = list(iter_table_chunks(db_file, "process", columns=["id"], chunk_size=8))
+    assert [len(x["id"]) for x in chunks] == [8, 8, 4]
+    with pytest.raises(ValueError):
+        read_columns(db_file, "cpu", columns=["cpu_percent; DROP TABLE cpu"])
+
+
+def test_read_columns_by_key(db_file, tmp_path):
+    """Test partitioning by key in one pass, for both schema versions."""
+    tables = read_columns_by_key(db_file, "process", columns=["rss"], chunk_size=3)
+    assert list(tables) == ["b", "a"]
+    assert _to_list(tables["a"]["rss"]) == [2 * i for i in range(10)]
+    assert _to_list(tables["b"]["rss"]) == list(range(10))
+
+    old_db_file = tmp_path / "old.sqlite"
+    row = {"timestamp": "", "id": "", "rss": 0}
+    make_table(old_db_file, "process", row)
+    insert_rows(
+        old_db_file,
+        "process",
+        [
+            ("2024-01-01 00:00:00", "b", 1),
+            ("2024-01-01 00:00:00", "a", 2),
+            ("2024-01-01 00:00:01.5", "b", 3),
+            ("2024-01-01 00:00:01.5", "a", 4),
+        ],
+    )
+    tables = read_columns_by_key(old_db_file, "process", chunk_size=3)
+    assert sorted(tables) == ["a", "b"]
+    assert _to_list(tables["a"]["rss"]) == [2, 4]
+    timestamps = _to_list(tables["b"]["timestamp"])
+    assert timestamps[1] - timestamps[0] == 1.5
+    tables = read_columns_by_key(old_db_file, "process", start=timestamps[1])
+    assert _to_list(tables["b"]["rss"]) == [3]